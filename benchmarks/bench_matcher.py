@@ -0,0 +1,344 @@
+"""Benchmarks of the sampling matcher on synthetic cohorts.
+
+Every benchmark runs for a fixed amount of time on cohorts of different sizes and
+availability densities and reports the throughput together with the quality of
+the result, so that runs from different commits can be compared::
+
+    python benchmarks/bench_matcher.py -o before.json
+    git checkout ...
+    python benchmarks/bench_matcher.py -o after.json --compare before.json
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import importlib.metadata
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+import click
+import numpy as np
+
+# Caps the number of trials of `pair_up`, which would make the benchmark useless
+os.environ.pop("MEETUPMATCHER_TESTING", None)
+
+from meetupmatcher.bitset import PackedAvailabilities  # noqa: E402
+from meetupmatcher.matcher import (  # noqa: E402
+    DEFAULT_WEIGHTS,
+    CostEncoder,
+    NoSolution,
+    ProblemStatement,
+    SearchState,
+    _pair_up,
+    pair_up,
+    sample,
+    sample_packed,
+    solve_numeric,
+)
+from meetupmatcher.util.log import logger  # noqa: E402
+
+#: Incremented whenever the format of the output changes
+RESULTS_VERSION = 1
+
+DEFAULT_SIZES = (50, 200, 1000, 5000)
+DEFAULT_DENSITIES = (0.2, 0.5, 0.8)
+
+
+@dataclasses.dataclass(frozen=True)
+class Cohort:
+    """Synthetic participants"""
+
+    idx: np.ndarray
+    notwo: np.ndarray
+    availabilities: np.ndarray
+    #: Fraction of time slots every person is available for
+    density: float
+
+    @property
+    def name(self) -> str:
+        return f"n={len(self.idx)},density={self.density}"
+
+
+def synthetic_cohort(
+    n_people: int,
+    density: float,
+    *,
+    n_timeslots: int = 10,
+    notwo_fraction: float = 0.2,
+    seed: int = 0,
+) -> Cohort:
+    """Random availabilities, where every person is available for every time slot
+    with probability `density` (but at least for one time slot).
+    """
+    rng = np.random.default_rng(seed)
+    availabilities = rng.random((n_people, n_timeslots)) < density
+    empty = ~availabilities.any(axis=1)
+    availabilities[empty, rng.integers(n_timeslots, size=empty.sum())] = True
+    return Cohort(
+        idx=np.arange(n_people),
+        notwo=rng.random(n_people) < notwo_fraction,
+        availabilities=availabilities,
+        density=density,
+    )
+
+
+def _cost(cost: np.ndarray | None) -> list[int] | None:
+    return None if cost is None else [int(c) for c in cost]
+
+
+def bench_sample(cohort: Cohort, duration: float, *, packed: bool) -> dict:
+    """Draw single groups of three from everyone"""
+    rng = np.random.default_rng(0)
+    mask = np.full(len(cohort.idx), True)
+    weights = dataclasses.asdict(DEFAULT_WEIGHTS)
+    if packed:
+        availabilities = PackedAvailabilities.from_bool(cohort.availabilities)
+    n_calls = 0
+    start = timeit.default_timer()
+    deadline = start + duration
+    while timeit.default_timer() < deadline:
+        if packed:
+            sample_packed(mask, 3, availabilities, rng=rng, **weights)
+        else:
+            sample(mask, 3, cohort.availabilities, rng=rng, **weights)
+        n_calls += 1
+    elapsed = timeit.default_timer() - start
+    return {"calls": n_calls, "seconds": elapsed, "calls_per_second": n_calls / elapsed}
+
+
+def bench_single_trials(cohort: Cohort, duration: float) -> dict:
+    """Run `_pair_up` repeatedly, keeping track of the best cost like `pair_up`
+    does (so that most trials are aborted early). Trials that are built to the end
+    count as complete.
+    """
+    rng = np.random.default_rng(0)
+    sn = solve_numeric(ProblemStatement(len(cohort.idx), int(cohort.notwo.sum())))
+    packed = PackedAvailabilities.from_bool(cohort.availabilities)
+    best_cost = np.zeros(packed.counts.max() + 1, dtype=int)
+    best_cost[0] = sn.n_people
+    encoder = CostEncoder(len(best_cost), sn.n_people)
+    n_tries = n_complete = 0
+    time_to_best = None
+    start = timeit.default_timer()
+    deadline = start + duration
+    while timeit.default_timer() < deadline:
+        n_tries += 1
+        try:
+            result = _pair_up(
+                sn,
+                cohort.idx,
+                cohort.notwo,
+                best_cost,
+                packed,
+                rng=rng,
+                encoder=encoder,
+            )
+        except NoSolution:
+            # Somebody shares no availabilities with the rest of their group
+            continue
+        if result is None:
+            continue
+        n_complete += 1
+        if encoder.encode(result.cost) < encoder.encode(best_cost):
+            best_cost = result.cost
+            time_to_best = timeit.default_timer() - start
+    elapsed = timeit.default_timer() - start
+    return {
+        "trials": n_tries,
+        "seconds": elapsed,
+        "trials_per_second": n_tries / elapsed,
+        "complete_rate": n_complete / n_tries,
+        "time_to_best": time_to_best,
+        "final_cost": _cost(best_cost),
+    }
+
+
+def bench_pair_up(cohort: Cohort, duration: float, **options) -> dict:
+    """Run `pair_up` with a time budget"""
+    sn = solve_numeric(ProblemStatement(len(cohort.idx), int(cohort.notwo.sum())))
+    improvements: list[float] = []
+    # The final checkpoint tells us how many trials were run
+    states: list[SearchState] = []
+    start = timeit.default_timer()
+    result, statistics = pair_up(
+        sn,
+        cohort.idx,
+        cohort.notwo,
+        cohort.availabilities,
+        rng=np.random.default_rng(0),
+        time_budget=duration,
+        abort_after_stable=sys.maxsize,
+        callback=lambda _: improvements.append(timeit.default_timer() - start),
+        on_checkpoint=states.append,
+        checkpoint_interval=float("inf"),
+        **options,
+    )
+    elapsed = timeit.default_timer() - start
+    n_tries = states[-1].n_tries
+    return {
+        "trials": n_tries,
+        "seconds": elapsed,
+        "trials_per_second": n_tries / elapsed,
+        "complete_rate": len(statistics.df) / n_tries,
+        "time_to_best": improvements[-1] if improvements else None,
+        "n_improvements": len(improvements),
+        "final_cost": _cost(result.cost),
+    }
+
+
+def _package_version() -> str | None:
+    try:
+        return importlib.metadata.version("meetup_matcher")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    sizes: tuple[int, ...], densities: tuple[float, ...], duration: float, jobs: int
+) -> dict:
+    """Run all benchmarks and collect the results together with information about
+    the environment
+    """
+    results = []
+    for n_people in sizes:
+        for density in densities:
+            cohort = synthetic_cohort(n_people, density)
+            benchmarks = {
+                "sample": lambda c=cohort: bench_sample(c, duration, packed=False),
+                "sample_packed": lambda c=cohort: bench_sample(
+                    c, duration, packed=True
+                ),
+                "_pair_up": lambda c=cohort: bench_single_trials(c, duration),
+                "pair_up": lambda c=cohort: bench_pair_up(c, duration),
+            }
+            if jobs > 1:
+                benchmarks[f"pair_up[workers={jobs}]"] = lambda c=cohort: bench_pair_up(
+                    c, duration, workers=jobs
+                )
+            for name, benchmark in benchmarks.items():
+                click.echo(f"{name} {cohort.name}", err=True)
+                results.append(
+                    {
+                        "benchmark": name,
+                        "n_people": n_people,
+                        "density": density,
+                        **benchmark(),
+                    }
+                )
+    return {
+        "version": RESULTS_VERSION,
+        "meetupmatcher": _package_version(),
+        "commit": _git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "duration": duration,
+        "results": results,
+    }
+
+
+#: Metrics that are compared with `--compare` (higher is better)
+_THROUGHPUT = ("calls_per_second", "trials_per_second")
+
+
+def compare(old: dict, new: dict) -> list[str]:
+    """One line for every benchmark that is in both results: throughput of the new
+    relative to the old run and the final costs
+    """
+    key = ("benchmark", "n_people", "density")
+    previous = {tuple(r[k] for k in key): r for r in old["results"]}
+    lines = []
+    for r in new["results"]:
+        o = previous.get(tuple(r[k] for k in key))
+        if o is None:
+            continue
+        line = f"{r['benchmark']:<24} n={r['n_people']:<5} density={r['density']:<4}"
+        for metric in _THROUGHPUT:
+            if metric in r and o.get(metric):
+                line += f" {metric}: {r[metric] / o[metric]:6.2f}x"
+        if "final_cost" in r:
+            line += f" cost: {o.get('final_cost')} -> {r['final_cost']}"
+        lines.append(line)
+    return lines
+
+
+def _floats(value: str) -> tuple[float, ...]:
+    return tuple(float(v) for v in value.split(","))
+
+
+@click.command()
+@click.option("-o", "--output", help="Write results to this JSON file")
+@click.option(
+    "--sizes",
+    default=",".join(map(str, DEFAULT_SIZES)),
+    show_default=True,
+    help="Comma separated numbers of people",
+)
+@click.option(
+    "--densities",
+    default=",".join(map(str, DEFAULT_DENSITIES)),
+    show_default=True,
+    help="Comma separated fractions of time slots that people are available for",
+)
+@click.option(
+    "--duration",
+    type=float,
+    default=5.0,
+    show_default=True,
+    help="Seconds per benchmark and cohort. Parallel runs of pair_up can take "
+    "longer, because workers finish their current batch of trials.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Also benchmark pair_up with this many worker processes",
+)
+@click.option("--compare", "compare_to", help="Compare with results from this file")
+def main(
+    output: str | None,
+    sizes: str,
+    densities: str,
+    duration: float,
+    jobs: int,
+    compare_to: str | None,
+) -> None:
+    logger.setLevel(logging.WARNING)
+    results = run_benchmarks(
+        tuple(int(s) for s in _floats(sizes)), _floats(densities), duration, jobs
+    )
+    text = json.dumps(results, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+    else:
+        click.echo(text)
+    if compare_to:
+        for line in compare(json.loads(Path(compare_to).read_text()), results):
+            click.echo(line, err=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import math
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from meetupmatcher.bitset import PackedAvailabilities, pack
+from meetupmatcher.matcher import (
+    MatchingStrategy,
+    NoSolution,
+    PairUpResult,
+    PairUpStatistics,
+    SolutionNumbers,
+    register_strategy,
+)
+from meetupmatcher.util.log import logger
+
+#: Number of random numbers that are drawn at once
+_CHUNK_SIZE = 4096
+
+
+def _popcount(bitset: int) -> int:
+    return bin(bitset).count("1")
+
+
+def _joint(bits: list[int], members: list[int]) -> int:
+    joint = bits[members[0]]
+    for p in members[1:]:
+        joint &= bits[p]
+    return joint
+
+
+def _initial_assignment(
+    sn: SolutionNumbers, notwo: np.ndarray, rng: np.random.Generator
+) -> tuple[list[list[int]], list[int]]:
+    """Random assignment of people to groups that respects the two-person veto.
+
+    Returns:
+        Groups as lists of positions, removed positions
+    """
+    order = rng.permutation(len(notwo))
+    # People with a veto go first, so that they end up in the large groups
+    queue = [p for p in order if notwo[p]] + [p for p in order if not notwo[p]]
+    sizes = [i + 2 for i, n_groups in enumerate(sn.partitions) for _ in range(n_groups)]
+    groups = []
+    for size in sorted(sizes, reverse=True):
+        groups.append(queue[:size])
+        queue = queue[size:]
+    if any(len(g) == 2 and notwo[g].any() for g in groups):
+        raise NoSolution("Too many people veto groups of two")
+    return groups, queue
+
+
+class _Annealer:
+    """Mutable state of the simulated annealing, see `anneal`"""
+
+    def __init__(
+        self,
+        groups: list[list[int]],
+        removed: list[int],
+        notwo: np.ndarray,
+        availabilities: np.ndarray,
+        energy_base: float,
+    ):
+        n_people, n_timeslots = availabilities.shape
+        words = pack(availabilities)
+        self.bits = [
+            sum(int(word) << (64 * i) for i, word in enumerate(row)) for row in words
+        ]
+        self.notwo = notwo.tolist()
+        #: Members of every group. The removed people are the last "group".
+        self.members = groups + [removed]
+        self.removed = len(groups)
+        #: Index of the group of every person
+        self.group_of = [0] * n_people
+        for i_group, members in enumerate(self.members):
+            for p in members:
+                self.group_of[p] = i_group
+        self.counts = [_popcount(_joint(self.bits, g)) for g in groups]
+        max_count = max(self.counts + [int(availabilities.sum(axis=1).max())])
+        # With hundreds of timeslots, the penalties would overflow. Only the lowest
+        # counts (which come first in the lexicographic order) are told apart then.
+        max_exponent = min(
+            max_count, int(math.log(sys.float_info.max / 1e6, energy_base))
+        )
+        #: Contribution of a group with a given number of joint availabilities to
+        #: the energy. Decreases exponentially to mimic the lexicographic order.
+        self.penalty = [
+            energy_base ** max(max_exponent - j, 0) for j in range(max_count + 1)
+        ]
+        #: Histogram of the number of joint availabilities = cost function
+        self.cost = [0] * (max_count + 1)
+        self.cost[0] += len(removed)
+        for count in self.counts:
+            self.cost[count] += 1
+
+    def propose(self, a: int, b: int, move: bool) -> tuple[int, int, int, int] | None:
+        """Evaluate swapping person a with person b, or, if `move` is set, moving a
+        to the group of b.
+
+        Returns:
+            None if the proposal is invalid, else group of a, group of b, and the
+            new number of joint availabilities of these groups
+        """
+        ga, gb = self.group_of[a], self.group_of[b]
+        if ga == gb:
+            return None
+        members_a, members_b = self.members[ga], self.members[gb]
+        if move:
+            if ga == self.removed or gb == self.removed:
+                return None
+            if len(members_a) != len(members_b) + 1:
+                return None
+            new_a = [p for p in members_a if p != a]
+            new_b = members_b + [a]
+        else:
+            new_a = [b if p == a else p for p in members_a]
+            new_b = [a if p == b else p for p in members_b]
+        count_a = count_b = 0
+        if ga != self.removed:
+            if len(new_a) == 2 and (self.notwo[new_a[0]] or self.notwo[new_a[1]]):
+                return None
+            count_a = _popcount(_joint(self.bits, new_a))
+        if gb != self.removed:
+            if len(new_b) == 2 and (self.notwo[new_b[0]] or self.notwo[new_b[1]]):
+                return None
+            count_b = _popcount(_joint(self.bits, new_b))
+        return ga, gb, count_a, count_b
+
+    def delta(self, ga: int, gb: int, count_a: int, count_b: int) -> float:
+        """Change of the energy"""
+        # Change of the histogram first: Penalties of very different size can't
+        # be added up without losing the small ones, so terms that cancel have to
+        # be removed before.
+        change: dict[int, int] = {}
+        for g, count in ((ga, count_a), (gb, count_b)):
+            if g != self.removed:
+                change[count] = change.get(count, 0) + 1
+                change[self.counts[g]] = change.get(self.counts[g], 0) - 1
+        return sum(n * self.penalty[count] for count, n in change.items() if n)
+
+    def apply(
+        self, a: int, b: int, move: bool, ga: int, gb: int, count_a: int, count_b: int
+    ) -> None:
+        if move:
+            self.members[ga].remove(a)
+            self.members[gb].append(a)
+            self.group_of[a] = gb
+        else:
+            self.members[ga][self.members[ga].index(a)] = b
+            self.members[gb][self.members[gb].index(b)] = a
+            self.group_of[a], self.group_of[b] = gb, ga
+        for g, count in ((ga, count_a), (gb, count_b)):
+            if g == self.removed:
+                continue
+            self.cost[self.counts[g]] -= 1
+            self.cost[count] += 1
+            self.counts[g] = count
+
+
+def anneal(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
+    *,
+    rng: np.random.Generator | None = None,
+    n_steps=300_000,
+    energy_base=4.0,
+    initial_temperature: float | None = None,
+    final_temperature_ratio=1e-3,
+    move_probability=0.2,
+    time_budget: float | None = None,
+) -> tuple[PairUpResult, PairUpStatistics]:
+    """Pair up people by simulated annealing.
+
+    Starting from a random assignment, we repeatedly propose to swap two people
+    of different groups (or a member of a group with a removed person) or to move
+    a person from a group to a group that is smaller by one person (so that the
+    number of groups of each size stays the same). Only the joint availabilities of
+    the two affected groups are recomputed. The energy is the sum of
+    ``energy_base ** (max_availability - n_joint_availabilities)`` over all groups,
+    which approximates the lexicographic order of the cost function. The best
+    solution is tracked with respect to the exact lexicographic order.
+
+    Args:
+        sn: SolutionNumbers, specifying the number of groups of each size
+        idx: Indices of people to be paired up
+        notwo: Boolean array: Who vetoes to be in a group of only two-people
+        availabilities: Boolean array of n_people x n_timeslots (or packed into
+            bitsets)
+        rng: Random number generator
+        n_steps: Number of proposed changes
+        energy_base: See above
+        initial_temperature: If None, estimated from the energy changes of random
+            proposals
+        final_temperature_ratio: Ratio of final and initial temperature (the
+            temperature decreases geometrically)
+        move_probability: Fraction of proposals that are moves rather than swaps
+        time_budget: Stop after this many seconds and return the best solution so
+            far
+
+    Returns:
+        PairUpResult, PairUpStatistics
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if notwo is None:
+        notwo = np.full(len(idx), False)
+    if availabilities is None:
+        availabilities = np.full((len(idx), 1), True)
+    if isinstance(availabilities, PackedAvailabilities):
+        availabilities = availabilities.to_bool()
+    if os.environ.get("MEETUPMATCHER_TESTING"):
+        n_steps = min(n_steps, 1000)
+    n_people = len(idx)
+    assert sn.n_people == n_people == len(notwo)
+    groups, removed = _initial_assignment(sn, notwo, rng)
+    state = _Annealer(groups, removed, notwo, availabilities, energy_base)
+    if n_people < 2 or len(state.counts) < 1:
+        raise NoSolution("Nothing to optimize")
+
+    def draw(size: int) -> tuple[list[int], list[int], list[float], list[float]]:
+        return (
+            rng.integers(0, n_people, size).tolist(),
+            rng.integers(0, n_people, size).tolist(),
+            rng.random(size).tolist(),
+            rng.random(size).tolist(),
+        )
+
+    if initial_temperature is None:
+        deltas = []
+        for a, b, _, _ in zip(*draw(200)):
+            proposal = state.propose(a, b, False)
+            if proposal is not None:
+                deltas.append(abs(state.delta(*proposal)))
+        initial_temperature = float(np.mean([d for d in deltas if d > 0] or [1.0]))
+    temperature = initial_temperature
+    cooling = final_temperature_ratio ** (1 / max(n_steps, 1))
+
+    best_cost = list(state.cost)
+    best_members = [list(m) for m in state.members]
+    history = [list(best_cost)]
+    n_accepted = 0
+    t = timeit.default_timer()
+    for start in range(0, n_steps, _CHUNK_SIZE):
+        if time_budget is not None and timeit.default_timer() - t > time_budget:
+            logger.info(f"Reached time budget after {start} steps")
+            break
+        for a, b, u_move, u_accept in zip(*draw(min(_CHUNK_SIZE, n_steps - start))):
+            temperature *= cooling
+            move = u_move < move_probability
+            proposal = state.propose(a, b, move)
+            if proposal is None:
+                continue
+            delta = state.delta(*proposal)
+            if delta > 0 and u_accept >= math.exp(-delta / temperature):
+                continue
+            state.apply(a, b, move, *proposal)
+            n_accepted += 1
+            if state.cost < best_cost:
+                best_cost = list(state.cost)
+                best_members = [list(m) for m in state.members]
+                history.append(list(best_cost))
+    elapsed = timeit.default_timer() - t
+    logger.info(
+        f"Annealed for {elapsed:,} seconds ({n_accepted} of {n_steps} "
+        f"changes accepted)."
+    )
+    segmentation = best_members[:-1]
+    result = PairUpResult(
+        [set(idx[g]) for g in segmentation],
+        set(idx[best_members[-1]]),
+        cost=np.array(best_cost),
+        joint_availabilities=np.array(
+            [np.all(availabilities[g], axis=0) for g in segmentation]
+        ),
+    )
+    return result, PairUpStatistics(
+        pd.DataFrame(history),
+        best=result.cost,
+        solution_pair_avs=result.joint_availabilities,
+    )
+
+
+@register_strategy
+class AnnealingStrategy(MatchingStrategy):
+    """Simulated annealing, see `anneal`"""
+
+    name = "annealing"
+
+    def __init__(self, **options):
+        """
+
+        Args:
+            **options: Passed on to `anneal`
+        """
+        self.options = options
+
+    def run(
+        self,
+        sn: SolutionNumbers,
+        idx: np.ndarray,
+        notwo: np.ndarray | None = None,
+        availabilities: np.ndarray | PackedAvailabilities | None = None,
+        *,
+        rng: np.random.Generator | None = None,
+    ) -> tuple[PairUpResult, PairUpStatistics]:
+        return anneal(sn, idx, notwo, availabilities, rng=rng, **self.options)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from meetupmatcher.precompute import PairIndex
+
+#: Number of timeslots that fit into one word
+WORD_SIZE = 64
+
+#: Bitsets with at most this many bits are counted with a single table lookup
+SHORT_SIZE = 16
+
+_SHORT_POPCOUNT = np.array(
+    [bin(i).count("1") for i in range(2**SHORT_SIZE)], dtype=np.int64
+)
+_BYTE_POPCOUNT = _SHORT_POPCOUNT[:256]
+# numpy >= 2.0
+_bitwise_count = getattr(np, "bitwise_count", None)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Number of set bits of bitsets given as uint64 words. The last axis is
+    interpreted as the words of a single bitset and summed over.
+    """
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    if _bitwise_count is not None:
+        return _bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(*words.shape[:-1], 8 * words.shape[-1])
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1)
+
+
+def pack(availabilities: np.ndarray) -> np.ndarray:
+    """Pack a boolean array of n_people x n_timeslots into an array of
+    n_people x n_words uint64 words. Bit ``k`` of the bitset is timeslot ``k``.
+    """
+    availabilities = np.asarray(availabilities).astype(bool)
+    n_people, n_timeslots = availabilities.shape
+    n_words = max(1, -(-n_timeslots // WORD_SIZE))
+    padded = np.zeros((n_people, n_words * WORD_SIZE), dtype=bool)
+    padded[:, :n_timeslots] = availabilities
+    as_bytes = np.packbits(padded, axis=1, bitorder="little")
+    return np.ascontiguousarray(as_bytes).view("<u8").astype(np.uint64)
+
+
+def unpack(words: np.ndarray, n_timeslots: int) -> np.ndarray:
+    """Inverse of `pack`. Works for a single bitset (1D) and for an array of
+    bitsets (2D).
+    """
+    words = np.ascontiguousarray(words, dtype="<u8")
+    as_bytes = words.view(np.uint8).reshape(*words.shape[:-1], -1)
+    bits = np.unpackbits(as_bytes, axis=-1, bitorder="little")
+    return bits[..., :n_timeslots].astype(bool)
+
+
+@dataclass
+class PackedAvailabilities:
+    """Availabilities of all people packed into integer bitsets"""
+
+    #: Array of n_people x n_words uint64 words
+    words: np.ndarray
+    #: Number of timeslots (i.e., number of valid bits per bitset)
+    n_timeslots: int
+    #: Number of availabilities per person
+    counts: np.ndarray = field(init=False, repr=False)
+    #: If all bitsets fit into `SHORT_SIZE` bits, the bitsets as plain integers
+    _short: np.ndarray | None = field(init=False, repr=False)
+    #: Pairwise joint availabilities. Optional, set it to speed up sampling.
+    pairs: PairIndex | None = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        assert self.words.ndim == 2
+        assert self.words.dtype == np.uint64
+        self.counts = popcount(self.words)
+        self._short = None
+        if self.n_timeslots <= SHORT_SIZE:
+            self._short = self.words[:, 0].astype(np.intp)
+
+    @classmethod
+    def from_bool(cls, availabilities: np.ndarray) -> PackedAvailabilities:
+        """Build from a boolean array of n_people x n_timeslots"""
+        return cls(pack(availabilities), n_timeslots=availabilities.shape[1])
+
+    def to_bool(self) -> np.ndarray:
+        """Boolean array of n_people x n_timeslots"""
+        return unpack(self.words, self.n_timeslots)
+
+    def overlap_counts(self, bitset: np.ndarray) -> np.ndarray:
+        """Number of joint availabilities of every person with a bitset. If an
+        array of bitsets (n_bitsets x n_words) is given, returns an array of
+        n_bitsets x n_people.
+        """
+        if self._short is not None:
+            if bitset.ndim == 1:
+                return _SHORT_POPCOUNT[self._short & int(bitset[0])]
+            return _SHORT_POPCOUNT[self._short & bitset[:, :1].astype(np.intp)]
+        return popcount(self.words & bitset[..., None, :])
+
+    def overlap_counts_of(self, bitset: np.ndarray, people: np.ndarray) -> np.ndarray:
+        """Same as `overlap_counts` for a single bitset, but only for some people"""
+        if self._short is not None:
+            return _SHORT_POPCOUNT[self._short[people] & int(bitset[0])]
+        return popcount(self.words[people] & bitset)
+
+    def joint(self, idxs) -> np.ndarray:
+        """Joint availability of a group of people as a bitset"""
+        return np.bitwise_and.reduce(self.words[list(idxs)], axis=0)
+
+    def __len__(self) -> int:
+        return len(self.words)
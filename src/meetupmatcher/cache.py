@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+
+from meetupmatcher.bitset import PackedAvailabilities
+from meetupmatcher.config import Config
+from meetupmatcher.data import ParticipantStore, People, read_signups
+from meetupmatcher.util.log import logger
+
+#: Incremented whenever the format of the cache or the preparation of the
+#: participant table changes
+CACHE_VERSION = 2
+
+#: Environment variable that overrides the cache directory
+CACHE_DIR_ENV = "MEETUPMATCHER_CACHE_DIR"
+
+#: Cache entries that weren't used for this many seconds are removed
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+#: If the cache entries take more bytes than this, the least recently used ones
+#: are removed
+CACHE_MAX_BYTES = 512 * 1024**2
+
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def get_cache_dir() -> Path:
+    """Directory of the cache: ``$MEETUPMATCHER_CACHE_DIR`` if set, else
+    ``meetupmatcher`` in ``$XDG_CACHE_HOME`` (default ``~/.cache``).
+    """
+    if CACHE_DIR_ENV in os.environ:
+        return Path(os.environ[CACHE_DIR_ENV])
+    base = os.environ.get("XDG_CACHE_HOME") or Path("~/.cache").expanduser()
+    return Path(base) / "meetupmatcher"
+
+
+def cache_key(path: str | PathLike, config: Config) -> str | None:
+    """Hash of the content of the input file and of the config. None if the input
+    can't be hashed (stdin).
+    """
+    if str(path) == "-":
+        return None
+    h = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    h.update(json.dumps(config.as_dict(), sort_keys=True, default=str).encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _table_to_json(table: np.ndarray) -> list:
+    # The last entry is always NaN (see `meetupmatcher.data._intern`)
+    return table[:-1].tolist()
+
+
+def _table_from_json(values: list) -> np.ndarray:
+    table = np.empty(len(values) + 1, dtype=object)
+    table[:-1] = values
+    table[-1] = np.nan
+    return table
+
+
+def save_store(directory: Path, store: ParticipantStore) -> bool:
+    """Write a participant store to a directory of ``.npy`` files and a
+    ``meta.json`` file. The directory is created atomically.
+
+    Returns:
+        False if the store can't be cached (e.g., because a column holds
+        arbitrary python objects)
+    """
+    arrays = {"ids": store.ids, "notwo": store.notwo}
+    if store.packed is not None:
+        arrays["words"] = store.packed.words
+    for i, col in enumerate(store.columns):
+        if col != "notwo":
+            arrays[f"column{i}"] = store._columns[col]
+    if any(array.dtype == object for array in arrays.values()):
+        logger.debug("Not caching participants: Can't store python objects")
+        return False
+    meta = {
+        "version": CACHE_VERSION,
+        "columns": store.columns,
+        "tables": {col: _table_to_json(t) for col, t in store._tables.items()},
+        "timeslots": store.timeslots,
+        "warnings": store.warnings,
+        "n_timeslots": None if store.packed is None else store.packed.n_timeslots,
+        "index_name": store._index_name,
+    }
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=directory.name, dir=directory.parent))
+    try:
+        for name, array in arrays.items():
+            np.save(tmp / f"{name}.npy", array, allow_pickle=False)
+        (tmp / "meta.json").write_text(json.dumps(meta))
+        os.replace(tmp, directory)
+    except OSError as e:
+        # E.g., another process wrote the same entry in the meantime
+        logger.debug(f"Not caching participants: {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+    return True
+
+
+def load_store(directory: Path) -> ParticipantStore | None:
+    """Read a participant store written by `save_store`. The arrays are memory
+    mapped. Returns None if there is no (valid) cache entry.
+    """
+    try:
+        meta = json.loads((directory / "meta.json").read_text())
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+
+    def load(name: str) -> np.ndarray:
+        return np.load(directory / f"{name}.npy", mmap_mode="r", allow_pickle=False)
+
+    notwo = load("notwo")
+    packed = None
+    if meta["n_timeslots"] is not None:
+        packed = PackedAvailabilities(load("words"), n_timeslots=meta["n_timeslots"])
+    columns = {
+        col: notwo if col == "notwo" else load(f"column{i}")
+        for i, col in enumerate(meta["columns"])
+    }
+    return ParticipantStore(
+        ids=load("ids"),
+        notwo=notwo,
+        packed=packed,
+        timeslots=meta["timeslots"],
+        warnings=meta["warnings"],
+        _columns=columns,
+        _tables={col: _table_from_json(v) for col, v in meta["tables"].items()},
+        _index_name=meta["index_name"],
+    )
+
+
+def _is_entry(path: Path) -> bool:
+    """Whether `path` is an entry written by `save_store` (named by its key)"""
+    return (
+        len(path.name) == 64
+        and all(c in "0123456789abcdef" for c in path.name)
+        and path.is_dir()
+    )
+
+
+def _size(directory: Path) -> int:
+    return sum(f.stat().st_size for f in directory.iterdir() if f.is_file())
+
+
+def prune_cache(
+    directory: Path | None = None,
+    *,
+    max_age: float = CACHE_MAX_AGE,
+    max_bytes: int = CACHE_MAX_BYTES,
+    now: float | None = None,
+) -> list[Path]:
+    """Remove cache entries of participants that weren't used for `max_age`
+    seconds, and then the least recently used ones until all of them take at
+    most `max_bytes` bytes. Other files in the cache directory are kept.
+
+    Returns:
+        Removed entries
+    """
+    if directory is None:
+        directory = get_cache_dir()
+    if not directory.is_dir():
+        return []
+    if now is None:
+        now = time.time()
+    # Most recently used first (the modification time is updated on every use)
+    entries = sorted(
+        (p for p in directory.iterdir() if _is_entry(p)),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    removed = []
+    total = 0
+    for entry in entries:
+        total += _size(entry)
+        if now - entry.stat().st_mtime > max_age or total > max_bytes:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed.append(entry)
+    if removed:
+        logger.debug(f"Removed {len(removed)} old entries from the cache")
+    return removed
+
+
+def load_people(
+    path: str | PathLike, config: Config, *, use_cache: bool = True
+) -> People:
+    """Read and prepare the sign-up table, or load the prepared participants from
+    the cache if neither the input file nor the config changed since the last
+    run.
+
+    Args:
+        path: See `meetupmatcher.data.read_signups`
+        config: Config
+        use_cache: Set to False to neither read from nor write to the cache
+    """
+    key = cache_key(path, config) if use_cache else None
+    if key is None:
+        return People(read_signups(path, config), config=config)
+    directory = get_cache_dir() / key
+    store = load_store(directory)
+    if store is not None:
+        logger.info(f"Loaded {len(store)} people from cache {directory}")
+        # Mark as recently used, see `prune_cache`
+        with contextlib.suppress(OSError):
+            os.utime(directory)
+        return People.from_store(store, config=config)
+    people = People(read_signups(path, config), config=config)
+    if save_store(directory, people.store):
+        logger.debug(f"Cached participants in {directory}")
+        prune_cache()
+    return people
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from pathlib import Path, PurePath
+
+from meetupmatcher.matcher import SearchState
+from meetupmatcher.util.log import logger
+
+#: Incremented whenever the format of checkpoint files changes
+CHECKPOINT_VERSION = 1
+
+
+def _open(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def save_checkpoint(path: str | PurePath, state: SearchState) -> None:
+    """Write the state of a search to a JSON file (gzip compressed if the file name
+    ends with ``.gz``). The file is replaced atomically, so that it is never left
+    half-written if the process is killed.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp" + path.suffix)
+    with _open(tmp_path, "w") as f:
+        json.dump({"version": CHECKPOINT_VERSION, **state.to_dict()}, f)
+    os.replace(tmp_path, path)
+    logger.debug(f"Saved checkpoint after {state.n_tries} tries to {path}")
+
+
+def load_checkpoint(path: str | PurePath) -> SearchState:
+    """Read a file written by `save_checkpoint`"""
+    path = Path(path)
+    with _open(path, "r") as f:
+        data = json.load(f)
+    version = data.pop("version", None)
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(
+            f"Unsupported checkpoint version {version} in {path} (expected "
+            f"{CHECKPOINT_VERSION})"
+        )
+    return SearchState.from_dict(data)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import copy
 from pathlib import Path, PurePath
 
 import yaml
@@ -65,3 +66,7 @@ class Config:
 
     def __iter__(self):
         return iter(self._data)
+
+    def as_dict(self) -> dict:
+        """Copy of the configuration data"""
+        return copy.deepcopy(self._data)
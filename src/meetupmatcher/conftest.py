@@ -1,5 +1,16 @@
 from __future__ import annotations
 
 import os
+from pathlib import Path
+
+import pytest
 
 os.environ["MEETUPMATCHER_TESTING"] = "True"
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch) -> Path:
+    """Don't write to the user's cache directory"""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("MEETUPMATCHER_CACHE_DIR", str(path))
+    return path
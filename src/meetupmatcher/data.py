@@ -1,27 +1,304 @@
 from __future__ import annotations
 
+import functools
 import itertools
+import sys
+from dataclasses import dataclass, field
+from os import PathLike
 
 import numpy as np
 import pandas as pd
 
+from meetupmatcher.bitset import PackedAvailabilities
 from meetupmatcher.config import Config
 from meetupmatcher.util.log import logger
 
+#: Number of rows that are parsed at once by `read_signups`
+CHUNK_SIZE = 10_000
+
+#: Columns of the sign-up table that we know how to use (after renaming)
+_KNOWN_COLUMNS = ("name", "email", "slack", "notwo", "message")
+
+
+def _one_hot_tokens(column: pd.Series) -> tuple[list[str], np.ndarray]:
+    """Split every cell of a column of comma separated values and one-hot encode
+    the values.
+
+    Returns:
+        Sorted list of all values, boolean array of n_rows x n_values
+    """
+    split = column.astype(str).str.split(",")
+    lengths = split.str.len().to_numpy()
+    tokens = pd.Series(list(itertools.chain.from_iterable(split)), dtype=object)
+    codes, values = pd.factorize(tokens.str.strip(), sort=True)
+    one_hot = np.zeros((len(column), len(values)), dtype=bool)
+    one_hot[np.repeat(np.arange(len(column)), lengths), codes] = True
+    keep = values != ""
+    return values[keep].tolist(), one_hot[:, keep]
+
+
+def _intern(values: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Store a column of strings as codes into a table of unique values.
+
+    Returns:
+        codes, table. ``table[codes]`` gives back the values. Missing values have
+        code -1, which points to the last entry of the table (NaN).
+    """
+    codes, uniques = pd.factorize(values)
+    table = np.empty(len(uniques) + 1, dtype=object)
+    table[:-1] = uniques
+    table[-1] = np.nan
+    return codes.astype(np.min_scalar_type(-len(table))), table
+
+
+def _wanted_columns(config: Config) -> set[str]:
+    """Columns of the sign-up table (before renaming) that are used"""
+    renamed = config.get("columns", {})
+    wanted = set(_KNOWN_COLUMNS) | set(renamed.values())
+    wanted |= set(config.get("availabilities", {}).get("columns", []))
+    wanted |= set(config.get("keep_columns", []))
+    return wanted
+
+
+def _dtypes(config: Config) -> dict[str, str]:
+    """Explicit dtypes of the used columns, so that pandas doesn't have to infer
+    them (and doesn't turn e.g. numeric slack ids into floats).
+    """
+    renamed = config.get("columns", {})
+    dtypes = {renamed.get(col, col): "object" for col in _KNOWN_COLUMNS}
+    if "notwo_truthy" not in config:
+        dtypes[renamed.get("notwo", "notwo")] = "boolean"
+    for col in config.get("availabilities", {}).get("columns", []):
+        dtypes[col] = "object"
+    return dtypes
+
+
+def read_signups(
+    path: str | PathLike, config: Config, *, chunk_size: int = CHUNK_SIZE
+) -> pd.DataFrame:
+    """Read the sign-up table in chunks.
+
+    Only the columns that are named in the config (or that have one of the
+    default names) are parsed. Emails are checked for uniqueness while reading,
+    so that a duplicate is reported with its row number.
+
+    Args:
+        path: CSV file (possibly compressed, compression is inferred from the
+            file extension) or ``-`` for stdin
+        config: Config with the ``columns`` and ``availabilities`` mappings.
+            Additional columns that should be available in the templates can be
+            listed under ``keep_columns``.
+        chunk_size: Number of rows that are parsed at once
+
+    Returns:
+        Table with one row per participant
+    """
+    wanted = _wanted_columns(config)
+    email_col = config.get("columns", {}).get("email", "email")
+    source = sys.stdin if str(path) == "-" else path
+    seen: set[str] = set()
+    chunks = []
+    with pd.read_csv(
+        source,
+        usecols=lambda col: col in wanted,
+        dtype=_dtypes(config),
+        chunksize=chunk_size,
+    ) as reader:
+        for chunk in reader:
+            if email_col not in chunk.columns:
+                raise ValueError(f"No email column ({email_col!r}) found")
+            for row, email in zip(chunk.index, chunk[email_col]):
+                if email in seen:
+                    raise ValueError(
+                        f"Email {email} in row {row} appeared before. Do you "
+                        f"have duplicates?"
+                    )
+                seen.add(email)
+            chunks.append(chunk)
+    df = pd.concat(chunks)
+    missing = set(config.get("availabilities", {}).get("columns", [])) - set(df.columns)
+    if missing:
+        raise ValueError(f"Availability columns {sorted(missing)} not found")
+    logger.debug(f"Read {len(df)} rows in {len(chunks)} chunks")
+    return df
+
+
+@dataclass
+class ParticipantStore:
+    """Compact, array-backed representation of all participants.
+
+    Participants are referred to by their position (0, ..., n-1) or by their id
+    (the index of the input table, used in `meetupmatcher.matcher.PairUpResult`).
+    """
+
+    #: Id of every participant
+    ids: np.ndarray
+    #: Boolean array: Who vetoes to be in a group of only two people
+    notwo: np.ndarray
+    #: Availabilities packed into bitsets (None if availabilities weren't polled)
+    packed: PackedAvailabilities | None = None
+    #: Labels of the timeslots of `packed`
+    timeslots: list[str] = field(default_factory=list)
+    #: Problems that were found while preparing the input table
+    warnings: list[str] = field(default_factory=list)
+    #: Other columns of the input. Columns of strings are interned (see `_intern`)
+    #: and stored as codes, other columns are stored as arrays.
+    _columns: dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+    #: Tables of unique values of the interned columns
+    _tables: dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+    #: Name of the index of the input table
+    _index_name: str | None = field(default=None, repr=False)
+
+    @classmethod
+    def from_df(
+        cls,
+        df: pd.DataFrame,
+        availabilities: np.ndarray | None = None,
+        timeslots: list[str] | None = None,
+        warnings: list[str] | None = None,
+    ) -> ParticipantStore:
+        """Build from a table with one row per participant and a `notwo` column"""
+        notwo = df.notwo.to_numpy(dtype=bool)
+        columns = {}
+        tables = {}
+        for col in df.columns:
+            values = df[col]
+            if col == "notwo":
+                columns[col] = notwo
+            elif values.dtype == object:
+                columns[col], tables[col] = _intern(values)
+            else:
+                columns[col] = values.to_numpy()
+        packed = None
+        if availabilities is not None:
+            packed = PackedAvailabilities.from_bool(availabilities)
+        return cls(
+            ids=df.index.to_numpy(),
+            notwo=notwo,
+            packed=packed,
+            timeslots=list(timeslots or []),
+            warnings=list(warnings or []),
+            _columns=columns,
+            _tables=tables,
+            _index_name=df.index.name,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @functools.cached_property
+    def availabilities(self) -> np.ndarray | None:
+        """Boolean array of n_people x n_timeslots (None if availabilities weren't
+        polled)
+        """
+        if self.packed is None:
+            return None
+        return self.packed.to_bool()
+
+    @functools.cached_property
+    def _positions(self) -> dict:
+        return {label: i for i, label in enumerate(self.ids.tolist())}
+
+    def positions(self, ids) -> np.ndarray:
+        """Positions of participants given by their ids"""
+        return np.array([self._positions[label] for label in ids], dtype=np.intp)
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    def column(self, name: str, positions: np.ndarray | None = None) -> np.ndarray:
+        """Values of a column for all participants or the participants at
+        `positions`
+        """
+        values = self._columns[name]
+        if positions is not None:
+            values = values[positions]
+        if name in self._tables:
+            return self._tables[name][values]
+        return values
+
+    def frame(self, positions: np.ndarray | None = None) -> pd.DataFrame:
+        """Table of the participants (or of the participants at `positions`) in the
+        same format as the input.
+        """
+        ids = self.ids if positions is None else self.ids[positions]
+        return pd.DataFrame(
+            {col: self.column(col, positions) for col in self._columns},
+            index=pd.Index(ids, name=self._index_name),
+        )
+
 
 class People:
     required_cols = {"name", "email", "slack", "notwo"}
 
     def __init__(self, df: pd.DataFrame, config: Config):
         self.config = config
+        #: Labels of the columns of `availabilities` (availability column and value)
         self._availability_product_cols: list[str] = []
+        self._availabilities: np.ndarray | None = None
+        #: Problems with the input, see `_warn`
+        self._warnings: list[str] = []
         self._check_df(self._prepare_df(df, config))
-        self.df = df
+        #: All information about the participants
+        self.store = ParticipantStore.from_df(
+            df,
+            availabilities=self._availabilities,
+            timeslots=self._availability_product_cols,
+            warnings=self._warnings,
+        )
+        self._availabilities = None
         logger.info(
-            f"Loaded {len(self.df)} people. {self.df.notwo.sum()} people "
+            f"Loaded {len(self)} people. {self.notwo.sum()} people "
             f"do not want to be in groups of two"
         )
 
+    @classmethod
+    def from_store(cls, store: ParticipantStore, config: Config) -> People:
+        """Build from participants that were already prepared (e.g., loaded from
+        the cache, see `meetupmatcher.cache`). The warnings from preparing them
+        are logged again.
+        """
+        for message in store.warnings:
+            logger.warning(message)
+        people = cls.__new__(cls)
+        people.config = config
+        people._availability_product_cols = list(store.timeslots)
+        people._availabilities = None
+        people.store = store
+        return people
+
+    @functools.cached_property
+    def df(self) -> pd.DataFrame:
+        """Table of all participants. This is built from `store` on the first
+        access, prefer to use `store` directly.
+        """
+        return self.store.frame()
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Id of every participant (index of the input table)"""
+        return self.store.ids
+
+    @property
+    def notwo(self) -> np.ndarray:
+        """Boolean array: Who vetoes to be in a group of only two people"""
+        return self.store.notwo
+
+    @property
+    def availabilities(self) -> np.ndarray | None:
+        """Boolean array of n_people x n_timeslots (None if availabilities were not
+        polled)
+        """
+        return self.store.availabilities
+
+    def _warn(self, message: str) -> None:
+        """Log a problem with the input and keep it in the store, so that it's
+        also shown when the participants are loaded from the cache
+        """
+        logger.warning(message)
+        self._warnings.append(message)
+
     def _prepare_df(self, df: pd.DataFrame, config: Config) -> pd.DataFrame:
         if "columns" in self.config:
             for target, source in self.config["columns"].items():
@@ -29,46 +306,36 @@ class People:
         if "notwo_truthy" in config:
             df.notwo = df.notwo == config["notwo_truthy"]
         if "message" not in df.columns:
-            logger.warning("No message column found.")
+            self._warn("No message column found.")
             df["message"] = ""
         df.message = df.message.fillna("")
         df.message = df.message.str.strip()
         if "name" not in df.columns:
-            logger.warning("No name column found, substituting email")
+            self._warn("No name column found, substituting email")
             df["name"] = df.email.apply(lambda x: x.split("@")[0])
         if "slack" not in df.columns:
-            logger.warning("No slack column found.")
+            self._warn("No slack column found.")
             df["slack"] = ""
         df.slack = df.slack.fillna("")
         if "notwo" not in df.columns:
-            logger.warning("Did not poll for two-person veto.")
+            self._warn("Did not poll for two-person veto.")
             df["notwo"] = False
         else:
             df.notwo = df.notwo.fillna(False)
         availability_cols = config.get("availabilities", {}).get("columns", [])
         if availability_cols:
             logger.debug("Found availability columns: %s", availability_cols)
-            availability_values = set()
+            blocks = []
             for col in availability_cols:
                 df[col] = df[col].fillna("")
-                _vals = (
-                    df[col].apply(lambda x: [a.strip() for a in x.split(",")]).tolist()
+                values, block = _one_hot_tokens(df[col])
+                blocks.append(block)
+                self._availability_product_cols.extend(
+                    f"{col} {value}" for value in values
                 )
-                _vals_merged = list(itertools.chain.from_iterable(_vals))
-                availability_values |= set(_vals_merged)
-            if not availability_values:
+            if not self._availability_product_cols:
                 raise ValueError("Availability columns specified but no values found")
-            logger.debug(
-                "Found availability values: %s", ", ".join(availability_values)
-            )
-            for col in availability_cols:
-                for value in availability_values:
-                    if not value.strip():
-                        continue
-                    col_name = f"{col} {value}"
-                    # todo: This could be done cleaner...
-                    df[col_name] = df[col].str.contains(value)
-                    self._availability_product_cols.append(col_name)
+            self._availabilities = np.hstack(blocks)
             logger.debug(
                 "Availability product columns: %s",
                 ", ".join(self._availability_product_cols),
@@ -80,9 +347,9 @@ class People:
         if not df.email.is_unique:
             raise ValueError("Emails not unique. Do you have duplicates?")
         if not df.slack.replace({"": np.nan}).dropna().is_unique:
-            logger.warning("Not all slacks unique.")
+            self._warn("Not all slacks unique.")
         if not df.name.is_unique:
-            logger.warning("Not all names unique.")
+            self._warn("Not all names unique.")
         if not self.required_cols.issubset(cols):
             raise ValueError(
                 f"Columns appear to be missing. "
@@ -91,4 +358,4 @@ class People:
         assert df.notwo.isin([True, False]).all()
 
     def __len__(self):
-        return len(self.df)
+        return len(self.store)
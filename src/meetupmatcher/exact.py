@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import dataclasses
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from meetupmatcher.annealing import anneal
+from meetupmatcher.bitset import PackedAvailabilities
+from meetupmatcher.matcher import (
+    MatchingStrategy,
+    NoSolution,
+    PairUpResult,
+    PairUpStatistics,
+    SolutionNumbers,
+    register_strategy,
+)
+from meetupmatcher.precompute import PairIndex
+from meetupmatcher.util.log import logger
+
+#: Above this number of people, proving optimality will usually take too long
+RECOMMENDED_MAX_PEOPLE = 60
+
+
+class _TimeLimitReached(Exception):
+    pass
+
+
+@dataclasses.dataclass
+class ExactStatistics(PairUpStatistics):
+    """Statistics of `solve_exact`"""
+
+    #: True if the best solution was proven to be optimal
+    optimal: bool = False
+    #: Objective function value that no solution can beat
+    lower_bound: np.ndarray | None = None
+    #: Number of nodes of the search tree that were visited
+    n_nodes: int = 0
+
+
+def _popcount(bitset: int) -> int:
+    return bin(bitset).count("1")
+
+
+class _BranchAndBound:
+    """State of the search, see `solve_exact`"""
+
+    def __init__(
+        self,
+        sn: SolutionNumbers,
+        notwo: np.ndarray,
+        availabilities: np.ndarray,
+        deadline: float,
+    ):
+        packed = PackedAvailabilities.from_bool(availabilities)
+        self.bits = [
+            sum(int(word) << (64 * i) for i, word in enumerate(row))
+            for row in packed.words
+        ]
+        self.notwo = notwo.tolist()
+        self.pairs = PairIndex.from_packed(packed)
+        #: Number of joint availabilities of every pair of people
+        self.pair_counts = self.pairs.counts.astype(int)
+        self.max_count = int(packed.counts.max())
+        self.sn = sn
+        self.deadline = deadline
+        self.n_nodes = 0
+        self.best_cost = [sn.n_people + 1] + [0] * self.max_count
+        self.best_groups: list[list[int]] | None = None
+        self.best_removed: list[int] = []
+        #: Objective function values of all incumbents
+        self.history: list[list[int]] = []
+
+    def set_incumbent(
+        self, cost: list[int], groups: list[list[int]], removed: list[int]
+    ) -> None:
+        self.best_cost = list(cost)
+        self.best_groups = [list(g) for g in groups]
+        self.best_removed = list(removed)
+        self.history.append(list(cost))
+
+    def upper_bounds(self, unassigned: list[int], sizes_left: list[int]) -> list[int]:
+        """For every unassigned person: Maximal number of joint availabilities of
+        any group with this person. A group of size s with this person cannot have
+        more joint availabilities than the (s-1)-th largest overlap of this person
+        with any other unassigned person.
+        """
+        sub = self.pair_counts[np.ix_(unassigned, unassigned)]
+        np.fill_diagonal(sub, -1)
+        overlaps = -np.sort(-sub, axis=1)
+        sizes = [i + 2 for i, n_groups in enumerate(sizes_left) if n_groups]
+        if not sizes:
+            return overlaps[:, 0].tolist()
+        min_size = sizes[0]
+        min_size_notwo = min((s for s in sizes if s > 2), default=min_size)
+        return [
+            int(row[(min_size_notwo if self.notwo[p] else min_size) - 2])
+            for p, row in zip(unassigned, overlaps)
+        ]
+
+    def bound(
+        self, upper_bounds: list[int], sizes_left: list[int], removals_left: int
+    ) -> list[int]:
+        """Lexicographically smallest objective function that the remaining groups
+        could possibly contribute.
+
+        If the upper bounds are sorted, the group that contains the person with
+        the smallest upper bound cannot be better than this bound. The person with
+        the smallest upper bound among the other people is at most the largest
+        group size further down the list, and so on. Every person that still has
+        to be removed adds to ``cost[0]``.
+        """
+        cost = [0] * (self.max_count + 1)
+        cost[0] += removals_left
+        ubs = sorted(upper_bounds)[removals_left:]
+        position = 0
+        for i_size in reversed(range(len(sizes_left))):
+            for _ in range(sizes_left[i_size]):
+                cost[ubs[position]] += 1
+                position += i_size + 2
+        return cost
+
+    def candidate_groups(
+        self, anchor: int, others: list[int], size: int, min_count: int
+    ) -> list[tuple[int, list[int]]]:
+        """All groups of `size` people that contain `anchor` and have at least
+        `min_count` joint availabilities.
+
+        Returns:
+            List of (number of joint availabilities, members)
+        """
+        available = set(others)
+        candidates = []
+        for q in self.pairs.candidates(anchor):
+            if self.pair_counts[anchor, q] < min_count:
+                break
+            if q in available and not (size == 2 and self.notwo[q]):
+                candidates.append(q)
+        if min_count == 0:
+            # People without any joint availabilities with the anchor
+            candidates += [
+                q
+                for q in others
+                if self.pair_counts[anchor, q] == 0
+                and not (size == 2 and self.notwo[q])
+            ]
+        groups: list[tuple[int, list[int]]] = []
+
+        def extend(members: list[int], joint: int, start: int) -> None:
+            if len(members) == size:
+                groups.append((_popcount(joint), members))
+                return
+            for i in range(start, len(candidates)):
+                q = candidates[i]
+                new_joint = joint & self.bits[q]
+                if _popcount(new_joint) >= min_count:
+                    extend(members + [q], new_joint, i + 1)
+
+        extend([anchor], self.bits[anchor], 0)
+        groups.sort(key=lambda g: -g[0])
+        return groups
+
+    def search(
+        self,
+        unassigned: list[int],
+        sizes_left: list[int],
+        removals_left: int,
+        partial: list[int],
+        groups: list[list[int]],
+        removed: list[int],
+    ) -> None:
+        self.n_nodes += 1
+        if self.n_nodes % 256 == 0 and timeit.default_timer() > self.deadline:
+            raise _TimeLimitReached
+        if not unassigned:
+            if partial < self.best_cost:
+                self.set_incumbent(partial, groups, removed)
+            return
+        ubs = self.upper_bounds(unassigned, sizes_left)
+        rest = self.bound(ubs, sizes_left, removals_left)
+        if [p + r for p, r in zip(partial, rest)] >= self.best_cost:
+            return
+        # Branch on the person that is hardest to place
+        i_anchor = int(np.argmin(ubs))
+        anchor = unassigned[i_anchor]
+        others = unassigned[:i_anchor] + unassigned[i_anchor + 1 :]
+        other_ubs = ubs[:i_anchor] + ubs[i_anchor + 1 :]
+
+        if removals_left:
+            partial[0] += 1
+            self.search(
+                others,
+                sizes_left,
+                removals_left - 1,
+                partial,
+                groups,
+                removed + [anchor],
+            )
+            partial[0] -= 1
+
+        for i_size in reversed(range(len(sizes_left))):
+            size = i_size + 2
+            if not sizes_left[i_size] or (size == 2 and self.notwo[anchor]):
+                continue
+            new_sizes_left = list(sizes_left)
+            new_sizes_left[i_size] -= 1
+            # Optimistic: The other members are the people with the smallest upper
+            # bounds
+            rest = self.bound(
+                sorted(other_ubs)[size - 1 :], new_sizes_left, removals_left
+            )
+            cost = [p + r for p, r in zip(partial, rest)]
+            min_count = 0
+            while min_count <= self.max_count:
+                cost[min_count] += 1
+                better = cost < self.best_cost
+                cost[min_count] -= 1
+                if better:
+                    break
+                min_count += 1
+            else:
+                continue
+            for count, members in self.candidate_groups(
+                anchor, others, size, min_count
+            ):
+                partial[count] += 1
+                self.search(
+                    [p for p in others if p not in members],
+                    new_sizes_left,
+                    removals_left,
+                    partial,
+                    groups + [members],
+                    removed,
+                )
+                partial[count] -= 1
+
+
+def solve_exact(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
+    *,
+    rng: np.random.Generator | None = None,
+    time_budget: float = 60.0,
+    initial: PairUpResult | None = None,
+    warm_start_steps=20_000,
+) -> tuple[PairUpResult, ExactStatistics]:
+    """Find the optimal matching by branch and bound.
+
+    In every node of the search tree, the unassigned person that is hardest to
+    place (smallest maximal overlap with any other unassigned person) is either
+    removed or put into a group. Only groups whose joint availabilities could
+    still beat the best solution so far are enumerated. Subtrees are pruned
+    based on a lower bound of the objective function (see
+    `_BranchAndBound.bound`).
+
+    If the time limit is reached, the best solution so far is returned and the
+    statistics report a lower bound instead of optimality. This is feasible for
+    up to about `RECOMMENDED_MAX_PEOPLE` people.
+
+    Args:
+        sn: SolutionNumbers, specifying the number of groups of each size
+        idx: Indices of people to be paired up
+        notwo: Boolean array: Who vetoes to be in a group of only two-people
+        availabilities: Boolean array of n_people x n_timeslots (or packed into
+            bitsets)
+        rng: Random number generator (only used for the warm start)
+        time_budget: Time limit in seconds
+        initial: Initial solution. A good initial solution allows to prune more
+            of the search tree.
+        warm_start_steps: If no initial solution is given, get one with this
+            many steps of `meetupmatcher.annealing.anneal` (0 to disable)
+
+    Returns:
+        PairUpResult, ExactStatistics
+    """
+    if notwo is None:
+        notwo = np.full(len(idx), False)
+    if availabilities is None:
+        availabilities = np.full((len(idx), 1), True)
+    if isinstance(availabilities, PackedAvailabilities):
+        availabilities = availabilities.to_bool()
+    n_people = len(idx)
+    assert sn.n_people == n_people == len(notwo)
+    if n_people > RECOMMENDED_MAX_PEOPLE:
+        logger.warning(
+            f"Proving optimality for {n_people} people might take very long. "
+            f"Will return the best solution after {time_budget} seconds."
+        )
+    if initial is None and warm_start_steps > 0:
+        try:
+            initial, _ = anneal(
+                sn, idx, notwo, availabilities, rng=rng, n_steps=warm_start_steps
+            )
+        except NoSolution:
+            pass
+    t = timeit.default_timer()
+    bb = _BranchAndBound(sn, notwo, availabilities, deadline=t + time_budget)
+    if initial is not None:
+        position = {label: i for i, label in enumerate(idx)}
+        cost = [0] * (bb.max_count + 1)
+        cost[: len(initial.cost)] = initial.cost.tolist()
+        bb.set_incumbent(
+            cost,
+            [[position[label] for label in group] for group in initial.segmentation],
+            [position[label] for label in initial.removed],
+        )
+    everyone = list(range(n_people))
+    lower_bound = bb.bound(
+        bb.upper_bounds(everyone, list(sn.partitions)),
+        list(sn.partitions),
+        sn.removed,
+    )
+    optimal = True
+    try:
+        bb.search(
+            everyone,
+            list(sn.partitions),
+            sn.removed,
+            [0] * (bb.max_count + 1),
+            [],
+            [],
+        )
+    except _TimeLimitReached:
+        optimal = False
+    elapsed = timeit.default_timer() - t
+    if bb.best_groups is None:
+        if optimal:
+            raise NoSolution("No valid assignment to groups exists")
+        raise NoSolution(f"No solution found within {time_budget} seconds")
+    if optimal:
+        lower_bound = bb.best_cost
+        logger.info(f"Proved optimality in {elapsed:,} seconds ({bb.n_nodes} nodes)")
+    else:
+        logger.warning(
+            f"Time limit reached after {bb.n_nodes} nodes. Best solution: "
+            f"{bb.best_cost}, lower bound: {lower_bound}"
+        )
+    result = PairUpResult(
+        [set(idx[g]) for g in bb.best_groups],
+        set(idx[bb.best_removed]),
+        cost=np.array(bb.best_cost),
+        joint_availabilities=np.array(
+            [np.all(availabilities[g], axis=0) for g in bb.best_groups]
+        ),
+    )
+    return result, ExactStatistics(
+        pd.DataFrame(bb.history),
+        best=result.cost,
+        solution_pair_avs=result.joint_availabilities,
+        optimal=optimal,
+        lower_bound=np.array(lower_bound),
+        n_nodes=bb.n_nodes,
+    )
+
+
+@register_strategy
+class ExactStrategy(MatchingStrategy):
+    """Branch and bound with proven optimality, see `solve_exact`"""
+
+    name = "exact"
+
+    def __init__(self, **options):
+        """
+
+        Args:
+            **options: Passed on to `solve_exact`
+        """
+        self.options = options
+
+    def run(
+        self,
+        sn: SolutionNumbers,
+        idx: np.ndarray,
+        notwo: np.ndarray | None = None,
+        availabilities: np.ndarray | PackedAvailabilities | None = None,
+        *,
+        rng: np.random.Generator | None = None,
+    ) -> tuple[PairUpResult, PairUpStatistics]:
+        return solve_exact(sn, idx, notwo, availabilities, rng=rng, **self.options)
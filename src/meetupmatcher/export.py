@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import mailbox
+from os import PathLike
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from meetupmatcher.data import People
+    from meetupmatcher.matcher import PairUpResult, PairUpStatistics
+    from meetupmatcher.templating import Email
+
+#: Incremented whenever the exported fields change
+EXPORT_VERSION = 1
+
+#: Formats of `write_records`
+TABLE_FORMATS = ("jsonl", "parquet")
+
+#: Libraries that pandas can write Parquet files with
+PARQUET_ENGINES = ("pyarrow", "fastparquet")
+
+#: Formats of `MailArchive`
+MAIL_FORMATS = ("mbox", "eml")
+
+
+def group_records(result: PairUpResult, people: People) -> Iterator[dict]:
+    """One record per participant: Email, name, index of their group (None if
+    they could not be assigned to a group), size of the group, and the
+    timeslots at which the whole group is available
+    """
+    store = people.store
+    timeslots = store.timeslots
+    for i_group, group in enumerate(result.segmentation):
+        positions = store.positions(sorted(group))
+        availabilities = []
+        if timeslots:
+            available = np.flatnonzero(result.joint_availabilities[i_group])
+            availabilities = sorted(timeslots[j] for j in available)
+        for email, name in zip(
+            store.column("email", positions), store.column("name", positions)
+        ):
+            yield {
+                "email": email,
+                "name": name.strip(),
+                "group": i_group,
+                "group_size": len(group),
+                "availabilities": availabilities,
+            }
+    removed = store.positions(sorted(result.removed))
+    for email, name in zip(
+        store.column("email", removed), store.column("name", removed)
+    ):
+        yield {
+            "email": email,
+            "name": name.strip(),
+            "group": None,
+            "group_size": 0,
+            "availabilities": [],
+        }
+
+
+def cost_records(statistics: PairUpStatistics) -> Iterator[dict]:
+    """One record per trial that was built to the end, with the components of
+    its cost vector (``cost_0`` is compared first)
+    """
+    names = [f"cost_{i}" for i in range(statistics.df.shape[1])]
+    for i_trial, costs in enumerate(statistics.df.itertuples(index=False)):
+        yield {"trial": i_trial, **dict(zip(names, map(int, costs)))}
+
+
+def statistics_summary(statistics: PairUpStatistics) -> dict:
+    """Everything but the cost history, ready for `json.dump`"""
+    return {
+        "version": EXPORT_VERSION,
+        **statistics.to_dict(),
+        "solution_availabilities": np.asarray(statistics.solution_pair_avs)
+        .sum(axis=1)
+        .tolist(),
+    }
+
+
+def table_format(path: str | PathLike) -> str:
+    """Format of `write_records` from the file extension"""
+    suffix = Path(path).suffix.lstrip(".").lower()
+    if suffix in ("jsonl", "ndjson"):
+        return "jsonl"
+    if suffix in ("parquet", "pq"):
+        return "parquet"
+    raise ValueError(
+        f"Can't tell the format of {path}. Use the extension .jsonl or .parquet."
+    )
+
+
+def check_parquet_engine() -> None:
+    """Raise an `ImportError` if none of `PARQUET_ENGINES` is installed"""
+    if not any(importlib.util.find_spec(engine) for engine in PARQUET_ENGINES):
+        raise ImportError(
+            "Writing Parquet files requires the pyarrow package (pip install pyarrow)"
+        )
+
+
+def write_records(
+    path: str | PathLike, records: Iterable[dict], format: str | None = None
+) -> int:
+    """Write records to a JSON lines or a Parquet file. JSON lines are written
+    one by one, Parquet needs all records in memory. Returns the number of
+    records.
+
+    Args:
+        path:
+        records:
+        format: One of `TABLE_FORMATS` (default: from the extension of `path`)
+    """
+    if format is None:
+        format = table_format(path)
+    if format == "jsonl":
+        n = 0
+        with Path(path).open("w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                n += 1
+        return n
+    if format == "parquet":
+        import pandas as pd
+
+        check_parquet_engine()
+        df = pd.DataFrame.from_records(list(records))
+        if "group" in df:
+            # Keep group indices integers even if some people were removed
+            df["group"] = df["group"].astype("Int64")
+        df.to_parquet(path, index=False)
+        return len(df)
+    raise ValueError(f"Unknown format {format!r}. Choose from {TABLE_FORMATS}.")
+
+
+class MailArchive:
+    """Write emails to an mbox file or as ``.eml`` files to a directory while
+    they are passed on (see `tee`)::
+
+        with MailArchive("round.mbox") as archive:
+            sender.send(archive.tee(emails))
+    """
+
+    def __init__(
+        self,
+        path: str | PathLike,
+        format: str | None = None,
+        *,
+        from_address: str | None = None,
+    ):
+        """
+
+        Args:
+            path: mbox file or directory for the ``.eml`` files
+            format: One of `MAIL_FORMATS` (default: ``mbox`` if `path` ends with
+                ``.mbox``, ``eml`` otherwise)
+            from_address: Sender of the emails
+        """
+        self.path = Path(path)
+        if format is None:
+            format = "mbox" if self.path.suffix.lower() == ".mbox" else "eml"
+        if format not in MAIL_FORMATS:
+            raise ValueError(f"Unknown format {format!r}. Choose from {MAIL_FORMATS}.")
+        self.format = format
+        self.from_address = from_address
+        self.n_written = 0
+        self._mbox: mailbox.mbox | None = None
+        if format == "mbox":
+            # mbox files are appended to, but we want the emails of this run only
+            self.path.unlink(missing_ok=True)
+            self._mbox = mailbox.mbox(self.path)
+            self._mbox.lock()
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self) -> MailArchive:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._mbox is not None:
+            self._mbox.flush()
+            self._mbox.unlock()
+            self._mbox.close()
+            self._mbox = None
+
+    def write(self, mail: Email) -> None:
+        message = mail.to_message(self.from_address)
+        if self._mbox is not None:
+            self._mbox.add(message)
+        else:
+            path = self.path / f"{self.n_written:05d}.eml"
+            path.write_bytes(message.as_bytes())
+        self.n_written += 1
+
+    def tee(self, emails: Iterable[Email]) -> Iterator[Email]:
+        """Write every email as it passes through"""
+        for mail in emails:
+            self.write(mail)
+            yield mail
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import itertools
+import os
+from dataclasses import dataclass, field
+from os import PathLike
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from meetupmatcher.util.log import logger
+
+#: Incremented whenever the format of history files changes
+HISTORY_VERSION = 1
+
+_SHIFT = np.uint64(32)
+
+
+def _pair_keys(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Encode pairs of indices as single integers (smaller index first)"""
+    first, second = np.minimum(first, second), np.maximum(first, second)
+    return (first.astype(np.uint64) << _SHIFT) | second.astype(np.uint64)
+
+
+@dataclass
+class MatchHistory:
+    """Who was in a group with whom in past rounds.
+
+    People are identified by their email. Every pair of people that met is stored
+    as a single integer made of the positions of the two emails in `emails`, and
+    these keys are kept sorted, so that the history stays compact even for many
+    rounds and people.
+    """
+
+    #: Emails of everyone who was ever matched (new people are appended)
+    emails: list[str] = field(default_factory=list)
+    #: Sorted, unique keys of all pairs that met, see `_pair_keys`
+    keys: np.ndarray = field(default_factory=lambda: np.array([], dtype=np.uint64))
+    #: Number of rounds that were added
+    n_rounds: int = 0
+
+    def __post_init__(self):
+        self._index = {email: i for i, email in enumerate(self.emails)}
+
+    def __len__(self) -> int:
+        """Number of pairs that met"""
+        return len(self.keys)
+
+    def _position(self, email: str) -> int:
+        if email not in self._index:
+            self._index[email] = len(self.emails)
+            self.emails.append(email)
+        return self._index[email]
+
+    def add_round(self, groups: Iterable[Iterable[str]]) -> None:
+        """Record the groups (given by the emails of their members) of a round"""
+        pairs: list[tuple[int, int]] = []
+        for group in groups:
+            members = [self._position(email) for email in group]
+            pairs.extend(itertools.combinations(members, 2))
+        if pairs:
+            first, second = np.array(pairs).T
+            self.keys = np.union1d(self.keys, _pair_keys(first, second))
+        self.n_rounds += 1
+
+    def met(self, emails: list[str]) -> np.ndarray:
+        """Boolean array of n_people x n_people: Which of these people were in a
+        group together before
+        """
+        n_people = len(emails)
+        # History position -> position in `emails` (-1 if not present)
+        lookup = np.full(len(self.emails), -1, dtype=np.intp)
+        for i, email in enumerate(emails):
+            if email in self._index:
+                lookup[self._index[email]] = i
+        first = lookup[(self.keys >> _SHIFT).astype(np.intp)]
+        second = lookup[(self.keys & np.uint64(0xFFFFFFFF)).astype(np.intp)]
+        present = (first >= 0) & (second >= 0)
+        met = np.full((n_people, n_people), False)
+        met[first[present], second[present]] = True
+        met[second[present], first[present]] = True
+        return met
+
+    def save(self, path: str | PathLike) -> None:
+        """Write to a ``.npz`` file (replaced atomically)"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            version=HISTORY_VERSION,
+            emails=np.array(self.emails, dtype=str),
+            keys=self.keys,
+            n_rounds=self.n_rounds,
+        )
+        os.replace(tmp_path, path)
+        logger.debug(f"Saved {len(self)} pairs from {self.n_rounds} rounds to {path}")
+
+    @classmethod
+    def load(cls, path: str | PathLike) -> MatchHistory:
+        """Read a file written by `save`"""
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version != HISTORY_VERSION:
+                raise ValueError(
+                    f"Unsupported history version {version} in {path} (expected "
+                    f"{HISTORY_VERSION})"
+                )
+            return cls(
+                emails=data["emails"].tolist(),
+                keys=data["keys"].astype(np.uint64),
+                n_rounds=int(data["n_rounds"]),
+            )
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import cProfile
+import dataclasses
+import io
+import pstats
+from collections import Counter
+from dataclasses import dataclass, field
+from os import PathLike
+from pathlib import Path
+
+#: Profilers that are supported by `Profiler`
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+@dataclass
+class SearchCounters:
+    """What happened during the search of `meetupmatcher.matcher.pair_up`"""
+
+    #: Number of trials
+    n_tries: int = 0
+    #: Number of trials that were built to the end
+    n_complete: int = 0
+    #: Number of trials that failed because somebody shared no availabilities
+    #: with the rest of their group
+    n_incompatible: int = 0
+    #: Number of times the best solution improved
+    n_improvements: int = 0
+    #: Number of trials that were aborted because they were worse than the best
+    #: solution, by the index of the group after which they were aborted
+    aborts_by_group: Counter = field(default_factory=Counter)
+    #: Seconds spent drawing people into groups
+    time_sampling: float = 0.0
+    #: Seconds spent updating and comparing costs
+    time_cost: float = 0.0
+    #: Seconds spent in total
+    elapsed: float = 0.0
+
+    @property
+    def n_aborted(self) -> int:
+        return sum(self.aborts_by_group.values())
+
+    def update(self, other: SearchCounters) -> None:
+        """Add the counts and times of `other` (e.g., from a worker process)"""
+        for f in dataclasses.fields(self):
+            if f.name == "aborts_by_group":
+                self.aborts_by_group.update(other.aborts_by_group)
+            else:
+                setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+    def to_dict(self) -> dict:
+        """Convert to a JSON serializable dictionary"""
+        data = dataclasses.asdict(self)
+        data["n_aborted"] = self.n_aborted
+        data["aborts_by_group"] = {
+            str(i): n for i, n in sorted(self.aborts_by_group.items())
+        }
+        return data
+
+
+class Profiler:
+    """Profile a block of code and write the results to a file::
+
+        with Profiler("matching.prof"):
+            ...
+
+    ``cprofile`` (deterministic, from the standard library) writes `pstats` data,
+    which can be viewed with ``snakeviz`` or `pstats`. ``pyinstrument`` (a
+    sampling profiler with less overhead, needs to be installed separately)
+    writes an HTML page.
+    """
+
+    def __init__(self, path: str | PathLike, profiler: str = "cprofile"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler!r}. Choose from {PROFILERS}.")
+        self.path = Path(path)
+        self.profiler = profiler
+        self._profile: cProfile.Profile | None = None
+        self._sampler = None
+        if profiler == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError as e:
+                raise ImportError(
+                    "The pyinstrument profiler requires the pyinstrument package "
+                    "(pip install pyinstrument)"
+                ) from e
+            self._sampler = pyinstrument.Profiler()
+
+    def __enter__(self) -> Profiler:
+        if self._sampler is not None:
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.path.write_text(self._sampler.output_html())
+        else:
+            assert self._profile is not None
+            self._profile.disable()
+            self._profile.dump_stats(self.path)
+
+    def top(self, n: int = 20) -> list[dict]:
+        """Functions with the highest cumulative time (only for ``cprofile``)"""
+        if self._profile is None:
+            return []
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        top = []
+        for func in stats.fcn_list[:n]:  # type: ignore[attr-defined]
+            _, n_calls, total, cumulative, _ = stats.stats[func]  # type: ignore
+            filename, line, name = func
+            top.append(
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "n_calls": n_calls,
+                    "total_time": total,
+                    "cumulative_time": cumulative,
+                }
+            )
+        return top
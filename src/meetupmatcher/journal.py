@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from os import PathLike
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from meetupmatcher.util.log import logger
+
+if TYPE_CHECKING:
+    from meetupmatcher.templating import Email
+
+#: Incremented whenever the format of the journal changes
+JOURNAL_VERSION = 1
+
+
+def message_key(mail: Email, round_id: str) -> str:
+    """Identifies an email of a round: Hash of the round, the recipients (in any
+    order), and the subject
+    """
+    data = json.dumps([JOURNAL_VERSION, round_id, sorted(mail.to), mail.subject])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def groups_path(journal: str | PathLike, round_id: str) -> Path:
+    """File next to the journal with the groups of a round (see `MatchState`).
+
+    Emails are only recognized as sent if the groups are the same, but the
+    matching can't be repeated if the search is stopped by a time limit. So
+    the groups are saved before sending and used again when sending again.
+    """
+    path = Path(journal)
+    return path.with_name(f"{path.name}.{round_id}.groups.json")
+
+
+class SendJournal:
+    """Which emails were delivered, stored in an SQLite database, so that an
+    interrupted send can be repeated without emailing anybody twice.
+
+    Every delivery is committed right away. The journal can be shared between
+    threads.
+    """
+
+    def __init__(self, path: str | PathLike):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sent ("
+                "key TEXT PRIMARY KEY, round TEXT, recipients TEXT, subject TEXT, "
+                "sent_at REAL)"
+            )
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version == 0:
+                self._connection.execute(f"PRAGMA user_version = {JOURNAL_VERSION}")
+            elif version != JOURNAL_VERSION:
+                raise ValueError(
+                    f"Unsupported journal version {version} in {path} (expected "
+                    f"{JOURNAL_VERSION})"
+                )
+
+    def __enter__(self) -> SendJournal:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of delivered emails"""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM sent").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def is_sent(self, mail: Email, round_id: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM sent WHERE key = ?", (message_key(mail, round_id),)
+            ).fetchone()
+        return row is not None
+
+    def record(self, mail: Email, round_id: str) -> None:
+        """Mark an email as delivered"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO sent VALUES (?, ?, ?, ?, ?)",
+                (
+                    message_key(mail, round_id),
+                    round_id,
+                    ", ".join(mail.to),
+                    mail.subject,
+                    time.time(),
+                ),
+            )
+        logger.debug(f"Recorded delivery to {mail.to} in {self.path}")
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import functools
+import itertools
+import operator
+import timeit
+
+import numpy as np
+
+from meetupmatcher.bitset import PackedAvailabilities, pack
+from meetupmatcher.matcher import PairUpResult
+from meetupmatcher.util.log import logger
+
+
+def _popcount(bitset: int) -> int:
+    return bin(bitset).count("1")
+
+
+def _and(bitsets) -> int:
+    return functools.reduce(operator.and_, bitsets)
+
+
+class _Refiner:
+    """Mutable state of the local search, see `refine`"""
+
+    def __init__(
+        self,
+        groups: list[list[int]],
+        removed: list[int],
+        notwo: np.ndarray,
+        availabilities: np.ndarray,
+        met: np.ndarray | None = None,
+    ):
+        self.groups = groups
+        self.removed = removed
+        self.notwo = notwo
+        self.met = met
+        words = pack(availabilities)
+        #: Availabilities of every person as a python integer
+        self.bits = [
+            sum(int(word) << (64 * i) for i, word in enumerate(row)) for row in words
+        ]
+        #: Joint availabilities of every group as python integer
+        self.joint: list[int] = []
+        #: Number of joint availabilities of every group (0 for repeated groupings,
+        #: see `_count`)
+        self.counts: list[int] = []
+        #: For every group: Joint availabilities of all members but the i-th
+        self.others: list[list[int]] = []
+        for i_group in range(len(groups)):
+            self.joint.append(0)
+            self.counts.append(0)
+            self.others.append([])
+            self._update(i_group)
+
+    def _update(self, i_group: int) -> None:
+        group = self.groups[i_group]
+        self.joint[i_group] = _and(self.bits[p] for p in group)
+        self.counts[i_group] = self._count(group, self.joint[i_group])
+        self.others[i_group] = [
+            _and(self.bits[q] for q in group if q != p) for p in group
+        ]
+
+    def _repeats(self, members) -> bool:
+        """Were two of these people in a group before?"""
+        if self.met is None:
+            return False
+        return any(self.met[p, q] for p, q in itertools.combinations(members, 2))
+
+    def _count(self, members, joint: int) -> int:
+        """Number of joint availabilities of a group. Like in
+        `meetupmatcher.matcher.pair_up`, groups with people that were in a group
+        before count as if they had no joint availabilities.
+        """
+        if self._repeats(members):
+            return 0
+        return _popcount(joint)
+
+    def _allowed(self, members) -> bool:
+        """Can these people form a group (with respect to the two-person veto)?"""
+        return len(members) != 2 or not any(self.notwo[p] for p in members)
+
+    def try_swaps(self, i: int, j: int) -> bool:
+        """Try to swap a member of group i with a member of group j. The first
+        swap that improves the objective is applied.
+        """
+        a_group, b_group = self.groups[i], self.groups[j]
+        old = sorted((self.counts[i], self.counts[j]))
+        for k, a in enumerate(a_group):
+            for m, b in enumerate(b_group):
+                new_a = _popcount(self.others[i][k] & self.bits[b])
+                new_b = _popcount(self.others[j][m] & self.bits[a])
+                if sorted((new_a, new_b)) <= old:
+                    continue
+                if len(a_group) == 2 and self.notwo[b]:
+                    continue
+                if len(b_group) == 2 and self.notwo[a]:
+                    continue
+                if self.met is not None:
+                    # Repeated groupings can only lower the counts, so this is
+                    # only checked for swaps that would be applied otherwise
+                    if self._repeats([p for p in a_group if p != a] + [b]):
+                        new_a = 0
+                    if self._repeats([p for p in b_group if p != b] + [a]):
+                        new_b = 0
+                    if sorted((new_a, new_b)) <= old:
+                        continue
+                a_group[k], b_group[m] = b, a
+                self._update(i)
+                self._update(j)
+                return True
+        return False
+
+    def try_moves(self, i: int, j: int) -> bool:
+        """Try to move a member of group i to group j, provided that group i is
+        larger than group j by exactly one person (so that the number of groups of
+        each size stays the same).
+        """
+        a_group, b_group = self.groups[i], self.groups[j]
+        if len(a_group) != len(b_group) + 1:
+            return False
+        old = sorted((self.counts[i], self.counts[j]))
+        for k, a in enumerate(a_group):
+            new_a = _popcount(self.others[i][k])
+            new_b = _popcount(self.joint[j] & self.bits[a])
+            if sorted((new_a, new_b)) <= old:
+                continue
+            rest = [p for p in a_group if p != a]
+            if not self._allowed(rest):
+                continue
+            if self.met is not None:
+                if self._repeats(rest):
+                    new_a = 0
+                if self._repeats(b_group + [a]):
+                    new_b = 0
+                if sorted((new_a, new_b)) <= old:
+                    continue
+            a_group.remove(a)
+            b_group.append(a)
+            self._update(i)
+            self._update(j)
+            return True
+        return False
+
+    def try_removed_swaps(self, i: int) -> bool:
+        """Try to replace a member of group i by a person that was removed"""
+        group = self.groups[i]
+        for k, a in enumerate(group):
+            for m, r in enumerate(self.removed):
+                if _popcount(self.others[i][k] & self.bits[r]) <= self.counts[i]:
+                    continue
+                if len(group) == 2 and self.notwo[r]:
+                    continue
+                if self._repeats([p for p in group if p != a] + [r]):
+                    continue
+                group[k], self.removed[m] = r, a
+                self._update(i)
+                return True
+        return False
+
+    def run_pass(self) -> int:
+        """Try all moves once. Returns the number of applied moves."""
+        n_moves = 0
+        n_groups = len(self.groups)
+        for i in range(n_groups):
+            n_moves += self.try_removed_swaps(i)
+            for j in range(n_groups):
+                if i == j:
+                    continue
+                if i < j:
+                    n_moves += self.try_swaps(i, j)
+                n_moves += self.try_moves(i, j)
+        return n_moves
+
+
+def add_to_groups(
+    people: list[int],
+    groups: list[list[int]],
+    availabilities: np.ndarray,
+    max_size: int = 4,
+) -> tuple[list[int], set[int]]:
+    """Add people one by one to the group with fewer than `max_size` members with
+    which they share the most availabilities. Used to place people that are left
+    over when repairing a solution.
+
+    Args:
+        people: Positions of the people to add
+        groups: Groups as lists of positions (modified in place)
+        availabilities: Boolean array of n_people x n_timeslots
+        max_size: Largest allowed group size
+
+    Returns:
+        People that could not be added (all groups are full), indices of the groups
+        that were changed
+    """
+    not_added = []
+    changed = set()
+    for p in people:
+        open_groups = [i for i, g in enumerate(groups) if len(g) < max_size]
+        if not open_groups:
+            not_added.append(p)
+            continue
+        joint = [
+            np.all(availabilities[groups[i] + [p]], axis=0).sum() for i in open_groups
+        ]
+        i_best = open_groups[int(np.argmax(joint))]
+        groups[i_best].append(p)
+        changed.add(i_best)
+    return not_added, changed
+
+
+def refine(
+    result: PairUpResult,
+    idx: np.ndarray,
+    notwo: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
+    *,
+    max_passes=100,
+    met: np.ndarray | None = None,
+) -> PairUpResult:
+    """Improve a solution by local search.
+
+    Members are swapped between groups, moved from a group to a group that is
+    smaller by one person, or exchanged with people who were removed. None of
+    these moves change the number of groups of each size. Every move only changes
+    the joint availabilities of two groups, so it is evaluated based on these
+    alone, and it is applied if it lowers the objective function (in the
+    lexicographic sense). This is repeated until no move improves the solution
+    anymore.
+
+    Args:
+        result: Solution, e.g., from `meetupmatcher.matcher.pair_up`
+        idx: Indices of people (as passed to `meetupmatcher.matcher.pair_up`)
+        notwo: Boolean array: Who vetoes to be in a group of only two-people
+        availabilities: Boolean array of n_people x n_timeslots (or packed into
+            bitsets)
+        max_passes: Maximal number of times that all moves are tried
+        met: Boolean array of n_people x n_people: Who was in a group with whom
+            (see `meetupmatcher.history`). Groups with such people count as if
+            they had no joint availabilities, as in
+            `meetupmatcher.matcher.pair_up`.
+
+    Returns:
+        Refined solution (a new object, `result` is not modified)
+    """
+    if availabilities is None:
+        # Nothing to optimize
+        return result
+    if notwo is None:
+        notwo = np.full(len(idx), False)
+    if isinstance(availabilities, PackedAvailabilities):
+        availabilities = availabilities.to_bool()
+    position = {label: i for i, label in enumerate(idx)}
+    refiner = _Refiner(
+        [sorted(position[label] for label in group) for group in result.segmentation],
+        sorted(position[label] for label in result.removed),
+        notwo,
+        availabilities,
+        met=None if met is None else np.asarray(met, dtype=bool),
+    )
+    t = timeit.default_timer()
+    for i_pass in range(max_passes):
+        n_moves = refiner.run_pass()
+        logger.debug(f"Refinement pass {i_pass}: {n_moves} moves")
+        if n_moves == 0:
+            break
+    elapsed = timeit.default_timer() - t
+    cost = np.zeros_like(result.cost)
+    cost[0] += len(refiner.removed)
+    for count in refiner.counts:
+        cost[count] += 1
+    logger.info(f"Refined cost function from {result.cost} to {cost} in {elapsed:,}s")
+    n_timeslots = availabilities.shape[1]
+    return PairUpResult(
+        [set(idx[group]) for group in refiner.groups],
+        set(idx[refiner.removed]),
+        cost=cost,
+        joint_availabilities=np.array(
+            [
+                [bool(joint >> k & 1) for k in range(n_timeslots)]
+                for joint in refiner.joint
+            ]
+        ),
+    )
@@ -1,56 +1,441 @@
 from __future__ import annotations
 
+import functools
 import getpass
+import os
+import queue
+import smtplib
+import socket
+import ssl
+import sys
+import threading
 import time
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path, PurePath
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Mapping, TextIO, TypeVar
 
-import yagmail
-
-from meetupmatcher.templating import Email
 from meetupmatcher.util.log import logger
 
+if TYPE_CHECKING:
+    from meetupmatcher.journal import SendJournal
+    from meetupmatcher.templating import Email
+
+T = TypeVar("T")
+
+
+def is_transient(e: Exception) -> bool:
+    """Whether sending might succeed when trying again later (temporary SMTP
+    errors with 4xx codes and network problems)
+    """
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPException):
+        # E.g., SMTPNotSupportedError (SMTPException is an OSError)
+        return False
+    # Not SSL errors (e.g., certificate verification), which are OSErrors too.
+    # socket.timeout is only an alias of TimeoutError since Python 3.10.
+    return isinstance(
+        e, (ConnectionError, TimeoutError, socket.timeout, socket.gaierror)
+    )
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry transient failures (see `is_transient`) with exponential backoff"""
+
+    #: Maximal number of attempts
+    attempts: int = 4
+    #: Seconds to wait after the first failure (doubled after every failure)
+    base_delay: float = 2.0
+    #: Maximal number of seconds to wait
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after the failure of attempt number `attempt`
+        (starting from 0)
+        """
+        return min(self.max_delay, self.base_delay * 2**attempt)
+
+    def call(
+        self, func: Callable[[], T], *, sleep: Callable[[float], None] = time.sleep
+    ) -> T:
+        """Call `func` until it succeeds, the error is not transient, or there are
+        no attempts left (in which case the last error is raised)
+        """
+        for attempt in range(self.attempts):
+            try:
+                return func()
+            except (smtplib.SMTPException, OSError) as e:
+                if attempt == self.attempts - 1 or not is_transient(e):
+                    raise
+                delay = self.delay(attempt)
+                logger.warning(f"Sending failed ({e}), retrying in {delay} seconds")
+                sleep(delay)
+        raise ValueError("Number of attempts must be positive")
+
 
 class MailSender(ABC):
-    def __init__(self, dry_run: bool = True, dump_file: str | PurePath | None = None):
+    def __init__(
+        self,
+        dry_run: bool = True,
+        dump_file: str | PurePath | None = None,
+        *,
+        journal: SendJournal | None = None,
+        round_id: str = "",
+        retry: RetryPolicy | None = None,
+    ):
         """
 
         Args:
             dry_run:
             dump_file: If dry run, dump into this file instead of printing
+            journal: Record every delivered email here and skip emails that were
+                already delivered (e.g., when sending again after a failure)
+            round_id: Identifies the round in the journal (emails with the same
+                recipients and subject are only sent once per round)
+            retry: How to retry transient failures
         """
         self.dry_run = dry_run
         self.dump_file = Path(dump_file) if dump_file is not None else None
+        self.journal = journal
+        self.round_id = round_id
+        self.retry = retry if retry is not None else RetryPolicy()
 
-    def send(self, emails: list[Email]) -> None:
+    def send(self, emails: Iterable[Email]) -> None:
+        """Send emails (or dump them if this is a dry run). `emails` can be a
+        generator: Emails are sent as they are produced, so rendering and
+        sending overlap and not all emails have to be kept in memory.
+        """
         if self.dry_run:
             self.send_dry_run(emails)
-        else:
-            logger.warning(
-                f"About to send {len(emails)} emails. This is NOT a dry-run."
+            return
+        if self.journal is not None:
+            emails = self._not_sent(emails)
+        logger.warning("About to send emails. This is NOT a dry-run.")
+        self._send(emails)
+
+    def _not_sent(self, emails: Iterable[Email]) -> Iterator[Email]:
+        """Skip emails that were already delivered according to the journal"""
+        assert self.journal is not None
+        n_skipped = 0
+        for mail in emails:
+            if self.journal.is_sent(mail, self.round_id):
+                n_skipped += 1
+            else:
+                yield mail
+        if n_skipped:
+            logger.info(
+                f"Skipped {n_skipped} emails that were already sent according to "
+                f"{self.journal.path}"
             )
-            self._send(emails)
+
+    def _delivered(self, mail: Email) -> None:
+        """Called by `_send` for every email that was delivered"""
+        logger.debug(f"Sent email to {mail.to}")
+        if self.journal is not None:
+            self.journal.record(mail, self.round_id)
 
     @abstractmethod
-    def _send(self, emails: list[Email]) -> None:
+    def _send(self, emails: Iterable[Email]) -> None:
         pass
 
-    def send_dry_run(self, emails: list[Email]) -> None:
-        dump = ("\n" + "-" * 80 + "\n").join([mail.to_str() for mail in emails])
+    def send_dry_run(self, emails: Iterable[Email]) -> None:
+        """Write emails to the dump file (or print them), one after the other"""
         if self.dump_file:
             with self.dump_file.open("w") as f:
-                f.write(dump)
+                self._dump(emails, f)
         else:
-            print(dump)
+            self._dump(emails, sys.stdout)
+            print()
+
+    @staticmethod
+    def _dump(emails: Iterable[Email], f: TextIO) -> None:
+        for i, mail in enumerate(emails):
+            if i:
+                f.write("\n" + "-" * 80 + "\n")
+            f.write(mail.to_str())
 
 
 class YagmailSender(MailSender):
-    def _send(self, emails: list[Email]) -> None:
+    def _send(self, emails: Iterable[Email]) -> None:
+        # Not needed for dry runs or other senders
+        import yagmail
+
         username = input("Gmail username: ")
         pwd = getpass.getpass("Gmail password: ")
         yag = yagmail.SMTP(username, pwd)
         for mail in emails:
             logger.debug(f"Sending email to {mail.to}")
-            yag.send(to=mail.to, subject=mail.subject, contents=mail.content)
-            logger.debug("Sending done. Sleeping for 1 second")
+            self.retry.call(
+                functools.partial(
+                    yag.send, to=mail.to, subject=mail.subject, contents=mail.content
+                )
+            )
+            self._delivered(mail)
+            logger.debug("Sleeping for 1 second")
             time.sleep(1)
+
+
+class SendError(Exception):
+    """Some emails could not be sent"""
+
+    def __init__(self, failed: list[tuple[Email, Exception]]):
+        self.failed = failed
+        recipients = ", ".join(", ".join(mail.to) for mail, _ in failed)
+        super().__init__(f"Could not send {len(failed)} emails (to {recipients})")
+
+
+class TokenBucket:
+    """Rate limiter: On average, at most `rate` calls of `acquire` per second
+    return, with bursts of up to `capacity` calls. Thread safe.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take a token, waiting until one is available"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            # Tokens can become negative: Later callers queue up behind us
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+
+
+#: Environment variables that override the ``smtp`` section of the config file
+SMTP_ENVIRONMENT = {
+    "host": "MEETUPMATCHER_SMTP_HOST",
+    "port": "MEETUPMATCHER_SMTP_PORT",
+    "username": "MEETUPMATCHER_SMTP_USERNAME",
+    "password": "MEETUPMATCHER_SMTP_PASSWORD",
+    "sender": "MEETUPMATCHER_SMTP_SENDER",
+}
+
+
+@dataclass(frozen=True)
+class SMTPSettings:
+    """How to connect to the SMTP server, see `from_config`"""
+
+    host: str
+    port: int = 587
+    username: str | None = None
+    password: str | None = None
+    #: From address (defaults to the username)
+    sender: str | None = None
+    #: ``starttls``, ``ssl``, or ``none``
+    security: str = "starttls"
+    #: Number of connections that are used in parallel
+    connections: int = 4
+    #: Maximal number of emails per second
+    rate: float = 5.0
+    #: Timeout for connecting and every command (seconds)
+    timeout: float = 30.0
+
+    def __post_init__(self):
+        if self.security not in ("starttls", "ssl", "none"):
+            raise ValueError(
+                f"Unknown security {self.security!r}. Use starttls, ssl, or none."
+            )
+        if self.connections < 1:
+            raise ValueError("Number of connections must be positive")
+
+    @property
+    def from_address(self) -> str:
+        if self.sender is not None:
+            return self.sender
+        if self.username is not None:
+            return self.username
+        raise ValueError("Either a sender or a username is needed")
+
+    @classmethod
+    def from_config(
+        cls, config: Mapping | None, environ: Mapping[str, str] = os.environ
+    ) -> SMTPSettings | None:
+        """Settings from the ``smtp`` section of the config file, where the
+        environment variables from `SMTP_ENVIRONMENT` take precedence (so that
+        the password doesn't have to be written to a file). None if no host is
+        configured.
+        """
+        settings = dict(config or {})
+        for key, variable in SMTP_ENVIRONMENT.items():
+            if variable in environ:
+                settings[key] = environ[variable]
+        if not settings.get("host"):
+            return None
+        if "port" in settings:
+            settings["port"] = int(settings["port"])
+        return cls(**settings)
+
+
+class SMTPPoolSender(MailSender):
+    """Send emails over a pool of persistent SMTP connections.
+
+    Every connection is used by its own thread, so that the round trips of
+    several emails overlap, and a `TokenBucket` limits the number of emails per
+    second. Connections that are dropped by the server are opened again, and
+    transient failures are retried (see `RetryPolicy`). Emails that cannot be
+    sent are reported together at the end (see `SendError`).
+    """
+
+    def __init__(
+        self,
+        settings: SMTPSettings,
+        dry_run: bool = True,
+        dump_file: str | PurePath | None = None,
+        **kwargs,
+    ):
+        """
+
+        Args:
+            settings: SMTP server and credentials
+            dry_run:
+            dump_file: If dry run, dump into this file instead of printing
+            **kwargs: See `MailSender`
+        """
+        super().__init__(dry_run=dry_run, dump_file=dump_file, **kwargs)
+        self.settings = settings
+
+    def _connect(self) -> smtplib.SMTP:
+        s = self.settings
+        smtp: smtplib.SMTP
+        if s.security == "ssl":
+            smtp = smtplib.SMTP_SSL(
+                s.host, s.port, timeout=s.timeout, context=ssl.create_default_context()
+            )
+        else:
+            smtp = smtplib.SMTP(s.host, s.port, timeout=s.timeout)
+            if s.security == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+        if s.username is not None and s.password is not None:
+            smtp.login(s.username, s.password)
+        return smtp
+
+    def _deliver(self, smtp: smtplib.SMTP | None, mail: Email) -> smtplib.SMTP:
+        """Send an email, (re)connecting if needed. Returns the connection."""
+        message = mail.to_message(self.settings.from_address)
+        if smtp is not None:
+            try:
+                smtp.send_message(message)
+                return smtp
+            except smtplib.SMTPServerDisconnected:
+                # Servers close idle connections
+                logger.debug("Connection was closed, reconnecting")
+        smtp = self._connect()
+        smtp.send_message(message)
+        return smtp
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP | None) -> None:
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def _worker(
+        self,
+        todo: queue.Queue,
+        bucket: TokenBucket,
+        failed: list[tuple[Email, Exception]],
+    ) -> int:
+        """Send emails from `todo` over one connection until it yields None.
+        Returns the number of emails that this worker took.
+        """
+        smtp: smtplib.SMTP | None = None
+        n_taken = 0
+        try:
+            while (mail := todo.get()) is not None:
+                n_taken += 1
+                bucket.acquire()
+
+                def deliver(mail: Email = mail) -> None:
+                    nonlocal smtp
+                    try:
+                        smtp = self._deliver(smtp, mail)
+                    except smtplib.SMTPRecipientsRefused:
+                        # The connection can still be used
+                        raise
+                    except (smtplib.SMTPException, OSError):
+                        self._close(smtp)
+                        smtp = None
+                        raise
+
+                try:
+                    self.retry.call(deliver)
+                except (smtplib.SMTPException, OSError) as e:
+                    logger.error(f"Could not send email to {mail.to}: {e}")
+                    failed.append((mail, e))
+                else:
+                    self._delivered(mail)
+        finally:
+            self._close(smtp)
+        return n_taken
+
+    @staticmethod
+    def _put(todo: queue.Queue, item: Email | None, workers: list[Future]) -> None:
+        """Put `item` in the queue, waiting for a free place (but not forever if
+        all workers died)
+        """
+        while True:
+            try:
+                todo.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if all(w.done() for w in workers):
+                    for w in workers:
+                        w.result()
+                    raise RuntimeError("All workers stopped") from None
+
+    def _send(self, emails: Iterable[Email]) -> None:
+        n_workers = self.settings.connections
+        # Bounded, so that we only render a few emails ahead of sending them
+        todo: queue.Queue = queue.Queue(maxsize=2 * n_workers)
+        bucket = TokenBucket(self.settings.rate)
+        failed: list[tuple[Email, Exception]] = []
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            workers = [
+                executor.submit(self._worker, todo, bucket, failed)
+                for _ in range(n_workers)
+            ]
+            try:
+                for mail in emails:
+                    self._put(todo, mail, workers)
+            finally:
+                # Emails that are already queued are still sent if producing
+                # the remaining emails fails
+                for _ in workers:
+                    self._put(todo, None, workers)
+            n_emails = sum(w.result() for w in workers)
+        logger.info(f"Sent {n_emails - len(failed)} of {n_emails} emails")
+        if failed:
+            raise SendError(failed)
@@ -1,25 +1,167 @@
 from __future__ import annotations
 
+import contextlib
+import functools
+import json
 import pickle
 import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 import click
-import pandas as pd
-
-from meetupmatcher.config import Config
-from meetupmatcher.data import People
-from meetupmatcher.mails import YagmailSender
-from meetupmatcher.matcher import NoSolution, ProblemStatement, pair_up, solve_numeric
-from meetupmatcher.pseudorandom import get_rng_from_option
-from meetupmatcher.templating import EmailGenerator
+
+from meetupmatcher.instrumentation import PROFILERS, Profiler
 from meetupmatcher.util.log import logger
 
+if TYPE_CHECKING:
+    from meetupmatcher.config import Config
+    from meetupmatcher.mails import MailSender
+    from meetupmatcher.matcher import GroupSizePreferences, PairUpStatistics
+
+# Everything else is imported where it's needed: The CLI is often called just
+# to validate arguments or to show --help, and pandas, numpy, jinja2, yagmail,
+# etc. take much longer to import than that.
+
+
+def get_strategy_options(config: Config, name: str | None = None) -> tuple[str, dict]:
+    """Name and options of the matching strategy.
+
+    The config file can either specify the strategy by name
+    (``strategy: annealing``) or as a mapping with the name and options
+    (``strategy: {name: annealing, n_steps: 100000}``).
+
+    Args:
+        config: Config
+        name: Name of the strategy from the command line. If it differs from the
+            config file, the options from the config file are ignored.
+
+    Returns:
+        name, options
+    """
+    configured = config.get("strategy", "sampling")
+    if isinstance(configured, str):
+        configured = {"name": configured}
+    options = dict(configured)
+    configured_name = options.pop("name", "sampling")
+    if name is not None and name != configured_name:
+        return name, {}
+    return configured_name, options
+
+
+def get_group_size_preferences(config: Config) -> GroupSizePreferences | None:
+    """Allowed group sizes from the ``group_sizes`` mapping of the config file
+    (keys as in `GroupSizePreferences`). None if not configured.
+    """
+    configured = config.get("group_sizes")
+    if configured is None:
+        return None
+    from meetupmatcher.matcher import GroupSizePreferences
+
+    try:
+        return GroupSizePreferences(**configured)
+    except (TypeError, ValueError) as e:
+        raise click.BadParameter(
+            f"Invalid group_sizes in config file: {e}", param_hint="--config"
+        ) from e
+
+
+def matching_stats_format(path: str) -> str:
+    """Format of ``--matching-stats`` from the file extension: ``json`` (summary),
+    one of `TABLE_FORMATS` (cost of every trial), or ``pickle`` (everything else)
+    """
+    from meetupmatcher.export import table_format
+
+    if Path(path).suffix.lower() == ".json":
+        return "json"
+    try:
+        return table_format(path)
+    except ValueError:
+        return "pickle"
+
+
+def check_output_format(path: str, format: str, param_hint: str) -> None:
+    """Make sure that we can write `path` in `format` before spending time on the
+    matching
+    """
+    from meetupmatcher.export import check_parquet_engine
+
+    if format == "parquet":
+        try:
+            check_parquet_engine()
+        except ImportError as e:
+            raise click.BadParameter(f"{path}: {e}", param_hint=param_hint) from e
+
+
+def write_matching_stats(path: str, statistics: PairUpStatistics) -> None:
+    """Write the statistics of the matching in the format given by the file
+    extension (see `matching_stats_format`)
+    """
+    from meetupmatcher.export import cost_records, statistics_summary, write_records
+
+    format = matching_stats_format(path)
+    if format == "json":
+        Path(path).write_text(json.dumps(statistics_summary(statistics), indent=2))
+    elif format == "pickle":
+        with open(path, "wb") as f:
+            pickle.dump(statistics, f)
+    else:
+        write_records(path, cost_records(statistics), format)
+
+
+def get_mail_sender(
+    config: Config, dry_run: bool, dump_file: str | None = None, **kwargs
+) -> MailSender:
+    """`SMTPPoolSender` if an SMTP server is configured (in the ``smtp`` section of
+    the config file or with environment variables, see `SMTPSettings.from_config`),
+    `YagmailSender` otherwise. `kwargs` are passed on to the sender (see
+    `MailSender`).
+    """
+    from meetupmatcher.mails import SMTPPoolSender, SMTPSettings, YagmailSender
+
+    try:
+        settings = SMTPSettings.from_config(config.get("smtp"))
+    except (TypeError, ValueError) as e:
+        raise click.BadParameter(
+            f"Invalid smtp settings in config file: {e}", param_hint="--config"
+        ) from e
+    if settings is None:
+        return YagmailSender(dry_run, dump_file=dump_file, **kwargs)
+    return SMTPPoolSender(settings, dry_run, dump_file=dump_file, **kwargs)
+
 
 @click.command()
 @click.argument("inputfile")
 @click.option("-n", "--dry-run", is_flag=True, help="Don't send emails")
 @click.option("-c", "--config", help="Configuration file", default=None, type=str)
-@click.option("--matching-stats", help="Export statistics from matching process")
+@click.option(
+    "--matching-stats",
+    help="Export statistics from matching process: The cost of every trial to a "
+    ".jsonl or .parquet file, a summary to a .json file, or everything pickled to "
+    "any other file",
+)
+@click.option(
+    "--export-groups",
+    help="Export the groups (one record per participant) to a .jsonl or .parquet "
+    "file",
+)
+@click.option(
+    "--export-mails",
+    help="Also write the emails to this mbox file (if it ends with .mbox) or as "
+    ".eml files to this directory",
+)
+@click.option(
+    "--search-stats",
+    help="Export counters and timings of the matching search to this JSON file",
+)
+@click.option("--profile", help="Profile the matching and write the results here")
+@click.option(
+    "--profiler",
+    type=click.Choice(PROFILERS),
+    default="cprofile",
+    show_default=True,
+    help="Profiler for --profile: 'cprofile' writes pstats data, 'pyinstrument' "
+    "(a sampling profiler that needs to be installed) writes an HTML page",
+)
 @click.option(
     "-s",
     "--seed",
@@ -33,6 +175,98 @@ from meetupmatcher.util.log import logger
 @click.option(
     "-t", "--templates", help="Path to template directory", default=None, type=str
 )
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Run this many matching trials at once in lock-step (faster, but gives "
+    "different results than running them one by one; only for the sampling "
+    "strategy)",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used for matching and for writing emails. The groups "
+    "are deterministic for a given seed and number of processes, but the "
+    "statistics of the search (--matching-stats, --search-stats) are not.",
+)
+@click.option(
+    "--refine",
+    is_flag=True,
+    help="Improve the best matching by local search (swapping and moving people "
+    "between groups)",
+)
+@click.option(
+    "--strategy",
+    default=None,
+    help="Matching strategy: 'sampling' (default), 'annealing', 'exact', or "
+    "'sharded' (for very large numbers of people). Overrides the strategy from the "
+    "config file.",
+)
+@click.option(
+    "--time-limit",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="Stop matching after this many seconds and use the best matching so far",
+)
+@click.option(
+    "--checkpoint",
+    default=None,
+    help="Periodically save the state of the matching search to this file (only "
+    "for the sampling strategy)",
+)
+@click.option(
+    "--checkpoint-interval",
+    type=click.FloatRange(min=0),
+    default=60.0,
+    show_default=True,
+    help="Seconds between two checkpoints",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the matching search from the file given with --checkpoint (if "
+    "it exists). Gives the same result as an uninterrupted run.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Don't use the cache of prepared participant tables (by default, "
+    "unchanged input files are only parsed once; entries that weren't used for "
+    "30 days or that don't fit into 512 MB are removed)",
+)
+@click.option(
+    "--save-state",
+    "state_file",
+    default=None,
+    help="Save the groups (by email) to this file, so that they can be updated "
+    "with --rematch later",
+)
+@click.option(
+    "--rematch",
+    "rematch_from",
+    default=None,
+    help="Update the groups from this file (written by --save-state) after people "
+    "joined or dropped out. Groups that are not affected are kept and only "
+    "affected people are notified.",
+)
+@click.option(
+    "--journal",
+    default=None,
+    help="Record delivered emails in this file (SQLite). The groups are saved next "
+    "to it, and when sending again for the same seed (e.g., after a failure), "
+    "these groups are used and emails that were already delivered are skipped.",
+)
+@click.option(
+    "--history",
+    default=None,
+    help="File with the groups of past rounds. Repeated groupings are avoided, and "
+    "the groups of this round are added unless this is a dry run (only for the "
+    "sampling strategy).",
+)
 def main(
     inputfile: str,
     dry_run: bool,
@@ -41,36 +275,234 @@ def main(
     templates: str,
     matching_stats="",
     dump_mails="",
+    batch_size: int | None = None,
+    jobs: int = 1,
+    refine: bool = False,
+    strategy: str | None = None,
+    time_limit: float | None = None,
+    checkpoint: str | None = None,
+    checkpoint_interval: float = 60.0,
+    resume: bool = False,
+    no_cache: bool = False,
+    state_file: str | None = None,
+    rematch_from: str | None = None,
+    history: str | None = None,
+    journal: str | None = None,
+    search_stats: str | None = None,
+    profile: str | None = None,
+    profiler: str = "cprofile",
+    export_groups: str | None = None,
+    export_mails: str | None = None,
 ) -> None:
+    from meetupmatcher.cache import get_cache_dir, load_people
+    from meetupmatcher.checkpoint import load_checkpoint, save_checkpoint
+    from meetupmatcher.config import Config
+    from meetupmatcher.export import (
+        MailArchive,
+        group_records,
+        table_format,
+        write_records,
+    )
+    from meetupmatcher.history import MatchHistory
+    from meetupmatcher.journal import SendJournal, groups_path
+    from meetupmatcher.localsearch import refine as refine_solution
+    from meetupmatcher.mails import SMTPPoolSender
+    from meetupmatcher.matcher import (
+        NoSolution,
+        ProblemStatement,
+        get_strategy,
+        solve_numeric,
+    )
+    from meetupmatcher.pseudorandom import get_rng_from_option, get_seed_from_option
+    from meetupmatcher.rematch import (
+        MatchState,
+        compare,
+        load_state,
+        rematch,
+        save_state,
+    )
+    from meetupmatcher.templating import EmailGenerator
+
+    # Check the output formats before spending time on the matching
+    if export_groups:
+        try:
+            export_format = table_format(export_groups)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--export-groups") from e
+        check_output_format(export_groups, export_format, "--export-groups")
+    if matching_stats:
+        check_output_format(
+            matching_stats, matching_stats_format(matching_stats), "--matching-stats"
+        )
     rng = get_rng_from_option(seed)
+    round_id = str(get_seed_from_option(seed))
+    journal_groups = None
+    if journal and not dry_run:
+        journal_groups = groups_path(journal, round_id)
     logger.debug(f"Reading from {inputfile}")
-    people = People(pd.read_csv(inputfile), config=Config(config))
+    cfg = Config(config)
+    people = load_people(inputfile, cfg, use_cache=not no_cache)
+    availabilities = people.store.packed
+    preferences = get_group_size_preferences(cfg)
+    strategy_name, strategy_options = get_strategy_options(cfg, strategy)
+    if strategy_name == "sampling":
+        strategy_options.setdefault("batch_size", batch_size)
+        strategy_options.setdefault("workers", jobs)
+    elif batch_size is not None:
+        raise click.BadParameter(
+            "Only supported for the sampling strategy", param_hint="--batch-size"
+        )
+    elif strategy_name == "sharded":
+        strategy_options.setdefault("workers", jobs)
+        strategy_options.setdefault("preferences", preferences)
+    if time_limit is not None:
+        strategy_options["time_budget"] = time_limit
+    if checkpoint:
+        if strategy_name != "sampling":
+            raise click.BadParameter(
+                "Only supported for the sampling strategy", param_hint="--checkpoint"
+            )
+        strategy_options["on_checkpoint"] = functools.partial(
+            save_checkpoint, checkpoint
+        )
+        strategy_options["checkpoint_interval"] = checkpoint_interval
+        if resume and Path(checkpoint).is_file():
+            strategy_options["resume_from"] = load_checkpoint(checkpoint)
+        elif resume:
+            logger.warning(f"No checkpoint at {checkpoint}, starting from scratch")
+    elif resume:
+        raise click.BadParameter("Requires --checkpoint", param_hint="--resume")
+    match_history = None
+    if history:
+        if strategy_name != "sampling":
+            raise click.BadParameter(
+                "Only supported for the sampling strategy", param_hint="--history"
+            )
+        if rematch_from:
+            raise click.BadParameter(
+                "Can't be combined with --rematch", param_hint="--history"
+            )
+        match_history = MatchHistory()
+        if Path(history).is_file():
+            match_history = MatchHistory.load(history)
+        strategy_options["met"] = match_history.met(
+            people.store.column("email").tolist()
+        )
+        logger.info(
+            f"Loaded {len(match_history)} pairs from {match_history.n_rounds} past "
+            f"rounds"
+        )
     try:
-        solution = solve_numeric(ProblemStatement(len(people), people.df.notwo.sum()))
-    except NoSolution as e:
-        logger.critical(f"No solution could be found: {e}")
-        sys.exit(1)
-    logger.info(f"Solution: {solution}")
-    if people._availability_product_cols:
-        availabilities = people.df[people._availability_product_cols].to_numpy()
+        matching_strategy = get_strategy(strategy_name, **strategy_options)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--strategy") from e
+    if profile:
+        try:
+            profiling: Profiler | contextlib.nullcontext = Profiler(profile, profiler)
+        except ImportError as e:
+            raise click.BadParameter(str(e), param_hint="--profiler") from e
     else:
-        availabilities = None
-    paired_up, statistics = pair_up(
-        solution,
-        people.df.index.to_numpy(),
-        people.df.notwo.to_numpy(),
-        availabilities=availabilities,
-        rng=rng,
-    )
-    logger.info(f"Best cost function: {statistics.best}")
-    if matching_stats:
-        with open(matching_stats, "wb") as f:
-            pickle.dump(statistics, f)
+        profiling = contextlib.nullcontext()
+    with profiling:
+        if journal_groups is not None and journal_groups.is_file():
+            logger.info(
+                f"Sending the groups from {journal_groups} again (delete it to "
+                f"match from scratch)"
+            )
+            paired_up = rematch(
+                load_state(journal_groups),
+                people,
+                matching_strategy,
+                rng=rng,
+                preferences=preferences,
+            ).result
+            to_notify = paired_up
+            if rematch_from:
+                to_notify = compare(
+                    load_state(rematch_from), paired_up, people
+                ).notifications()
+            statistics = None
+        elif rematch_from:
+            if refine:
+                raise click.BadParameter(
+                    "Can't be combined with --rematch", param_hint="--refine"
+                )
+            update = rematch(
+                load_state(rematch_from),
+                people,
+                matching_strategy,
+                rng=rng,
+                preferences=preferences,
+            )
+            paired_up = update.result
+            to_notify = update.notifications()
+            statistics = None
+        else:
+            try:
+                solution = solve_numeric(
+                    ProblemStatement(len(people), people.notwo.sum()), preferences
+                )
+            except NoSolution as e:
+                logger.critical(f"No solution could be found: {e}")
+                sys.exit(1)
+            logger.info(f"Solution: {solution}")
+            paired_up, statistics = matching_strategy.run(
+                solution,
+                people.ids,
+                people.notwo,
+                availabilities=availabilities,
+                rng=rng,
+            )
+            logger.info(f"Best cost function: {statistics.best}")
+            if refine:
+                paired_up = refine_solution(
+                    paired_up,
+                    people.ids,
+                    people.notwo,
+                    availabilities=availabilities,
+                    met=strategy_options.get("met"),
+                )
+            to_notify = paired_up
+    if journal_groups is not None and not journal_groups.is_file():
+        save_state(journal_groups, MatchState.from_result(paired_up, people))
+    if profile:
+        logger.info(f"Wrote profile to {profile}")
+    if matching_stats and statistics is not None:
+        write_matching_stats(matching_stats, statistics)
+    if export_groups:
+        n_records = write_records(
+            export_groups, group_records(paired_up, people), export_format
+        )
+        logger.info(f"Exported {n_records} participants to {export_groups}")
+    if search_stats:
+        data = {} if statistics is None else statistics.to_dict()
+        if isinstance(profiling, Profiler):
+            data["profile"] = profiling.top()
+        Path(search_stats).write_text(json.dumps(data, indent=2))
+    if state_file:
+        save_state(state_file, MatchState.from_result(paired_up, people))
     logger.debug(paired_up)
-    mails = list(
-        EmailGenerator(template_path=templates).generate_emails(people, paired_up)
-    )
-    YagmailSender(dry_run, dump_file=dump_mails).send(mails)
+    # Emails are rendered while they are sent
+    mails = EmailGenerator(
+        template_path=templates,
+        bytecode_cache=None if no_cache else get_cache_dir() / "templates",
+    ).generate_emails(people, to_notify, workers=jobs)
+    sender = get_mail_sender(cfg, dry_run, dump_mails, round_id=round_id)
+    with contextlib.ExitStack() as stack:
+        if journal and not dry_run:
+            sender.journal = stack.enter_context(SendJournal(journal))
+        if export_mails:
+            from_address = None
+            if isinstance(sender, SMTPPoolSender):
+                from_address = sender.settings.from_address
+            archive = stack.enter_context(
+                MailArchive(export_mails, from_address=from_address)
+            )
+            mails = archive.tee(mails)
+        sender.send(mails)
+    if match_history is not None and history and not dry_run:
+        match_history.add_round(MatchState.from_result(paired_up, people).groups)
+        match_history.save(history)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,30 @@
 from __future__ import annotations
 
+import copy
 import dataclasses
+import functools
+import hashlib
+import multiprocessing
 import os
 import timeit
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 
 import numpy as np
 import pandas as pd
 
+from meetupmatcher.bitset import PackedAvailabilities, popcount, unpack
+from meetupmatcher.instrumentation import SearchCounters
+from meetupmatcher.precompute import PairIndex
+from meetupmatcher.pseudorandom import spawn_rngs
 from meetupmatcher.util.log import logger
 
+#: Supported implementations of the sampling step, see `pair_up`
+ENGINES = ("array", "bitset")
+
 
 class NoSolution(Exception):
     pass
@@ -40,8 +55,8 @@ class ProblemStatement:
 class SolutionNumbers:
     """Number of groups and similar information"""
 
-    #: Number of groups of two, three, four
-    partitions: tuple[int, int, int]
+    #: Number of groups of two, three, four, ... people
+    partitions: tuple[int, ...]
     #: Number of people that needed to be removed
     removed: int = 0
 
@@ -49,56 +64,214 @@ class SolutionNumbers:
     def n_people(self) -> int:
         """Total number of people"""
         return (
-            2 * self.partitions[0]
-            + 3 * self.partitions[1]
-            + 4 * self.partitions[2]
+            sum((i + 2) * n_groups for i, n_groups in enumerate(self.partitions))
             + self.removed
         )
 
 
-def _solve_numeric(ps: ProblemStatement) -> SolutionNumbers:
-    if ps.n_people < 2:
-        raise TooFewPeople
-    elif ps.n_people == 2:
-        if ps.n_notwo:
-            raise TooFewPeople
-        else:
-            return SolutionNumbers((1, 0, 0))
-    elif ps.n_people == 3:
-        return SolutionNumbers((0, 1, 0))
-    elif ps.n_people == 4:
-        return SolutionNumbers((0, 0, 1))
-    elif ps.n_people == 5:
-        if ps.n_notwo <= 3:
-            return SolutionNumbers((1, 1, 0))
-        else:
-            return SolutionNumbers((0, 0, 1), removed=1)
-    elif ps.n_people == 6:
-        return SolutionNumbers((0, 2, 0))
-    elif ps.n_people == 7:
-        return SolutionNumbers((0, 1, 1))
-    elif ps.n_people == 8:
-        return SolutionNumbers((0, 0, 2))
-    else:
-        s = _solve_numeric(ProblemStatement(ps.n_people - 3, max(0, ps.n_notwo - 3)))
-        assert s.removed == 0
-        return SolutionNumbers((s.partitions[0], s.partitions[1] + 1, s.partitions[2]))
+@dataclass(frozen=True)
+class GroupSizePreferences:
+    """Which group sizes `solve_numeric` should use"""
+
+    #: As many groups as possible have this size
+    preferred: int = 3
+    #: Smallest allowed group size
+    min_size: int = 2
+    #: Largest allowed group size
+    max_size: int = 4
+    #: Maximal number of groups that are larger than the preferred size (None for
+    #: no limit)
+    max_larger_groups: int | None = None
+
+    def __post_init__(self):
+        if not 2 <= self.min_size <= self.preferred <= self.max_size:
+            raise ValueError(
+                "Group sizes must satisfy 2 <= min_size <= preferred <= max_size"
+            )
+        if self.preferred < 3:
+            raise ValueError("Preferred group size must be at least 3")
+
+
+DEFAULT_PREFERENCES = GroupSizePreferences()
+
+
+def _compositions(
+    n_people: int, sizes: tuple[int, ...]
+) -> Iterator[tuple[tuple[int, ...], int]]:
+    """All ways to form groups of the given sizes from at most `n_people` people
+
+    Yields:
+        Number of groups of every size, number of people left over
+    """
+    if not sizes:
+        yield (), n_people
+        return
+    size, rest = sizes[0], sizes[1:]
+    for n_groups in range(n_people // size + 1):
+        for counts, left in _compositions(n_people - n_groups * size, rest):
+            yield (n_groups, *counts), left
+
+
+@functools.lru_cache(maxsize=None)
+def _solve_tail(
+    n_people: int, max_pairs: int, preferences: GroupSizePreferences
+) -> SolutionNumbers | None:
+    """Best split of a small number of people into groups, see `solve_numeric`.
+
+    Args:
+        n_people: Number of people
+        max_pairs: Maximal number of groups of two (every group of two needs two
+            people without a veto)
+        preferences: Allowed group sizes
 
+    Returns:
+        None if no group can be formed
+    """
+    p = preferences.preferred
+    sizes = tuple(range(preferences.min_size, preferences.max_size + 1))
+    best_score = None
+    best = None
+    for counts, removed in _compositions(n_people, sizes):
+        by_size = dict(zip(sizes, counts))
+        if by_size.get(2, 0) > max_pairs or not any(counts):
+            continue
+        larger = {size: n for size, n in by_size.items() if size > p and n}
+        if (
+            preferences.max_larger_groups is not None
+            and sum(larger.values()) > preferences.max_larger_groups
+        ):
+            continue
+        # Remove as few people as possible, then prefer few people missing in
+        # smaller groups over few extra people in larger groups, then groups that
+        # are as even as possible
+        score = (
+            removed,
+            sum((p - size) * n for size, n in by_size.items() if size < p),
+            sum((size - p) * n for size, n in larger.items()),
+            max(larger, default=0),
+        )
+        if best_score is None or score < best_score:
+            best_score = score
+            partitions = [0] * (preferences.max_size - 1)
+            for size, n in by_size.items():
+                partitions[size - 2] = n
+            best = SolutionNumbers(tuple(partitions), removed=removed)
+    return best
 
-def solve_numeric(ps: ProblemStatement) -> SolutionNumbers:
-    s = _solve_numeric(ps)
+
+def solve_numeric(
+    ps: ProblemStatement, preferences: GroupSizePreferences | None = None
+) -> SolutionNumbers:
+    """Determine the number of groups of each size.
+
+    As many people as possible are put into groups, and as many groups as possible
+    have the preferred size. The remaining people are preferably distributed over
+    larger groups rather than forming smaller groups. Groups of two can only be
+    formed from people without a veto.
+
+    Only a bounded number of groups can deviate from the preferred size, so all
+    but a small "tail" of people are put into groups of the preferred size right
+    away and only the split of the tail is optimized (and cached), which takes
+    constant time for any number of people.
+
+    Args:
+        ps: Number of people and of people who veto groups of two
+        preferences: Allowed group sizes (default: groups of two to four people,
+            preferably three)
+
+    Returns:
+        SolutionNumbers. ``partitions[i]`` is the number of groups of ``i + 2``
+        people.
+    """
+    if preferences is None:
+        preferences = DEFAULT_PREFERENCES
+    p = preferences.preferred
+    if ps.n_people < preferences.min_size:
+        raise TooFewPeople
+    # Enough people in the tail so that it can contain all groups that deviate
+    # from the preferred size
+    n_bulk = max(0, ps.n_people // p - (preferences.max_size + 1))
+    n_tail = ps.n_people - n_bulk * p
+    max_pairs = (ps.n_people - ps.n_notwo) // 2
+    s = _solve_tail(n_tail, min(max_pairs, n_tail // 2), preferences)
+    if s is None:
+        raise TooFewPeople
+    partitions = list(s.partitions)
+    partitions[p - 2] += n_bulk
+    s = SolutionNumbers(tuple(partitions), removed=s.removed)
     assert s.n_people == ps.n_people
     return s
 
 
 def lexicographic_greater(a: np.ndarray, b: np.ndarray) -> bool:
     """Return True if a is lexicographically greater than b"""
-    # Numpy 2.0 will likely have a fast "first nonzero" function, see
-    # https://github.com/numpy/numpy/issues/2269
-    if (a == b).all():
-        return False
-    idx = np.where(a != b)[0][0]
-    return a[idx] > b[idx]
+    # Comparing lists is done in C and does not allocate temporary arrays
+    return a.tolist() > b.tolist()
+
+
+class CostEncoder:
+    """Encodes cost vectors as integer keys, so that comparing keys is the same as
+    comparing the cost vectors lexicographically.
+
+    Every entry of a cost vector is at most the number of people, so we can
+    interpret the entries as the digits of a number with base ``n_people + 1``
+    (the first entry being the most significant digit). Adding a group with ``j``
+    joint availabilities to a cost vector adds ``units[j]`` to its key.
+    """
+
+    def __init__(self, length: int, n_people: int):
+        """
+
+        Args:
+            length: Length of the cost vectors (maximal availability + 1)
+            n_people: Number of people
+        """
+        self.length = length
+        self.radix = n_people + 1
+        #: Key of the cost vector that is one at index j and zero elsewhere
+        self.units = [self.radix ** (length - 1 - j) for j in range(length)]
+
+    def encode(self, cost: np.ndarray) -> int:
+        key = 0
+        for count in cost.tolist():
+            key = key * self.radix + count
+        return key
+
+    def decode(self, key: int) -> np.ndarray:
+        cost = np.zeros(self.length, dtype=int)
+        for j in reversed(range(self.length)):
+            key, cost[j] = divmod(key, self.radix)
+        return cost
+
+
+@dataclass(frozen=True)
+class SamplingWeights:
+    """Parameters of the heuristic probabilities with which people are added to
+    groups (see `sample`)
+    """
+
+    #: This limits the probability boost for joint availabilities.
+    max_joint_av_boon: int = 5
+    #: The lower this parameter, the more we punish people with many availabilities
+    #: being assigned to a group where the joint availability does not profit from
+    #: it
+    wasted_resource_offset: int = 3
+    #: Factor for the probability of adding somebody who was already in a group
+    #: with one of the members (only if a history of past groups is given, see
+    #: `meetupmatcher.history`). 0 forbids repeated pairs.
+    repeat_weight: float = 0.1
+
+
+DEFAULT_WEIGHTS = SamplingWeights()
+
+
+def _choice(rng: np.random.Generator, p: np.ndarray) -> int:
+    """Equivalent to ``rng.choice(len(p), p=p)`` (and consuming the same random
+    numbers), but without the overhead of validating the probabilities.
+    """
+    cdf = p.cumsum()
+    cdf /= cdf[-1]
+    return int(cdf.searchsorted(rng.random(), side="right"))
 
 
 def sample(
@@ -109,6 +282,8 @@ def sample(
     rng: np.random.Generator | None = None,
     max_joint_av_boon=5,
     wasted_resource_offset=3,
+    met: np.ndarray | None = None,
+    repeat_weight=0.1,
 ) -> tuple[np.ndarray, int]:
     """Put people in a group of fixed size in a way that helps to maximize the number
     of joint availabilities of each group in the ent.
@@ -122,6 +297,10 @@ def sample(
         wasted_resource_offset: The lower this parameter, the more we punish people with
             many availabilities being assigned to a group where the joint availability
             does not "profit from it"
+        met: Boolean array of n_people x n_people: Who was in a group with whom
+            before
+        repeat_weight: Factor for the probability of adding somebody who was in a
+            group with one of the members before
 
     Returns:
         Set of indices of people belonging into group, joint availabilities
@@ -153,6 +332,8 @@ def sample(
     group.append(idx_first_person)
     mask[idx_first_person] = False
     availabilities = update_availabilities_with_mask(availabilities, mask)
+    # Who was in a group with one of the members before
+    repeat = None if met is None else met[idx_first_person].copy()
     n -= 1
     assert n >= 1
     for _ in range(n):
@@ -164,6 +345,8 @@ def sample(
         probs = np.minimum(max_joint_av_boon, joint_av_sums) / (
             wasted_resource_offset + av_sums
         )
+        if repeat is not None:
+            probs[repeat] *= repeat_weight
         if probs.sum() == 0:
             raise IncompatibleAvailabilities
         probs /= probs.sum()
@@ -172,9 +355,110 @@ def sample(
         mask[idx_next_person] = False
         availabilities = update_availabilities_with_mask(availabilities, mask)
         group.append(idx_next_person)
+        if repeat is not None:
+            assert met is not None
+            repeat |= met[idx_next_person]
     return np.array(group), base_availability.sum()
 
 
+def sample_packed(
+    mask: np.ndarray,
+    n: int,
+    packed: PackedAvailabilities,
+    *,
+    rng: np.random.Generator | None = None,
+    max_joint_av_boon=5,
+    wasted_resource_offset=3,
+    met: np.ndarray | None = None,
+    repeat_weight=0.1,
+) -> tuple[np.ndarray, int]:
+    """Same as `sample`, but operating on availabilities that are packed into
+    bitsets. The joint availability of the group is kept as a single bitset and
+    the joint availabilities with all other people are obtained by AND and
+    popcount. For the same random number generator state, the result is identical
+    to the one of `sample`.
+
+    If `packed.pairs` is set, the second member is drawn based on the precomputed
+    pairwise joint availabilities, and only people who are compatible with all
+    members so far are considered for the following members.
+
+    Args:
+        mask: Boolean array: Who can still be assigned to a group
+        n: Sample/group size
+        packed: Packed availabilities of all people
+        rng:
+        max_joint_av_boon: See `sample`
+        wasted_resource_offset: See `sample`
+        met: See `sample`
+        repeat_weight: See `sample`
+
+    Returns:
+        Set of indices of people belonging into group, joint availabilities
+    """
+    if n == 0:
+        return np.array([], dtype="int"), 0
+    if rng is None:
+        rng = np.random.default_rng()
+    group = []
+    mask = mask.astype(bool)
+    av_sums = np.where(mask, packed.counts, 0)
+    nonzero_av_mask = av_sums > 0
+    if not nonzero_av_mask.any():
+        raise IncompatibleAvailabilities(
+            "Only zero availabilities left, cannot assign people to group"
+        )
+    lowest_availability = av_sums[nonzero_av_mask].min()
+    idx_lowest_availabilities = (av_sums == lowest_availability).nonzero()[0]
+    idx_first_person = rng.choice(idx_lowest_availabilities)
+    assert mask[idx_first_person]
+    base_availability = packed.words[idx_first_person].copy()
+    group.append(idx_first_person)
+    mask[idx_first_person] = False
+    av_sums[idx_first_person] = 0
+    pairs = packed.pairs
+    # Only people who are compatible with everyone in the group so far
+    candidates: np.ndarray | None = None
+    # Who was in a group with one of the members before
+    repeat = None if met is None else met[idx_first_person].copy()
+    n -= 1
+    assert n >= 1
+    for _ in range(n):
+        if not mask.any():
+            raise IncompatibleAvailabilities("Mask is all False.")
+        if pairs is None:
+            joint_av_sums = packed.overlap_counts(base_availability) * mask
+        elif candidates is None:
+            joint_av_sums = pairs.counts[idx_first_person].astype(np.int64) * mask
+            candidates = joint_av_sums.nonzero()[0]
+        else:
+            candidates = candidates[mask[candidates]]
+            joint_av_sums = np.zeros(len(mask), dtype=np.int64)
+            joint_av_sums[candidates] = packed.overlap_counts_of(
+                base_availability, candidates
+            )
+            candidates = candidates[joint_av_sums[candidates] > 0]
+        if candidates is not None and not len(candidates):
+            raise IncompatibleAvailabilities
+        probs = np.minimum(max_joint_av_boon, joint_av_sums) / (
+            wasted_resource_offset + av_sums
+        )
+        if repeat is not None:
+            probs[repeat] *= repeat_weight
+        probs_sum = probs.sum()
+        if probs_sum == 0:
+            raise IncompatibleAvailabilities
+        probs /= probs_sum
+        idx_next_person = _choice(rng, probs)
+        base_availability &= packed.words[idx_next_person]
+        mask[idx_next_person] = False
+        av_sums[idx_next_person] = 0
+        group.append(idx_next_person)
+        if repeat is not None:
+            assert met is not None
+            repeat |= met[idx_next_person]
+    return np.array(group), int(popcount(base_availability))
+
+
 @dataclass
 class PairUpResult:
     """Concrete solution that matched people to groups"""
@@ -215,9 +499,13 @@ def _pair_up(
     idx: np.ndarray,
     notwo: np.ndarray,
     best_cost: np.ndarray,
-    availabilities: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
     *,
     rng: np.random.Generator | None = None,
+    weights: SamplingWeights = DEFAULT_WEIGHTS,
+    encoder: CostEncoder | None = None,
+    met: np.ndarray | None = None,
+    counters: SearchCounters | None = None,
 ) -> PairUpResult | None:
     """Single trial of pairing up people.
 
@@ -226,8 +514,17 @@ def _pair_up(
         idx:
         notwo: Boolean array: Who vetoes to be in a group of only two-people
         best_cost: Minimal objective function so far
-        availabilities: Boolean array of n_people x n_timeslots
+        availabilities: Boolean array of n_people x n_timeslots or the same
+            information packed into bitsets (in which case `sample_packed` is
+            used instead of `sample`)
         rng: Random number generator
+        weights: Parameters of the sampling probabilities
+        encoder: Used to compare the cost with `best_cost`
+        met: Boolean array of n_people x n_people: Who was in a group with whom
+            before. Groups with such a pair count as groups without joint
+            availabilities in the objective function.
+        counters: If given, the time spent sampling and comparing costs and the
+            group after which the trial was aborted are recorded here
 
     Returns:
         None if we abort early because the current solution is worse than the best
@@ -235,26 +532,61 @@ def _pair_up(
     assert sn.n_people == len(idx) == len(notwo)
     mask = np.full_like(idx, True)
     segmentation = []
+    # Positions of the members of every group (`segmentation` holds indices)
+    group_positions = []
     removed_idxs, _ = sample(mask, n=sn.removed, rng=rng)
     removed = set(idx[removed_idxs])
     mask[removed_idxs] = False
+    if encoder is None:
+        encoder = CostEncoder(len(best_cost), sn.n_people)
+    best_key = encoder.encode(best_cost)
+    units = encoder.units
     cost = np.zeros_like(best_cost)
     cost[0] += sn.removed
-    for i in range(3):
+    key = sn.removed * units[0]
+    timer = timeit.default_timer
+    t_start = timer() if counters is not None else 0.0
+    for i, n_groups in enumerate(sn.partitions):
         group_size = i + 2
-        n_groups = sn.partitions[i]
-
         for _ in range(n_groups):
             this_mask = mask.copy()
             if group_size == 2:
                 this_mask[notwo] = False
-            new_group_idx, n_joint_availabilities = sample(
-                this_mask, availabilities=availabilities, n=group_size, rng=rng
-            )
+            if isinstance(availabilities, PackedAvailabilities):
+                new_group_idx, n_joint_availabilities = sample_packed(
+                    this_mask,
+                    n=group_size,
+                    packed=availabilities,
+                    rng=rng,
+                    met=met,
+                    **dataclasses.asdict(weights),
+                )
+            else:
+                new_group_idx, n_joint_availabilities = sample(
+                    this_mask,
+                    availabilities=availabilities,
+                    n=group_size,
+                    rng=rng,
+                    met=met,
+                    **dataclasses.asdict(weights),
+                )
+            if counters is not None:
+                t_sampled = timer()
+                counters.time_sampling += t_sampled - t_start
+            if met is not None and met[np.ix_(new_group_idx, new_group_idx)].any():
+                n_joint_availabilities = 0
             mask[new_group_idx] = False
             segmentation.append(set(idx[new_group_idx]))
+            group_positions.append(new_group_idx)
             cost[n_joint_availabilities] += 1
-            if lexicographic_greater(cost, best_cost):
+            key += units[n_joint_availabilities]
+            aborted = key > best_key
+            if counters is not None:
+                t_start = timer()
+                counters.time_cost += t_start - t_sampled
+                if aborted:
+                    counters.aborts_by_group[len(group_positions) - 1] += 1
+            if aborted:
                 # Abort early
                 return None
 
@@ -262,9 +594,14 @@ def _pair_up(
     assert removed | set.union(*segmentation) == set(idx)
 
     joint_availabilities: None | np.ndarray = None
-    if availabilities is not None:
+    if isinstance(availabilities, PackedAvailabilities):
+        joint_availabilities = unpack(
+            np.array([availabilities.joint(group) for group in group_positions]),
+            availabilities.n_timeslots,
+        )
+    elif availabilities is not None:
         joint_availabilities = np.array(
-            [np.all(availabilities[list(group)], axis=0) for group in segmentation]
+            [np.all(availabilities[group], axis=0) for group in group_positions]
         )
 
     return PairUpResult(
@@ -272,6 +609,443 @@ def _pair_up(
     )
 
 
+_ALL_ONES = np.iinfo(np.uint64).max
+
+
+def _lexicographic_greater_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Row-wise `lexicographic_greater` of a 2D array `a` and a 1D array `b`"""
+    diff = a - b
+    nonzero = diff != 0
+    first = nonzero.argmax(axis=1)
+    return nonzero.any(axis=1) & (diff[np.arange(len(a)), first] > 0)
+
+
+def _draw_rows(
+    weights: np.ndarray, uniforms: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorized inverse CDF sampling: Draw one column index for every row of
+    `weights` (which do not need to be normalized).
+
+    Returns:
+        Drawn indices, boolean array marking rows whose weights are all zero (the
+        drawn index is meaningless for these rows)
+    """
+    n_rows, n_cols = weights.shape
+    cdf = weights.cumsum(axis=1)
+    totals = cdf[:, -1].copy()
+    empty = totals == 0
+    totals[empty] = 1
+    # Normalize every row to [0, 1] and shift it by its row number, so that we can
+    # do a single search over the flattened array
+    offsets = np.arange(n_rows)
+    cdf /= totals[:, None]
+    cdf += offsets[:, None]
+    chosen = cdf.ravel().searchsorted(uniforms + offsets, side="right")
+    chosen -= offsets * n_cols
+    np.clip(chosen, 0, n_cols - 1, out=chosen)
+    # Guard against rounding errors putting us on an entry of weight zero
+    bad = (weights[offsets, chosen] == 0) & ~empty
+    if bad.any():
+        chosen[bad] = n_cols - 1 - (weights[bad, ::-1] > 0).argmax(axis=1)
+    return chosen, empty
+
+
+def _pair_up_batch(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray,
+    best_cost: np.ndarray,
+    packed: PackedAvailabilities,
+    *,
+    rng: np.random.Generator,
+    batch_size: int,
+    weights: SamplingWeights = DEFAULT_WEIGHTS,
+    met: np.ndarray | None = None,
+    counters: SearchCounters | None = None,
+) -> tuple[list[PairUpResult | None], np.ndarray]:
+    """Run `batch_size` independent trials of `_pair_up` in lock-step.
+
+    All trials share the same schedule of group sizes, so the next member of every
+    running trial is drawn at once from a `batch_size` x `n_people` array of
+    (unnormalized) probabilities, which are the same as in `sample`. Trials are
+    dropped from the batch as soon as they fail or are worse than `best_cost`.
+    Exactly one uniform random number per person and trial is drawn, regardless of
+    how many trials are dropped.
+
+    Args:
+        sn: SolutionNumbers, specifying the number of groups of each size
+        idx:
+        notwo: Boolean array: Who vetoes to be in a group of only two-people
+        best_cost: Minimal objective function so far
+        packed: Packed availabilities
+        rng: Random number generator
+        batch_size: Number of trials
+        weights: Parameters of the sampling probabilities
+        met: See `_pair_up`
+        counters: See `_pair_up`
+
+    Returns:
+        List with a `PairUpResult` for every completed trial and None for every
+        trial that was aborted early, boolean array marking the trials that failed
+        (i.e., raised `NoSolution` in `_pair_up`)
+    """
+    n_people = len(idx)
+    assert sn.n_people == n_people == len(notwo)
+    uniforms = rng.random((batch_size, n_people))
+    masks = np.full((batch_size, n_people), True)
+    # Members of each trial in the order in which they were drawn
+    members = np.empty((batch_size, n_people), dtype=np.intp)
+    group_words = np.empty(
+        (batch_size, sum(sn.partitions), packed.words.shape[1]), dtype=np.uint64
+    )
+    costs = np.zeros((batch_size, len(best_cost)), dtype=best_cost.dtype)
+    costs[:, 0] += sn.removed
+    failed = np.full(batch_size, False)
+    # Trials that are still running
+    rows = np.arange(batch_size)
+    i_draw = 0
+    for _ in range(sn.removed):
+        chosen, _empty = _draw_rows(masks.astype(float), uniforms[:, i_draw])
+        masks[rows, chosen] = False
+        members[rows, i_draw] = chosen
+        i_draw += 1
+    no_availability = np.iinfo(packed.counts.dtype).max
+    timer = timeit.default_timer
+    i_group = 0
+    for i, n_groups in enumerate(sn.partitions):
+        group_size = i + 2
+        for _ in range(n_groups):
+            if len(rows) == 0:
+                break
+            if counters is not None:
+                t_start = timer()
+            allowed = masks[rows]
+            if group_size == 2:
+                allowed &= ~notwo
+            av_sums = np.where(allowed, packed.counts, 0)
+            lowest = np.where(av_sums > 0, av_sums, no_availability).min(axis=1)
+            probs = (av_sums == lowest[:, None]).astype(float)
+            base = np.full(
+                (len(rows), packed.words.shape[1]), _ALL_ONES, dtype=np.uint64
+            )
+            # First member of every trial's group
+            first = np.zeros(len(rows), dtype=np.intp)
+            # Who was in a group with one of the members before, and whether this
+            # group contains such a pair
+            repeat = np.full((len(rows), n_people), False)
+            has_repeat = np.full(len(rows), False)
+            for i_member in range(group_size):
+                if i_member == 1 and packed.pairs is not None:
+                    joint_av_sums = packed.pairs.counts[first].astype(np.int64)
+                    joint_av_sums *= allowed
+                elif i_member > 0:
+                    joint_av_sums = packed.overlap_counts(base) * allowed
+                if i_member > 0:
+                    probs = np.minimum(weights.max_joint_av_boon, joint_av_sums) / (
+                        weights.wasted_resource_offset + av_sums
+                    )
+                    if met is not None:
+                        probs[repeat] *= weights.repeat_weight
+                chosen, empty = _draw_rows(probs, uniforms[rows, i_draw])
+                if empty.any():
+                    failed[rows[empty]] = True
+                    keep = ~empty
+                    rows, chosen, base = rows[keep], chosen[keep], base[keep]
+                    allowed, av_sums = allowed[keep], av_sums[keep]
+                    first = first[keep]
+                    repeat, has_repeat = repeat[keep], has_repeat[keep]
+                if i_member == 0:
+                    first = chosen
+                base &= packed.words[chosen]
+                local_rows = np.arange(len(rows))
+                allowed[local_rows, chosen] = False
+                av_sums[local_rows, chosen] = 0
+                if met is not None:
+                    has_repeat |= repeat[local_rows, chosen]
+                    repeat |= met[chosen]
+                masks[rows, chosen] = False
+                members[rows, i_draw] = chosen
+                i_draw += 1
+            if len(rows) == 0:
+                break
+            if counters is not None:
+                t_sampled = timer()
+                counters.time_sampling += t_sampled - t_start
+            group_words[rows, i_group] = base
+            costs[rows, np.where(has_repeat, 0, popcount(base))] += 1
+            n_running = len(rows)
+            rows = rows[~_lexicographic_greater_rows(costs[rows], best_cost)]
+            if counters is not None:
+                counters.time_cost += timer() - t_sampled
+                if len(rows) < n_running:
+                    counters.aborts_by_group[i_group] += n_running - len(rows)
+            i_group += 1
+
+    results: list[PairUpResult | None] = [None] * batch_size
+    for row in rows:
+        assert not masks[row].any()
+        segmentation = []
+        start = sn.removed
+        for i, n_groups in enumerate(sn.partitions):
+            for _ in range(n_groups):
+                segmentation.append(set(idx[members[row, start : start + i + 2]]))
+                start += i + 2
+        results[row] = PairUpResult(
+            segmentation,
+            set(idx[members[row, : sn.removed]]),
+            joint_availabilities=unpack(group_words[row], packed.n_timeslots),
+            cost=costs[row],
+        )
+    return results, failed
+
+
+#: Number of trials that every worker runs between two synchronization points in
+#: parallel mode (see `_pair_up_parallel`)
+TRIALS_PER_ROUND = 1024
+#: Batch size used by the workers in parallel mode if no batch size is given
+DEFAULT_PARALLEL_BATCH_SIZE = 64
+
+# Problem and shared bound of the current worker process, see `_init_worker`
+_worker_state: dict = {}
+
+
+def _init_worker(
+    shared_best_cost,
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray,
+    packed: PackedAvailabilities,
+    batch_size: int,
+    weights: SamplingWeights,
+    met: np.ndarray | None,
+) -> None:
+    _worker_state.update(
+        shared_best_cost=shared_best_cost,
+        sn=sn,
+        idx=idx,
+        notwo=notwo,
+        packed=packed,
+        batch_size=batch_size,
+        weights=weights,
+        met=met,
+        encoder=CostEncoder(len(shared_best_cost), sn.n_people),
+    )
+
+
+@dataclass
+class _RoundReport:
+    """What a worker found in one round of the parallel search"""
+
+    #: State of the worker's bit generator after the round
+    rng_state: dict
+    #: First solution with the lowest cost found in this round
+    best: PairUpResult | None
+    #: Costs of all trials that were built to the end
+    costs: list[np.ndarray]
+    #: Number of trials that were run (less than requested if time ran out)
+    n_trials: int
+    #: What happened in this round
+    counters: SearchCounters
+
+
+def _generator_from_state(state: dict) -> np.random.Generator:
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def _run_round(
+    rng_state: dict, n_trials: int, time_left: float | None = None
+) -> _RoundReport:
+    """Run `n_trials` trials in a worker process. Before every batch of trials, the
+    bound is read from the shared best cost, and whenever we improve, we write
+    our best cost back. If `time_left` (seconds) is given, no new batch is started
+    after that time.
+    """
+    deadline = None
+    if time_left is not None:
+        deadline = timeit.default_timer() + time_left
+    shared_best_cost = _worker_state["shared_best_cost"]
+    encoder: CostEncoder = _worker_state["encoder"]
+    rng = _generator_from_state(rng_state)
+    best: PairUpResult | None = None
+    best_key = 0
+    costs = []
+    counters = SearchCounters()
+    n_done = 0
+    while n_done < n_trials:
+        if deadline is not None and timeit.default_timer() > deadline:
+            break
+        with shared_best_cost.get_lock():
+            bound = np.frombuffer(shared_best_cost.get_obj(), dtype=np.int64)
+            bound = bound.astype(int)
+        batch_size = min(_worker_state["batch_size"], n_trials - n_done)
+        results, failed = _pair_up_batch(
+            _worker_state["sn"],
+            _worker_state["idx"],
+            _worker_state["notwo"],
+            bound,
+            _worker_state["packed"],
+            rng=rng,
+            batch_size=batch_size,
+            weights=_worker_state["weights"],
+            met=_worker_state["met"],
+            counters=counters,
+        )
+        n_done += batch_size
+        counters.n_tries += batch_size
+        counters.n_incompatible += int(failed.sum())
+        for result in results:
+            if result is None:
+                continue
+            counters.n_complete += 1
+            costs.append(result.cost)
+            key = encoder.encode(result.cost)
+            if best is None or key < best_key:
+                best, best_key = result, key
+        if best is not None:
+            with shared_best_cost.get_lock():
+                shared = np.frombuffer(shared_best_cost.get_obj(), dtype=np.int64)
+                if encoder.encode(shared) > best_key:
+                    shared[:] = best.cost
+    return _RoundReport(dict(rng.bit_generator.state), best, costs, n_done, counters)
+
+
+def _pair_up_parallel(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray,
+    best_cost: np.ndarray,
+    packed: PackedAvailabilities,
+    *,
+    rngs: list[np.random.Generator],
+    batch_size: int,
+    max_tries: int,
+    abort_after_stable: int,
+    weights: SamplingWeights,
+    deadline: float | None = None,
+    costs: list[np.ndarray] | None = None,
+    resume_from: SearchState | None = None,
+    checkpointer: _Checkpointer | None = None,
+    met: np.ndarray | None = None,
+    counters: SearchCounters | None = None,
+) -> Iterator[PairUpResult]:
+    """Spread the trials of `pair_up` over one process per random number generator.
+
+    The search runs in rounds of `TRIALS_PER_ROUND` trials per worker, each worker
+    running batches of trials (see `_pair_up_batch`) with its own generator. The
+    best cost is shared between the workers, so that every worker prunes with the
+    global best. Pruning never discards a trial that is at least as good as the
+    final best, and a batch always consumes the same random numbers, so the result
+    only depends on the generators (ties are resolved in the order of rounds,
+    workers, and trials). If the time runs out (`deadline`, see `timeit.default_timer`),
+    workers stop after their current batch, and the result is no longer
+    deterministic. Checkpoints are taken between rounds.
+
+    Only the best solution is deterministic: Which trials are pruned (and thus
+    the costs that are appended to `costs` and the `counters`) depends on when
+    the workers see the improvements of the others.
+
+    Yields:
+        Every solution that improves on the previous one. The costs of all trials
+        that were built to the end are appended to `costs`.
+    """
+    if costs is None:
+        costs = []
+    if counters is None:
+        counters = SearchCounters()
+    n_workers = len(rngs)
+    rng_states = [dict(rng.bit_generator.state) for rng in rngs]
+    best_solution: PairUpResult | None = None
+    n_tries = 0
+    n_tries_stable = 0
+    if resume_from is not None:
+        best_solution = resume_from.best
+        if best_solution is not None:
+            best_cost = best_solution.cost
+        n_tries = resume_from.n_tries
+        n_tries_stable = resume_from.n_tries_stable
+        costs.extend(resume_from.costs)
+        rng_states = [dict(state) for state in resume_from.rng_states]
+        if best_solution is not None:
+            yield best_solution
+    ctx = multiprocessing.get_context()
+    shared_best_cost = ctx.Array("q", [int(c) for c in best_cost])
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(
+            shared_best_cost,
+            sn,
+            idx,
+            notwo,
+            packed,
+            batch_size,
+            weights,
+            met,
+        ),
+    ) as executor:
+        while True:
+            if n_tries > max_tries:
+                logger.info("Reached max tries (%d)", max_tries)
+                break
+            if n_tries_stable > abort_after_stable:
+                logger.info(
+                    "Reached stable tries (%d) after %d tries",
+                    abort_after_stable,
+                    n_tries,
+                )
+                break
+            time_left = None
+            if deadline is not None:
+                time_left = deadline - timeit.default_timer()
+                if time_left < 0:
+                    logger.info("Reached time budget after %d tries", n_tries)
+                    break
+            if checkpointer is not None and checkpointer.due():
+                checkpointer.save(
+                    n_tries, n_tries_stable, best_solution, costs, rng_states
+                )
+            n_round = min(TRIALS_PER_ROUND * n_workers, max_tries + 1 - n_tries)
+            futures = [
+                executor.submit(
+                    _run_round,
+                    rng_states[i_worker],
+                    n_round // n_workers + (i_worker < n_round % n_workers),
+                    time_left,
+                )
+                for i_worker in range(n_workers)
+            ]
+            improved = False
+            n_round = 0
+            for i_worker, future in enumerate(futures):
+                report = future.result()
+                rng_states[i_worker] = report.rng_state
+                costs.extend(report.costs)
+                counters.update(report.counters)
+                n_round += report.n_trials
+                if report.best is not None and (
+                    best_solution is None
+                    or lexicographic_greater(best_solution.cost, report.best.cost)
+                ):
+                    best_solution = report.best
+                    improved = True
+            n_tries += n_round
+            n_tries_stable = 0 if improved else n_tries_stable + n_round
+            if best_solution is not None:
+                logger.debug(
+                    f"tries={n_tries:>10}, full tries={len(costs):>3}, "
+                    f"best={best_solution.cost}"
+                )
+            if improved:
+                assert best_solution is not None
+                counters.n_improvements += 1
+                yield best_solution
+    if checkpointer is not None:
+        checkpointer.save(n_tries, n_tries_stable, best_solution, costs, rng_states)
+
+
 @dataclasses.dataclass
 class PairUpStatistics:
     """Statistics about the sampling process that optimizes the objective function"""
@@ -283,49 +1057,200 @@ class PairUpStatistics:
     best: np.ndarray
     #: Availabilities of the best solution
     solution_pair_avs: np.ndarray
+    #: What happened during the search (only for strategies that record it)
+    counters: SearchCounters | None = None
 
+    def to_dict(self) -> dict:
+        """Summary that can be serialized to JSON"""
+        return {
+            "best": self.best.tolist(),
+            "n_complete": len(self.df),
+            "search": None if self.counters is None else self.counters.to_dict(),
+        }
 
-def pair_up(
+
+def _to_builtin(label):
+    """Convert numpy scalars (e.g., indices of people) to python objects"""
+    return label.item() if isinstance(label, np.generic) else label
+
+
+@dataclass
+class SearchState:
+    """Everything that is needed to continue a search of `pair_up` exactly where it
+    stopped (see `resume_from` of `pair_up`)
+    """
+
+    #: Identifies the problem and the settings that influence the random draws, see
+    #: `_problem_fingerprint`
+    fingerprint: str
+    #: Number of trials so far
+    n_tries: int
+    #: Number of trials since the last improvement
+    n_tries_stable: int
+    #: Best solution so far
+    best: PairUpResult | None
+    #: Costs of all trials that were built to the end
+    costs: list[np.ndarray]
+    #: States of the bit generators (one per worker)
+    rng_states: list[dict]
+
+    def to_dict(self) -> dict:
+        """Convert to a JSON serializable dictionary"""
+        best = None
+        if self.best is not None:
+            best = {
+                "segmentation": [
+                    sorted(map(_to_builtin, group)) for group in self.best.segmentation
+                ],
+                "removed": sorted(map(_to_builtin, self.best.removed)),
+                "cost": self.best.cost.tolist(),
+                "joint_availabilities": self.best.joint_availabilities.astype(
+                    int
+                ).tolist(),
+            }
+        return {
+            "fingerprint": self.fingerprint,
+            "n_tries": self.n_tries,
+            "n_tries_stable": self.n_tries_stable,
+            "best": best,
+            "costs": [cost.tolist() for cost in self.costs],
+            "rng_states": self.rng_states,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> SearchState:
+        """Inverse of `to_dict`"""
+        best = None
+        if data["best"] is not None:
+            best = PairUpResult(
+                [set(group) for group in data["best"]["segmentation"]],
+                set(data["best"]["removed"]),
+                cost=np.array(data["best"]["cost"]),
+                joint_availabilities=np.array(
+                    data["best"]["joint_availabilities"], dtype=bool
+                ),
+            )
+        return cls(
+            fingerprint=data["fingerprint"],
+            n_tries=data["n_tries"],
+            n_tries_stable=data["n_tries_stable"],
+            best=best,
+            costs=[np.array(cost) for cost in data["costs"]],
+            rng_states=data["rng_states"],
+        )
+
+
+def _problem_fingerprint(
     sn: SolutionNumbers,
     idx: np.ndarray,
-    notwo: np.ndarray | None = None,
-    availabilities: np.ndarray | None = None,
+    notwo: np.ndarray,
+    packed: PackedAvailabilities,
+    met: np.ndarray | None = None,
+    **settings,
+) -> str:
+    """Hash of the problem and of all settings that influence the random draws"""
+    h = hashlib.sha256()
+    h.update(repr((sn, packed.n_timeslots, sorted(settings.items()))).encode())
+    h.update(repr(idx.tolist()).encode())
+    h.update(np.ascontiguousarray(notwo, dtype=bool).tobytes())
+    h.update(np.ascontiguousarray(packed.words).tobytes())
+    if met is not None:
+        h.update(np.packbits(met).tobytes())
+    return h.hexdigest()
+
+
+class _Checkpointer:
+    """Decides when to hand the state of the search to the `on_checkpoint`
+    callback of `pair_up`
+    """
+
+    def __init__(
+        self,
+        on_checkpoint: Callable[[SearchState], None],
+        interval: float,
+        fingerprint: str,
+    ):
+        self.on_checkpoint = on_checkpoint
+        self.interval = interval
+        self.fingerprint = fingerprint
+        self._last = timeit.default_timer()
+
+    def due(self) -> bool:
+        return timeit.default_timer() - self._last >= self.interval
+
+    def save(
+        self,
+        n_tries: int,
+        n_tries_stable: int,
+        best: PairUpResult | None,
+        costs: list[np.ndarray],
+        rng_states: list[dict],
+    ) -> None:
+        self.on_checkpoint(
+            SearchState(
+                self.fingerprint,
+                n_tries,
+                n_tries_stable,
+                best,
+                list(costs),
+                [dict(state) for state in rng_states],
+            )
+        )
+        self._last = timeit.default_timer()
+
+
+def _pair_up_sequential(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray,
+    best_cost: np.ndarray,
+    availabilities: np.ndarray | PackedAvailabilities,
     *,
-    max_tries=1000_000,
-    abort_after_stable=100_000,
-    rng: np.random.Generator | None = None,
-) -> tuple[PairUpResult, PairUpStatistics]:
-    """Pair up people by optimizing the objective function over multiple trials.
+    rng: np.random.Generator,
+    batch_size: int | None,
+    max_tries: int,
+    abort_after_stable: int,
+    weights: SamplingWeights,
+    deadline: float | None = None,
+    costs: list[np.ndarray] | None = None,
+    resume_from: SearchState | None = None,
+    checkpointer: _Checkpointer | None = None,
+    met: np.ndarray | None = None,
+    counters: SearchCounters | None = None,
+) -> Iterator[PairUpResult]:
+    """Run the trials of `pair_up` in the current process, either one by one
+    (`_pair_up`) or in batches (`_pair_up_batch`), until `max_tries` or
+    `abort_after_stable` is reached or the time runs out (`deadline`, see
+    `timeit.default_timer`).
 
-    Args:
-        sn: SolutionNumbers, specifying the number of groups of each size
-        idx: Indices of people to be paired up
-        notwo: Boolean array: Who vetoes to be in a group of only two-people
-        availabilities: Boolean array of n_people x n_timeslots
-        max_tries: Maximum number of trials
-        abort_after_stable: Abort after this many trials without improvement
-        rng: Random number generator
+    Checkpoints are only taken between batches, so that the state of the search is
+    fully described by the counters, the best solution, and the generator state.
 
-    Returns:
-        PairUpResult, PairUpStatistics
+    Yields:
+        Every solution that improves on the previous one. The costs of all trials
+        that were built to the end are appended to `costs`.
     """
-    if notwo is None:
-        notwo = np.full_like(idx, False)
-    if availabilities is None:
-        max_tries = 1
-        availabilities = np.full((len(idx), 1), 1)
-    if os.environ.get("MEETUPMATCHER_TESTING"):
-        max_tries = 3
-    best_solution = None
+    if costs is None:
+        costs = []
+    if counters is None:
+        counters = SearchCounters()
+    best_solution: PairUpResult | None = None
     n_tries = 0
     n_tries_stable = 0
-    max_availability = np.max(np.sum(availabilities, axis=1))
-    best_cost = np.full(max_availability + 1, 0, dtype="int")
-    best_cost[0] = sn.n_people
-    logger.info("Starting to look for best solution")
-    costs = []
-    n_full_tries = 0
-    t = timeit.default_timer()
+    if resume_from is not None:
+        best_solution = resume_from.best
+        if best_solution is not None:
+            best_cost = best_solution.cost
+        n_tries = resume_from.n_tries
+        n_tries_stable = resume_from.n_tries_stable
+        costs.extend(resume_from.costs)
+        rng.bit_generator.state = resume_from.rng_states[0]
+        if best_solution is not None:
+            yield best_solution
+    encoder = CostEncoder(len(best_cost), sn.n_people)
+    best_key = encoder.encode(best_cost)
+    # Outcomes of trials that were already run (in batched mode) but not evaluated
+    outcomes: deque[PairUpResult | NoSolution | None] = deque()
     while True:
         if n_tries > max_tries:
             logger.info("Reached max tries (%d)", max_tries)
@@ -335,30 +1260,319 @@ def pair_up(
                 "Reached stable tries (%d) after %d tries", abort_after_stable, n_tries
             )
             break
+        if deadline is not None and timeit.default_timer() > deadline:
+            logger.info("Reached time budget after %d tries", n_tries)
+            break
+        if not outcomes:
+            if checkpointer is not None and checkpointer.due():
+                checkpointer.save(
+                    n_tries,
+                    n_tries_stable,
+                    best_solution,
+                    costs,
+                    [dict(rng.bit_generator.state)],
+                )
+            if batch_size is None:
+                try:
+                    outcomes.append(
+                        _pair_up(
+                            sn,
+                            idx,
+                            notwo,
+                            best_cost,
+                            availabilities,
+                            rng=rng,
+                            weights=weights,
+                            encoder=encoder,
+                            met=met,
+                            counters=counters,
+                        )
+                    )
+                except NoSolution as e:
+                    outcomes.append(e)
+            else:
+                assert isinstance(availabilities, PackedAvailabilities)
+                results, failed = _pair_up_batch(
+                    sn,
+                    idx,
+                    notwo,
+                    best_cost,
+                    availabilities,
+                    rng=rng,
+                    batch_size=min(batch_size, max_tries + 1 - n_tries),
+                    weights=weights,
+                    met=met,
+                    counters=counters,
+                )
+                outcomes.extend(
+                    NoSolution() if f else r for r, f in zip(results, failed)
+                )
+        solution = outcomes.popleft()
         n_tries += 1
-        try:
-            solution = _pair_up(sn, idx, notwo, best_cost, availabilities, rng=rng)
-        except NoSolution:
+        counters.n_tries += 1
+        if isinstance(solution, NoSolution):
+            counters.n_incompatible += 1
             continue
         if solution is None:
-            # stopped early
             n_tries_stable += 1
             continue
-        if best_solution is None:
-            best_solution = solution
-        if lexicographic_greater(best_cost, solution.cost):
+        key = encoder.encode(solution.cost)
+        if best_solution is not None and key > best_key:
+            # stopped early (in batched mode, the bound is only updated between
+            # batches, so we might only find out now)
+            counters.aborts_by_group[sum(sn.partitions) - 1] += 1
+            n_tries_stable += 1
+            continue
+        counters.n_complete += 1
+        costs.append(solution.cost)
+        logger.debug(
+            f"tries={n_tries:>10}, full tries={len(costs):>3}, best={solution.cost}"
+        )
+        if best_solution is None or key < best_key:
+            best_key = key
             best_cost = solution.cost
             best_solution = solution
             n_tries_stable = 0
+            counters.n_improvements += 1
+            yield solution
         else:
             n_tries_stable += 1
-        n_full_tries += 1
-        logger.debug(
-            f"tries={n_tries:>10}, full tries={n_full_tries:>3}, best={solution.cost}"
+    if checkpointer is not None and not outcomes:
+        checkpointer.save(
+            n_tries,
+            n_tries_stable,
+            best_solution,
+            costs,
+            [dict(rng.bit_generator.state)],
+        )
+
+
+def iter_pair_up(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
+    *,
+    max_tries=1000_000,
+    abort_after_stable=100_000,
+    time_budget: float | None = None,
+    rng: np.random.Generator | None = None,
+    engine: str = "bitset",
+    batch_size: int | None = None,
+    workers: int = 1,
+    weights: SamplingWeights | None = None,
+    resume_from: SearchState | None = None,
+    on_checkpoint: Callable[[SearchState], None] | None = None,
+    checkpoint_interval: float = 60.0,
+    met: np.ndarray | None = None,
+    costs: list[np.ndarray] | None = None,
+    counters: SearchCounters | None = None,
+) -> Iterator[PairUpResult]:
+    """Same as `pair_up`, but yields every solution that improves on the previous
+    one as soon as it is found (when resuming, the best solution of the saved
+    state comes first). The last solution is the best one. Arguments are
+    the same as for `pair_up`, except for `costs`: If given, the costs of all
+    trials that were built to the end are appended to this list, and `counters`:
+    If given, what happened during the search is recorded there (trials of a
+    previous run that is resumed are not included).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}. Choose from {ENGINES}.")
+    if batch_size is not None and batch_size < 1:
+        raise ValueError("Batch size must be positive")
+    if workers < 1:
+        raise ValueError("Number of workers must be positive")
+    if time_budget is not None and time_budget < 0:
+        raise ValueError("Time budget must not be negative")
+    if rng is None:
+        rng = np.random.default_rng()
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    # Integer arrays would be used as indices instead of masks
+    notwo = np.full(len(idx), False) if notwo is None else np.asarray(notwo, bool)
+    if met is not None:
+        met = np.asarray(met, dtype=bool)
+        if met.shape != (len(idx), len(idx)):
+            raise ValueError("met must be an array of n_people x n_people")
+    if isinstance(availabilities, PackedAvailabilities):
+        packed = availabilities
+    else:
+        if availabilities is None:
+            max_tries = 1
+            availabilities = np.full((len(idx), 1), True)
+        packed = PackedAvailabilities.from_bool(availabilities)
+    if os.environ.get("MEETUPMATCHER_TESTING"):
+        max_tries = 3
+    t = timeit.default_timer()
+    deadline = None if time_budget is None else t + time_budget
+    if engine == "array" and batch_size is None and workers == 1:
+        trial_availabilities: np.ndarray | PackedAvailabilities = packed.to_bool()
+    else:
+        if packed.pairs is None:
+            # On a copy, the caller's availabilities might be changed later
+            packed = copy.copy(packed)
+            packed.pairs = PairIndex.from_packed(packed)
+        trial_availabilities = packed
+    max_availability = packed.counts.max()
+    best_cost = np.full(max_availability + 1, 0, dtype="int")
+    best_cost[0] = sn.n_people
+    checkpointer = None
+    if resume_from is not None or on_checkpoint is not None:
+        fingerprint = _problem_fingerprint(
+            sn,
+            idx,
+            notwo,
+            packed,
+            met,
+            batch_size=batch_size,
+            workers=workers,
+            weights=weights,
+        )
+        if resume_from is not None and resume_from.fingerprint != fingerprint:
+            raise ValueError(
+                "Cannot resume: The saved search state belongs to different people, "
+                "availabilities, or settings"
+            )
+        if on_checkpoint is not None:
+            checkpointer = _Checkpointer(
+                on_checkpoint, checkpoint_interval, fingerprint
+            )
+    if resume_from is not None:
+        logger.info(f"Resuming search after {resume_from.n_tries} tries")
+    logger.info("Starting to look for best solution")
+    if workers > 1:
+        assert isinstance(trial_availabilities, PackedAvailabilities)
+        yield from _pair_up_parallel(
+            sn,
+            idx,
+            notwo,
+            best_cost,
+            trial_availabilities,
+            rngs=spawn_rngs(rng, workers),
+            batch_size=batch_size or DEFAULT_PARALLEL_BATCH_SIZE,
+            max_tries=max_tries,
+            abort_after_stable=abort_after_stable,
+            weights=weights,
+            deadline=deadline,
+            costs=costs,
+            resume_from=resume_from,
+            checkpointer=checkpointer,
+            met=met,
+            counters=counters,
+        )
+    else:
+        yield from _pair_up_sequential(
+            sn,
+            idx,
+            notwo,
+            best_cost,
+            trial_availabilities,
+            rng=rng,
+            batch_size=batch_size,
+            max_tries=max_tries,
+            abort_after_stable=abort_after_stable,
+            weights=weights,
+            deadline=deadline,
+            costs=costs,
+            resume_from=resume_from,
+            checkpointer=checkpointer,
+            met=met,
+            counters=counters,
         )
-        costs.append(solution.cost)
     elapsed = timeit.default_timer() - t
+    if counters is not None:
+        counters.elapsed += elapsed
     logger.info(f"Searched for {elapsed:,} seconds.")
+
+
+def pair_up(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
+    *,
+    max_tries=1000_000,
+    abort_after_stable=100_000,
+    time_budget: float | None = None,
+    rng: np.random.Generator | None = None,
+    engine: str = "bitset",
+    batch_size: int | None = None,
+    workers: int = 1,
+    weights: SamplingWeights | None = None,
+    callback: Callable[[PairUpResult], None] | None = None,
+    resume_from: SearchState | None = None,
+    on_checkpoint: Callable[[SearchState], None] | None = None,
+    checkpoint_interval: float = 60.0,
+    met: np.ndarray | None = None,
+) -> tuple[PairUpResult, PairUpStatistics]:
+    """Pair up people by optimizing the objective function over multiple trials.
+
+    Args:
+        sn: SolutionNumbers, specifying the number of groups of each size
+        idx: Indices of people to be paired up
+        notwo: Boolean array: Who vetoes to be in a group of only two-people
+        availabilities: Boolean array of n_people x n_timeslots or the same
+            information packed into bitsets
+        max_tries: Maximum number of trials
+        abort_after_stable: Abort after this many trials without improvement
+        time_budget: Stop after this many seconds and return the best solution so
+            far
+        rng: Random number generator
+        engine: ``bitset`` (default) packs the availabilities of every person into
+            integer bitsets (see `sample_packed`), ``array`` works on the boolean
+            array directly (see `sample`). Both give identical results.
+        batch_size: If given, run this many trials at once in lock-step (see
+            `_pair_up_batch`). This always uses the bitset engine and gives
+            different (but equally distributed) results than running trials one by
+            one.
+        workers: Number of worker processes. If larger than one, the trials are
+            spread over a process pool (see `_pair_up_parallel`) and every worker
+            uses its own random number generator spawned from `rng`. The best
+            solution is deterministic for a given seed and number of workers
+            (unless the time budget is exhausted), the statistics are not.
+        weights: Parameters of the sampling probabilities (see `sample`)
+        callback: Called with every solution that improves on the previous one
+            (see also `iter_pair_up`)
+        resume_from: Continue a search from a `SearchState` that was passed to
+            `on_checkpoint`. Gives the same result as if the search hadn't been
+            interrupted. The problem and the settings that influence the random
+            draws (`batch_size`, `workers`, `weights`) must be the same.
+        on_checkpoint: Called with the `SearchState` about every
+            `checkpoint_interval` seconds and at the end of the search
+        checkpoint_interval: See `on_checkpoint`
+        met: Boolean array of n_people x n_people: Who was in a group with whom
+            before (see `meetupmatcher.history`). Adding such people to the same
+            group is less likely (see `SamplingWeights.repeat_weight`) and groups
+            with such a pair count as groups without joint availabilities.
+
+    Returns:
+        PairUpResult, PairUpStatistics
+    """
+    costs: list[np.ndarray] = []
+    counters = SearchCounters()
+    best_solution: PairUpResult | None = None
+    for best_solution in iter_pair_up(
+        sn,
+        idx,
+        notwo,
+        availabilities,
+        max_tries=max_tries,
+        abort_after_stable=abort_after_stable,
+        time_budget=time_budget,
+        rng=rng,
+        engine=engine,
+        batch_size=batch_size,
+        workers=workers,
+        weights=weights,
+        resume_from=resume_from,
+        on_checkpoint=on_checkpoint,
+        checkpoint_interval=checkpoint_interval,
+        met=met,
+        costs=costs,
+        counters=counters,
+    ):
+        if callback is not None:
+            callback(best_solution)
     if best_solution is None:
         raise NoSolution(
             "No solution could be found. You might have to manually remove a "
@@ -366,6 +1580,99 @@ def pair_up(
         )
     return best_solution, PairUpStatistics(
         pd.DataFrame(costs),
-        best=best_cost,
+        best=best_solution.cost,
         solution_pair_avs=best_solution.joint_availabilities,
+        counters=counters,
     )
+
+
+class MatchingStrategy(ABC):
+    """Algorithm that matches people into groups"""
+
+    #: Name under which the strategy can be selected (config file and command line)
+    name = ""
+
+    @abstractmethod
+    def run(
+        self,
+        sn: SolutionNumbers,
+        idx: np.ndarray,
+        notwo: np.ndarray | None = None,
+        availabilities: np.ndarray | PackedAvailabilities | None = None,
+        *,
+        rng: np.random.Generator | None = None,
+    ) -> tuple[PairUpResult, PairUpStatistics]:
+        """Match people. Arguments are the same as for `pair_up`."""
+
+
+#: Strategies by name, see `register_strategy`
+STRATEGIES: dict[str, type[MatchingStrategy]] = {}
+
+
+def register_strategy(cls: type[MatchingStrategy]) -> type[MatchingStrategy]:
+    """Class decorator that makes a strategy available by its name"""
+    STRATEGIES[cls.name] = cls
+    return cls
+
+
+def get_strategy(name: str, **options) -> MatchingStrategy:
+    """Instantiate the strategy with name `name`. All keyword arguments are passed
+    on to the strategy.
+    """
+    # Strategies from other modules register themselves when imported
+    import meetupmatcher.annealing  # noqa: F401
+    import meetupmatcher.exact  # noqa: F401
+    import meetupmatcher.sharding  # noqa: F401
+
+    if name not in STRATEGIES:
+        raise ValueError(
+            f"Unknown matching strategy {name!r}. Choose from {sorted(STRATEGIES)}."
+        )
+    return STRATEGIES[name](**options)
+
+
+@register_strategy
+class SamplingStrategy(MatchingStrategy):
+    """Heuristic sampling over many trials, see `pair_up`"""
+
+    name = "sampling"
+
+    def __init__(
+        self,
+        *,
+        max_joint_av_boon: int = DEFAULT_WEIGHTS.max_joint_av_boon,
+        wasted_resource_offset: int = DEFAULT_WEIGHTS.wasted_resource_offset,
+        repeat_weight: float = DEFAULT_WEIGHTS.repeat_weight,
+        **options,
+    ):
+        """
+
+        Args:
+            max_joint_av_boon: See `SamplingWeights`
+            wasted_resource_offset: See `SamplingWeights`
+            repeat_weight: See `SamplingWeights`
+            **options: Passed on to `pair_up`
+        """
+        self.weights = SamplingWeights(
+            max_joint_av_boon, wasted_resource_offset, repeat_weight
+        )
+        self.options = options
+
+    def run(
+        self,
+        sn: SolutionNumbers,
+        idx: np.ndarray,
+        notwo: np.ndarray | None = None,
+        availabilities: np.ndarray | PackedAvailabilities | None = None,
+        *,
+        rng: np.random.Generator | None = None,
+    ) -> tuple[PairUpResult, PairUpStatistics]:
+        return pair_up(
+            sn,
+            idx,
+            notwo,
+            availabilities,
+            rng=rng,
+            weights=self.weights,
+            **self.options,
+        )
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from meetupmatcher.bitset import PackedAvailabilities
+
+#: Number of people whose overlaps with everyone are computed at once when
+#: building a `PairIndex` (limits the size of temporary arrays)
+_BLOCK_SIZE = 256
+
+
+@dataclass
+class PairIndex:
+    """Number of joint availabilities of every pair of people, and for every
+    person, the compatible partners sorted by the number of joint availabilities.
+
+    Availabilities don't change while matching, so this is built once per run.
+    """
+
+    #: Array of n_people x n_people joint availabilities. The diagonal holds the
+    #: number of availabilities of every person.
+    counts: np.ndarray
+    _candidates: dict[int, np.ndarray] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    @classmethod
+    def from_packed(cls, packed: PackedAvailabilities) -> PairIndex:
+        n_people = len(packed)
+        dtype = np.min_scalar_type(packed.n_timeslots)
+        counts = np.empty((n_people, n_people), dtype=dtype)
+        for start in range(0, n_people, _BLOCK_SIZE):
+            stop = min(start + _BLOCK_SIZE, n_people)
+            counts[start:stop] = packed.overlap_counts(packed.words[start:stop])
+        return cls(counts)
+
+    @classmethod
+    def from_bool(cls, availabilities: np.ndarray) -> PairIndex:
+        """Build from a boolean array of n_people x n_timeslots"""
+        return cls.from_packed(PackedAvailabilities.from_bool(availabilities))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def compatible(self, person: int) -> np.ndarray:
+        """Everyone who shares at least one availability with `person` (ordered by
+        index, not including `person`)
+        """
+        partners = self.counts[person].nonzero()[0]
+        return partners[partners != person]
+
+    def candidates(self, person: int) -> np.ndarray:
+        """Compatible partners of `person`, sorted by the number of joint
+        availabilities (largest first, ties by index)
+        """
+        if person not in self._candidates:
+            partners = self.compatible(person)
+            order = np.argsort(
+                -self.counts[person, partners].astype(int), kind="stable"
+            )
+            self._candidates[person] = partners[order]
+        return self._candidates[person]
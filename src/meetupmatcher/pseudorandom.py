@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import time
 
-import dateutil
 import numpy as np
 
 from meetupmatcher.util.log import logger
@@ -39,6 +38,9 @@ def get_seed_from_option(option: str) -> int:
         logger.debug("Explicitly setting seed to number")
         return int(option)
     else:
+        # Only needed here, so don't slow down every start of the program
+        import dateutil.parser
+
         try:
             dt = dateutil.parser.parse(option)
             return get_random_seed_from_timestamp(dt.timestamp())
@@ -60,3 +62,26 @@ def get_rng_from_option(option: str) -> np.random.Generator:
     seed = get_seed_from_option(option)
     logger.info("Seed is %s", seed)
     return get_rng_from_seed(seed)
+
+
+def spawn_rngs(
+    rng: np.random.Generator | np.random.RandomState, n: int
+) -> list[np.random.Generator]:
+    """Spawn `n` independent child generators from the
+    `numpy.random.SeedSequence` that `rng` was created from. For generators that
+    were not created from a seed sequence (e.g. the legacy
+    `numpy.random.RandomState`), the entropy of the seed sequence is drawn from
+    `rng`.
+    """
+    bit_generator = getattr(rng, "bit_generator", None)
+    # Public property only since numpy 1.25
+    seed_seq = getattr(bit_generator, "seed_seq", None) or getattr(
+        bit_generator, "_seed_seq", None
+    )
+    if not isinstance(seed_seq, np.random.SeedSequence):
+        if isinstance(rng, np.random.RandomState):
+            entropy = rng.randint(2**62)
+        else:
+            entropy = rng.integers(2**62)
+        seed_seq = np.random.SeedSequence(int(entropy))
+    return [np.random.default_rng(child) for child in seed_seq.spawn(n)]
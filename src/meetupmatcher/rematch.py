@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+
+from meetupmatcher.data import People
+from meetupmatcher.localsearch import add_to_groups
+from meetupmatcher.matcher import (
+    DEFAULT_PREFERENCES,
+    GroupSizePreferences,
+    MatchingStrategy,
+    NoSolution,
+    PairUpResult,
+    ProblemStatement,
+    solve_numeric,
+)
+from meetupmatcher.util.log import logger
+
+#: Incremented whenever the format of state files changes
+STATE_VERSION = 1
+
+
+@dataclass
+class MatchState:
+    """Groups that were announced, identified by email (the index of the
+    participant table changes when people join or drop out)
+    """
+
+    #: Emails of the members of every group
+    groups: list[list[str]]
+    #: Emails of people that could not be assigned to a group
+    removed: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_result(cls, result: PairUpResult, people: People) -> MatchState:
+        store = people.store
+        return cls(
+            groups=[
+                store.column("email", store.positions(sorted(group))).tolist()
+                for group in result.segmentation
+            ],
+            removed=store.column(
+                "email", store.positions(sorted(result.removed))
+            ).tolist(),
+        )
+
+
+def save_state(path: str | PathLike, state: MatchState) -> None:
+    """Write the announced groups to a JSON file (replaced atomically)"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(
+        json.dumps(
+            {"version": STATE_VERSION, "groups": state.groups, "removed": state.removed}
+        )
+    )
+    os.replace(tmp_path, path)
+
+
+def load_state(path: str | PathLike) -> MatchState:
+    """Read a file written by `save_state`"""
+    path = Path(path)
+    data = json.loads(path.read_text())
+    if data.get("version") != STATE_VERSION:
+        raise ValueError(
+            f"Unsupported state version {data.get('version')} in {path} (expected "
+            f"{STATE_VERSION})"
+        )
+    return MatchState(groups=data["groups"], removed=data["removed"])
+
+
+@dataclass
+class Rematch:
+    """Result of `rematch`"""
+
+    #: Matching of all current participants
+    result: PairUpResult
+    #: Indices (into ``result.segmentation``) of groups that are new or whose
+    #: members changed
+    changed: list[int]
+    #: People that are removed now but were not removed before
+    newly_removed: set[int]
+
+    def notifications(self) -> PairUpResult:
+        """Only the changed groups and newly removed people, i.e., everyone who
+        has to be notified
+        """
+        return PairUpResult(
+            [self.result.segmentation[i] for i in self.changed],
+            self.newly_removed,
+            cost=self.result.cost,
+            joint_availabilities=self.result.joint_availabilities[self.changed],
+        )
+
+
+def compare(previous: MatchState, result: PairUpResult, people: People) -> Rematch:
+    """What changed in `result` compared to the announced groups `previous`, as
+    if `result` had been found by `rematch` (e.g., to notify the same people
+    when sending the result of a rematch again)
+    """
+    current = MatchState.from_result(result, people)
+    announced = {frozenset(group) for group in previous.groups}
+    removed = sorted(result.removed)
+    emails = people.store.column("email", people.store.positions(removed))
+    return Rematch(
+        result,
+        changed=[
+            i
+            for i, group in enumerate(current.groups)
+            if frozenset(group) not in announced
+        ],
+        newly_removed={
+            id_ for id_, email in zip(removed, emails) if email not in previous.removed
+        },
+    )
+
+
+def _is_valid_group(
+    members: list[int], notwo: np.ndarray, preferences: GroupSizePreferences
+) -> bool:
+    if len(members) == 2 and notwo[members].any():
+        return False
+    return preferences.min_size <= len(members) <= preferences.max_size
+
+
+def rematch(
+    previous: MatchState,
+    people: People,
+    strategy: MatchingStrategy,
+    *,
+    rng: np.random.Generator | None = None,
+    preferences: GroupSizePreferences | None = None,
+) -> Rematch:
+    """Update a previous matching after people joined or dropped out.
+
+    Groups that lost nobody are kept as they are. Groups that lost members are
+    kept as well if they still form a valid group. All other people (members of
+    groups that became too small, people that signed up late, and people that
+    could not be matched before) form a pool that is matched from scratch with
+    `strategy`, using `solve_numeric` for the number of groups of each size.
+    People that are left over (e.g., because the pool is too small to form
+    groups) are added to groups that can take another member, where they share
+    the most availabilities. New groups are tried first, so that announced
+    groups are only changed if necessary.
+
+    Args:
+        previous: Announced groups, see `MatchState`
+        people: All current participants
+        strategy: Used to match the pool
+        rng: Random number generator
+        preferences: Allowed group sizes, see `solve_numeric`
+
+    Returns:
+        Rematch
+    """
+    if preferences is None:
+        preferences = DEFAULT_PREFERENCES
+    store = people.store
+    notwo = people.notwo
+    availabilities = people.availabilities
+    if availabilities is None:
+        availabilities = np.full((len(people), 1), True)
+    position = {email: i for i, email in enumerate(store.column("email").tolist())}
+
+    kept: list[list[int]] = []
+    changed: list[bool] = []
+    pool: list[int] = []
+    assigned: set[int] = set()
+    n_dropped = 0
+    for group in previous.groups:
+        members = [position[email] for email in group if email in position]
+        n_dropped += len(group) - len(members)
+        assigned.update(members)
+        if len(members) == len(group):
+            kept.append(members)
+            changed.append(False)
+        elif _is_valid_group(members, notwo, preferences):
+            kept.append(members)
+            changed.append(True)
+        else:
+            pool.extend(members)
+    pool += [p for p in range(len(people)) if p not in assigned]
+    previously_removed = {position[e] for e in previous.removed if e in position}
+    logger.info(
+        f"{n_dropped} people dropped out, "
+        f"{len(people) - len(assigned) - len(previously_removed)} joined. Keeping "
+        f"{changed.count(False)} groups unchanged, rematching {len(pool)} people."
+    )
+
+    new_groups: list[list[int]] = []
+    leftover = pool
+    if pool:
+        pool_idx = np.array(pool)
+        try:
+            sn = solve_numeric(
+                ProblemStatement(len(pool), int(notwo[pool_idx].sum())), preferences
+            )
+            result, _ = strategy.run(
+                sn,
+                pool_idx,
+                notwo[pool_idx],
+                None if people.availabilities is None else availabilities[pool_idx],
+                rng=rng,
+            )
+        except NoSolution as e:
+            logger.warning(f"Could not match the pool on its own: {e}")
+        else:
+            new_groups = [sorted(g) for g in result.segmentation]
+            leftover = sorted(result.removed)
+
+    segmentation = kept + new_groups
+    changed += [True] * len(new_groups)
+    # Add people that couldn't be matched to groups that can take another member
+    order = list(range(len(kept), len(segmentation))) + list(range(len(kept)))
+    removed, extended = add_to_groups(
+        leftover, [segmentation[i] for i in order], availabilities, preferences.max_size
+    )
+    for i in extended:
+        changed[order[i]] = True
+    joint_availabilities = np.array(
+        [np.all(availabilities[g], axis=0) for g in segmentation]
+    ).reshape(len(segmentation), availabilities.shape[1])
+    counts = joint_availabilities.sum(axis=1)
+    cost = np.zeros(availabilities.sum(axis=1).max() + 1, dtype=int)
+    cost[0] += len(removed)
+    np.add.at(cost, counts, 1)
+    ids = people.ids
+    result = PairUpResult(
+        [set(ids[g]) for g in segmentation],
+        set(ids[removed]),
+        cost=cost,
+        joint_availabilities=joint_availabilities,
+    )
+    return Rematch(
+        result,
+        changed=[i for i, c in enumerate(changed) if c],
+        newly_removed=set(ids[[p for p in removed if p not in previously_removed]]),
+    )
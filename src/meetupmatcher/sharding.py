@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from meetupmatcher.bitset import PackedAvailabilities
+from meetupmatcher.localsearch import add_to_groups
+from meetupmatcher.matcher import (
+    DEFAULT_PREFERENCES,
+    GroupSizePreferences,
+    MatchingStrategy,
+    NoSolution,
+    PairUpResult,
+    PairUpStatistics,
+    ProblemStatement,
+    SolutionNumbers,
+    get_strategy,
+    register_strategy,
+    solve_numeric,
+)
+from meetupmatcher.pseudorandom import spawn_rngs
+from meetupmatcher.util.log import logger
+
+#: Default number of people per shard
+DEFAULT_SHARD_SIZE = 400
+
+
+def _balanced_assignment(distances: np.ndarray, capacity: int) -> np.ndarray:
+    """Assign every row to a column, taking the (row, column) pairs with the
+    smallest distances first, such that no column gets more than `capacity` rows.
+    """
+    n_rows, n_cols = distances.shape
+    labels = np.full(n_rows, -1)
+    sizes = np.zeros(n_cols, dtype=int)
+    order = np.argsort(distances, axis=None, kind="stable")
+    n_assigned = 0
+    for row, col in zip(*np.unravel_index(order, distances.shape)):
+        if labels[row] < 0 and sizes[col] < capacity:
+            labels[row] = col
+            sizes[col] += 1
+            n_assigned += 1
+            if n_assigned == n_rows:
+                break
+    return labels
+
+
+def balanced_shards(
+    availabilities: np.ndarray,
+    n_shards: int,
+    *,
+    rng: np.random.Generator,
+    n_iterations=10,
+) -> list[np.ndarray]:
+    """Cluster people by their availabilities into shards of (almost) equal size.
+
+    This is k-means, except that every person is assigned to the closest shard
+    that still has room (see `_balanced_assignment`), so that shards differ in size
+    by at most ``n_shards - 1`` people.
+
+    Args:
+        availabilities: Boolean array of n_people x n_timeslots
+        n_shards: Number of shards
+        rng: Random number generator (for the initial centers, chosen as in
+            k-means++)
+        n_iterations: Maximal number of k-means iterations
+
+    Returns:
+        Positions of the people of every shard
+    """
+    n_people = len(availabilities)
+    if n_shards <= 1:
+        return [np.arange(n_people)]
+    x = availabilities.astype(float)
+    norms = (x**2).sum(axis=1)
+    capacity = -(-n_people // n_shards)
+    # k-means++: Spread out the initial centers
+    centers = x[[rng.integers(n_people)]]
+    for _ in range(1, n_shards):
+        distances = norms[:, None] - 2 * x @ centers.T + (centers**2).sum(axis=1)
+        weights = np.maximum(distances.min(axis=1), 0)
+        if weights.sum() == 0:
+            weights = np.ones(n_people)
+        centers = np.vstack(
+            [centers, x[rng.choice(n_people, p=weights / weights.sum())]]
+        )
+    labels = np.full(n_people, -1)
+    for _ in range(n_iterations):
+        distances = norms[:, None] - 2 * x @ centers.T + (centers**2).sum(axis=1)
+        new_labels = _balanced_assignment(distances, capacity)
+        if (new_labels == labels).all():
+            break
+        labels = new_labels
+        centers = np.array([x[labels == k].mean(axis=0) for k in range(n_shards)])
+    return [np.flatnonzero(labels == k) for k in range(n_shards)]
+
+
+def _solve_shard(
+    strategy_name: str,
+    options: dict,
+    idx: np.ndarray,
+    notwo: np.ndarray,
+    availabilities: np.ndarray,
+    rng: np.random.Generator,
+    preferences: GroupSizePreferences,
+) -> PairUpResult | None:
+    """Match the people of one shard (runs in a worker process)"""
+    try:
+        sn = solve_numeric(ProblemStatement(len(idx), int(notwo.sum())), preferences)
+        result, _ = get_strategy(strategy_name, **options).run(
+            sn, idx, notwo, availabilities, rng=rng
+        )
+    except NoSolution as e:
+        logger.warning(f"Could not match a shard of {len(idx)} people: {e}")
+        return None
+    return result
+
+
+def pair_up_sharded(
+    sn: SolutionNumbers,
+    idx: np.ndarray,
+    notwo: np.ndarray | None = None,
+    availabilities: np.ndarray | PackedAvailabilities | None = None,
+    *,
+    rng: np.random.Generator | None = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    workers: int = 1,
+    strategy: str = "sampling",
+    preferences: GroupSizePreferences | None = None,
+    **options,
+) -> tuple[PairUpResult, PairUpStatistics]:
+    """Match a large number of people by splitting them into shards of people with
+    similar availabilities (see `balanced_shards`) and matching every shard on its
+    own.
+
+    The number of groups of each size is determined per shard with
+    `solve_numeric`, so it can differ from `sn`. People that are left over in a
+    shard (e.g., because no solution was found) are matched together, and anyone
+    that still remains is added to groups that can take another member (see
+    `meetupmatcher.localsearch.add_to_groups`).
+
+    Args:
+        sn: SolutionNumbers for all people (only used if there is a single shard)
+        idx: Indices of people to be paired up
+        notwo: Boolean array: Who vetoes to be in a group of only two-people
+        availabilities: Boolean array of n_people x n_timeslots or the same
+            information packed into bitsets
+        rng: Random number generator. Every shard gets its own generator spawned
+            from it, so the result doesn't depend on the number of workers.
+        shard_size: Approximate number of people per shard
+        workers: Number of processes that match shards in parallel
+        strategy: Name of the strategy that is used for every shard
+        preferences: Allowed group sizes, see `solve_numeric`
+        **options: Passed on to the strategy of every shard. A ``time_budget`` is
+            for all shards together, i.e., it is split between the shards that
+            are matched by the same worker.
+
+    Returns:
+        PairUpResult, PairUpStatistics
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if notwo is None:
+        notwo = np.full(len(idx), False)
+    if preferences is None:
+        preferences = DEFAULT_PREFERENCES
+    if isinstance(availabilities, PackedAvailabilities):
+        availabilities = availabilities.to_bool()
+    if availabilities is None:
+        availabilities = np.full((len(idx), 1), True)
+    if shard_size < 9:
+        # Smaller shards can't always be split into groups
+        raise ValueError("Shard size must be at least 9")
+    n_people = len(idx)
+    n_shards = max(1, round(n_people / shard_size))
+    if n_shards == 1:
+        return get_strategy(strategy, **options).run(
+            sn, idx, notwo, availabilities, rng=rng
+        )
+    t = timeit.default_timer()
+    shards = balanced_shards(availabilities, n_shards, rng=rng)
+    logger.info(
+        f"Split {n_people} people into {n_shards} shards of "
+        f"{min(map(len, shards))} to {max(map(len, shards))} people"
+    )
+    if options.get("time_budget") is not None:
+        options = dict(options)
+        options["time_budget"] *= min(workers, n_shards) / n_shards
+    args = [
+        (strategy, options, idx[s], notwo[s], availabilities[s], shard_rng, preferences)
+        for s, shard_rng in zip(shards, spawn_rngs(rng, n_shards))
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_solve_shard, *zip(*args)))
+    else:
+        results = [_solve_shard(*a) for a in args]
+
+    position = {label: i for i, label in enumerate(idx.tolist())}
+    groups: list[list[int]] = []
+    leftover: list[int] = []
+    for shard, result in zip(shards, results):
+        if result is None:
+            leftover.extend(shard.tolist())
+            continue
+        groups.extend(
+            sorted(position[label] for label in group) for group in result.segmentation
+        )
+        leftover.extend(position[label] for label in result.removed)
+    if len(leftover) >= 2:
+        pool = np.array(sorted(leftover))
+        result = _solve_shard(
+            strategy, options, pool, notwo[pool], availabilities[pool], rng, preferences
+        )
+        if result is not None:
+            groups.extend(sorted(g) for g in result.segmentation)
+            leftover = sorted(result.removed)
+    removed, _ = add_to_groups(
+        sorted(leftover), groups, availabilities, preferences.max_size
+    )
+
+    joint_availabilities = np.array([np.all(availabilities[g], axis=0) for g in groups])
+    cost = np.zeros(availabilities.sum(axis=1).max() + 1, dtype=int)
+    cost[0] += len(removed)
+    np.add.at(cost, joint_availabilities.sum(axis=1), 1)
+    elapsed = timeit.default_timer() - t
+    logger.info(f"Matched {n_shards} shards in {elapsed:,} seconds.")
+    result = PairUpResult(
+        [set(idx[g]) for g in groups],
+        set(idx[removed]),
+        cost=cost,
+        joint_availabilities=joint_availabilities,
+    )
+    return result, PairUpStatistics(
+        pd.DataFrame([r.cost for r in results if r is not None]),
+        best=result.cost,
+        solution_pair_avs=result.joint_availabilities,
+    )
+
+
+@register_strategy
+class ShardedStrategy(MatchingStrategy):
+    """Match shards of similar people separately, see `pair_up_sharded`"""
+
+    name = "sharded"
+
+    def __init__(self, **options):
+        """
+
+        Args:
+            **options: Passed on to `pair_up_sharded`
+        """
+        self.options = options
+
+    def run(
+        self,
+        sn: SolutionNumbers,
+        idx: np.ndarray,
+        notwo: np.ndarray | None = None,
+        availabilities: np.ndarray | PackedAvailabilities | None = None,
+        *,
+        rng: np.random.Generator | None = None,
+    ) -> tuple[PairUpResult, PairUpStatistics]:
+        return pair_up_sharded(sn, idx, notwo, availabilities, rng=rng, **self.options)
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+import itertools
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
+from email.message import EmailMessage
+from os import PathLike
 from pathlib import Path, PurePath
-from typing import Iterator
+from typing import TYPE_CHECKING, Iterator, Tuple
 
 import numpy as np
-import pandas as pd
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
 
-from meetupmatcher.data import People
-from meetupmatcher.matcher import PairUpResult
 from meetupmatcher.util.compat_resource import resources
 
+if TYPE_CHECKING:
+    from meetupmatcher.data import People
+    from meetupmatcher.matcher import PairUpResult
+
+#: Number of emails that are rendered by one task of the pool
+RENDER_BATCH_SIZE = 64
+
 
 @dataclass
 class Email:
@@ -22,58 +31,184 @@ class Email:
     def to_str(self) -> str:
         return f"To: {', '.join(self.to)}\nSubject: {self.subject}\n\n{self.content}"
 
+    def to_message(self, from_address: str | None = None) -> EmailMessage:
+        message = EmailMessage()
+        if from_address is not None:
+            message["From"] = from_address
+        message["To"] = ", ".join(self.to)
+        message["Subject"] = self.subject
+        message.set_content(self.content)
+        return message
+
+
+class Records(list):
+    """Members of a group as dictionaries (column name -> value), which is much
+    cheaper than slicing a DataFrame for every group. Templates can use
+    ``p.email`` or ``p["email"]`` for every member ``p``, and `iterrows` is there
+    for templates that were written for DataFrames.
+    """
+
+    def __init__(self, ids: list, records: list[dict]):
+        super().__init__(records)
+        self.ids = ids
+
+    def iterrows(self) -> Iterator[tuple]:
+        return zip(self.ids, self)
+
+
+#: Everything that is needed to render one email: Kind (``removed`` or
+#: ``matched``), recipients, template arguments
+_RenderJob = Tuple[str, list, dict]
+
 
 class EmailGenerator:
-    def __init__(self, template_path: str | None | PurePath = None):
+    def __init__(
+        self,
+        template_path: str | None | PurePath = None,
+        *,
+        bytecode_cache: str | PathLike | None = None,
+    ):
+        """
+
+        Args:
+            template_path: Directory with the templates (default: the templates
+                that come with this package)
+            bytecode_cache: Directory in which compiled templates are kept between
+                runs (optional)
+        """
         if template_path is None:
             template_path = Path(
                 resources.files("meetupmatcher.templates")  # type: ignore
             )
+        self.template_path = template_path
+        self.bytecode_cache = bytecode_cache
+        cache = None
+        if bytecode_cache is not None:
+            Path(bytecode_cache).mkdir(parents=True, exist_ok=True)
+            cache = FileSystemBytecodeCache(str(bytecode_cache))
+        # Templates don't change while we render, so don't check them every time
         self.environment = Environment(
-            loader=FileSystemLoader(template_path)  # type: ignore
+            loader=FileSystemLoader(template_path),  # type: ignore
+            bytecode_cache=cache,
+            auto_reload=False,
         )
+        self._templates: dict[str, Template] = {}
 
-    def _generate_remove_email(self, person: pd.Series) -> Email:
-        template = self.environment.get_template("removed.txt.jinja")
-        return Email(
-            to=[person.email],
-            subject="Coffee meetup",
-            content=template.render(name=person["name"]),
-        )
+    def _template(self, name: str) -> Template:
+        if name not in self._templates:
+            self._templates[name] = self.environment.get_template(name)
+        return self._templates[name]
 
-    def _generate_pair_email(
-        self,
-        group: pd.DataFrame,
-        av_cols: list[str] | None = None,
-        av: np.ndarray | None = None,
-    ) -> Email:
-        if av_cols:
-            availability_strs = sorted(
-                av_cols[i] for i in range(len(av_cols)) if av[i]  # type: ignore
+    def _render(self, job: _RenderJob) -> Email:
+        kind, to, arguments = job
+        if kind == "removed":
+            return Email(
+                to=to,
+                subject="Coffee meetup",
+                content=self._template("removed.txt.jinja").render(**arguments),
             )
-        else:
-            availability_strs = None
-        template = self.environment.get_template("matched.txt.jinja")
         return Email(
-            to=group.email.tolist(),
+            to=to,
             subject="Coffee meetup: You have been matched to your group",
-            content=template.render(
-                names=[n.strip() for n in group.name.to_list()],
-                people=group,
-                availabilities=availability_strs,
-            ),
+            content=self._template("matched.txt.jinja").render(**arguments),
         )
 
+    def _render_batch(self, jobs: list[_RenderJob]) -> list[Email]:
+        return [self._render(job) for job in jobs]
+
+    @staticmethod
+    def _jobs(people: People, paired_up: PairUpResult) -> Iterator[_RenderJob]:
+        store = people.store
+        removed = store.positions(paired_up.removed)
+        for name, email in zip(
+            store.column("name", removed), store.column("email", removed)
+        ):
+            yield "removed", [email], {"name": name}
+        # Pull every column out of the store once instead of once per group
+        ids = store.ids.tolist()
+        columns = {col: store.column(col).tolist() for col in store.columns}
+        av_cols = store.timeslots
+        for i, partition in enumerate(paired_up.segmentation):
+            positions = store.positions(sorted(partition)).tolist()
+            group = Records(
+                [ids[p] for p in positions],
+                [
+                    {col: values[p] for col, values in columns.items()}
+                    for p in positions
+                ],
+            )
+            availabilities = None
+            if av_cols:
+                av = paired_up.joint_availabilities[i]
+                availabilities = sorted(av_cols[j] for j in np.flatnonzero(av))
+            yield "matched", [p["email"] for p in group], {
+                "names": [p["name"].strip() for p in group],
+                "people": group,
+                "availabilities": availabilities,
+            }
+
     def generate_emails(
-        self, people: People, paired_up: PairUpResult
+        self,
+        people: People,
+        paired_up: PairUpResult,
+        *,
+        workers: int = 1,
+        executor: str = "process",
     ) -> Iterator[Email]:
-        for r in paired_up.removed:
-            person = people.df.loc[r]
-            yield self._generate_remove_email(person)
-        for i, partition in enumerate(paired_up.segmentation):
-            group = people.df.loc[sorted(partition)]
-            yield self._generate_pair_email(
-                group,
-                av_cols=people._availability_product_cols,
-                av=paired_up.joint_availabilities[i],
+        """Emails for the people that were removed and for every group (in this
+        order).
+
+        Args:
+            people: All participants
+            paired_up: Groups
+            workers: If larger than one, render batches of emails in a pool of
+                this many workers. At most ``2 * workers`` batches are rendered
+                ahead of the consumer.
+            executor: ``process`` or ``thread`` pool
+        """
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown executor {executor!r}. Use process or thread.")
+        jobs = self._jobs(people, paired_up)
+        if workers <= 1:
+            yield from map(self._render, jobs)
+            return
+        batches = iter(lambda: list(itertools.islice(jobs, RENDER_BATCH_SIZE)), [])
+        first = next(batches, [])
+        second = next(batches, None)
+        if second is None:
+            # Not worth starting a pool
+            yield from map(self._render, first)
+            return
+        pool: Executor
+        if executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=workers)
+            render = self._render_batch
+        else:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.template_path, self.bytecode_cache),
             )
+            render = _render_batch
+        pending: deque[Future[list[Email]]] = deque()
+        with pool:
+            for batch in itertools.chain([first, second], batches):
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+                pending.append(pool.submit(render, batch))
+            while pending:
+                yield from pending.popleft().result()
+
+
+# Generator of the current worker process, see `_init_worker`
+_worker_generator: EmailGenerator | None = None
+
+
+def _init_worker(template_path, bytecode_cache) -> None:
+    global _worker_generator
+    _worker_generator = EmailGenerator(template_path, bytecode_cache=bytecode_cache)
+
+
+def _render_batch(jobs: list[_RenderJob]) -> list[Email]:
+    assert _worker_generator is not None
+    return _worker_generator._render_batch(jobs)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from meetupmatcher.annealing import AnnealingStrategy, _Annealer, anneal
+from meetupmatcher.matcher import (
+    ProblemStatement,
+    SamplingStrategy,
+    get_strategy,
+    solve_numeric,
+)
+
+
+def test_anneal():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((40, 14)) < 0.5
+    notwo = rng.random(40) < 0.5
+    idx = np.arange(100, 140)
+    sn = solve_numeric(ProblemStatement(40, notwo.sum()))
+    result, statistics = anneal(sn, idx, notwo, availabilities, rng=rng, n_steps=2000)
+    assert sorted(map(len, result.segmentation)) == sorted(
+        i + 2 for i, n in enumerate(sn.partitions) for _ in range(n)
+    )
+    assert set.union(*result.segmentation) | result.removed == set(idx)
+    cost = np.zeros_like(result.cost)
+    cost[0] += len(result.removed)
+    for group, joint in zip(result.segmentation, result.joint_availabilities):
+        positions = sorted(p - 100 for p in group)
+        np.testing.assert_array_equal(joint, availabilities[positions].all(axis=0))
+        if len(group) == 2:
+            assert not notwo[positions].any()
+        cost[joint.sum()] += 1
+    np.testing.assert_array_equal(cost, result.cost)
+    np.testing.assert_array_equal(statistics.best, result.cost)
+
+
+def test_anneal_planted():
+    # Three clusters with disjoint availabilities: Annealing has to find them
+    availabilities = np.repeat(np.eye(3, dtype=bool), 3, axis=0)
+    sn = solve_numeric(ProblemStatement(9, 0))
+    result, _ = anneal(
+        sn, np.arange(9), availabilities=availabilities, rng=np.random.default_rng(1)
+    )
+    assert sorted(map(sorted, result.segmentation)) == [
+        [0, 1, 2],
+        [3, 4, 5],
+        [6, 7, 8],
+    ]
+    np.testing.assert_array_equal(result.cost, [0, 3])
+
+
+def test_anneal_many_timeslots():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((12, 600)) < 0.9
+    sn = solve_numeric(ProblemStatement(12, 0))
+    result, _ = anneal(sn, np.arange(12), availabilities=availabilities, rng=rng)
+    assert set.union(*result.segmentation) | result.removed == set(range(12))
+    # The sign of every energy change agrees with the lexicographic order
+    groups = [list(range(i, i + 3)) for i in range(0, 12, 3)]
+    state = _Annealer(groups, [], np.full(12, False), availabilities, 4.0)
+    for a, b in rng.integers(0, 12, (200, 2)):
+        proposal = state.propose(a, b, False)
+        if proposal is None:
+            continue
+        ga, gb, count_a, count_b = proposal
+        cost = list(state.cost)
+        for g, count in ((ga, count_a), (gb, count_b)):
+            cost[state.counts[g]] -= 1
+            cost[count] += 1
+        delta = state.delta(*proposal)
+        assert (delta < 0) == (cost < state.cost)
+        assert (delta == 0) == (cost == state.cost)
+    # One group gets better at a count where the other one gets worse by as
+    # much: The remaining change is tiny compared to the penalties at that count
+    state = _Annealer(groups, [], np.full(12, False), np.full((12, 100), True), 4.0)
+    state.counts[:2] = [10, 50]
+    assert state.delta(0, 1, 51, 10) < 0
+
+
+def test_get_strategy():
+    assert isinstance(get_strategy("sampling"), SamplingStrategy)
+    strategy = get_strategy("annealing", n_steps=10)
+    assert isinstance(strategy, AnnealingStrategy)
+    assert strategy.options == {"n_steps": 10}
+    with pytest.raises(ValueError):
+        get_strategy("unknown")
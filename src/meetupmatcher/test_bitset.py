@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from meetupmatcher.bitset import PackedAvailabilities, pack, popcount, unpack
+
+
+@pytest.mark.parametrize("n_timeslots", [1, 14, 16, 17, 64, 65, 130])
+def test_pack_unpack(n_timeslots: int):
+    rng = np.random.default_rng(0)
+    av = rng.random((20, n_timeslots)) < 0.5
+    words = pack(av)
+    assert words.dtype == np.uint64
+    assert words.shape == (20, -(-n_timeslots // 64))
+    np.testing.assert_array_equal(unpack(words, n_timeslots), av)
+    np.testing.assert_array_equal(popcount(words), av.sum(axis=1))
+
+
+@pytest.mark.parametrize("n_timeslots", [14, 100])
+def test_packed_availabilities(n_timeslots: int):
+    rng = np.random.default_rng(1)
+    av = rng.random((10, n_timeslots)) < 0.7
+    packed = PackedAvailabilities.from_bool(av)
+    assert len(packed) == 10
+    np.testing.assert_array_equal(packed.to_bool(), av)
+    np.testing.assert_array_equal(packed.counts, av.sum(axis=1))
+    joint = packed.joint([2, 5, 7])
+    np.testing.assert_array_equal(unpack(joint, n_timeslots), av[2] & av[5] & av[7])
+    np.testing.assert_array_equal(
+        packed.overlap_counts(joint), (av & av[2] & av[5] & av[7]).sum(axis=1)
+    )
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from meetupmatcher.cache import cache_key, load_people, prune_cache
+from meetupmatcher.config import Config
+
+
+@pytest.fixture()
+def config(tmp_path) -> Config:
+    path = tmp_path / "config.yaml"
+    path.write_text("availabilities:\n  columns:\n    - Lunch\n")
+    return Config(path)
+
+
+@pytest.fixture()
+def signups(tmp_path):
+    path = tmp_path / "signups.csv"
+    pd.DataFrame(
+        {
+            "name": ["Ann", None, "Bob"],
+            "email": ["a@x", "b@x", "c@x"],
+            "Lunch": ["Mon", "Mon, Tue", "Tue"],
+            "notwo": [True, False, None],
+        }
+    ).to_csv(path, index=False)
+    return path
+
+
+def test_cache_key(config, signups, tmp_path):
+    key = cache_key(signups, config)
+    assert key == cache_key(signups, config)
+    assert cache_key("-", config) is None
+    other_config = tmp_path / "other.yaml"
+    other_config.write_text("availabilities:\n  columns:\n    - Lunch\nx: 1\n")
+    assert cache_key(signups, Config(other_config)) != key
+    signups.write_text(signups.read_text() + "Cid,d@x,Mon,False\n")
+    assert cache_key(signups, config) != key
+
+
+def test_load_people(config, signups, cache_dir):
+    people = load_people(signups, config)
+    assert len(list(cache_dir.iterdir())) == 1
+    cached = load_people(signups, config)
+    assert isinstance(cached.store.packed.words, np.memmap)
+    pd.testing.assert_frame_equal(cached.df, people.df)
+    np.testing.assert_array_equal(cached.availabilities, people.availabilities)
+    np.testing.assert_array_equal(cached.notwo, people.notwo)
+    assert cached._availability_product_cols == people._availability_product_cols
+
+
+def test_load_people_no_cache(config, signups, cache_dir):
+    load_people(signups, config, use_cache=False)
+    assert not cache_dir.exists()
+
+
+def test_load_people_warnings(config, signups, caplog):
+    load_people(signups, config)
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        cached = load_people(signups, config)
+    assert "No slack column found." in caplog.messages
+    assert cached.store.warnings == [
+        "No message column found.",
+        "No slack column found.",
+    ]
+
+
+def test_prune_cache(cache_dir):
+    cache_dir.mkdir()
+    (cache_dir / "templates").mkdir()
+    entries = []
+    for i in range(4):
+        entry = cache_dir / (str(i) * 64)
+        entry.mkdir()
+        (entry / "ids.npy").write_bytes(b"x" * 100)
+        os.utime(entry, (1000 + i, 1000 + i))
+        entries.append(entry)
+    # Too old
+    assert prune_cache(cache_dir, max_age=10, now=1010.5) == [entries[0]]
+    # Least recently used first
+    assert prune_cache(cache_dir, max_bytes=250, now=1003) == [entries[1]]
+    assert sorted(p.name for p in cache_dir.iterdir()) == [
+        "2" * 64,
+        "3" * 64,
+        "templates",
+    ]
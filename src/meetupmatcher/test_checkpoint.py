@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+
+from meetupmatcher.checkpoint import load_checkpoint, save_checkpoint
+from meetupmatcher.matcher import ProblemStatement, pair_up, solve_numeric
+
+
+@pytest.fixture()
+def problem(monkeypatch):
+    monkeypatch.delenv("MEETUPMATCHER_TESTING", raising=False)
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((20, 14)) < 0.6
+    notwo = rng.random(20) < 0.3
+    sn = solve_numeric(ProblemStatement(20, notwo.sum()))
+    return sn, np.arange(20), notwo, availabilities
+
+
+@pytest.mark.parametrize(
+    "settings", [{}, {"batch_size": 8}, {"workers": 2, "batch_size": 4}]
+)
+@pytest.mark.parametrize("filename", ["state.json", "state.json.gz"])
+def test_resume_reproducible(problem, tmp_path, settings, filename):
+    max_tries = 3000 if "workers" in settings else 150
+    states = []
+    result, statistics = pair_up(
+        *problem,
+        rng=np.random.default_rng(1),
+        max_tries=max_tries,
+        on_checkpoint=states.append,
+        checkpoint_interval=0,
+        **settings,
+    )
+    assert len(states) >= 2
+    path = tmp_path / filename
+    save_checkpoint(path, states[len(states) // 2])
+    resumed, resumed_statistics = pair_up(
+        *problem,
+        rng=np.random.default_rng(123),
+        max_tries=max_tries,
+        resume_from=load_checkpoint(path),
+        **settings,
+    )
+    assert resumed.segmentation == result.segmentation
+    assert resumed.removed == result.removed
+    np.testing.assert_array_equal(resumed.cost, result.cost)
+    np.testing.assert_array_equal(
+        resumed.joint_availabilities, result.joint_availabilities
+    )
+    np.testing.assert_array_equal(resumed_statistics.df, statistics.df)
+
+
+def test_resume_finished(problem):
+    states = []
+    result, _ = pair_up(
+        *problem,
+        rng=np.random.default_rng(1),
+        max_tries=20,
+        on_checkpoint=states.append,
+    )
+    # Only the final checkpoint
+    assert len(states) == 1
+    resumed, _ = pair_up(*problem, max_tries=20, resume_from=states[0])
+    assert resumed.segmentation == result.segmentation
+
+
+def test_resume_different_problem(problem):
+    states = []
+    pair_up(*problem, max_tries=20, on_checkpoint=states.append)
+    with pytest.raises(ValueError):
+        pair_up(*problem, max_tries=20, batch_size=2, resume_from=states[0])
+    sn, idx, notwo, availabilities = problem
+    with pytest.raises(ValueError):
+        pair_up(sn, idx, notwo, ~availabilities, resume_from=states[0])
+
+
+def test_load_checkpoint_version(problem, tmp_path):
+    states = []
+    pair_up(*problem, max_tries=20, on_checkpoint=states.append)
+    path = tmp_path / "state.json"
+    save_checkpoint(path, states[0])
+    data = json.loads(path.read_text())
+    data["version"] = 0
+    path.write_text(json.dumps(data))
+    with pytest.raises(ValueError):
+        load_checkpoint(path)
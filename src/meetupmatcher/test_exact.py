@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import itertools
+
+import numpy as np
+import pytest
+
+from meetupmatcher.exact import ExactStrategy, solve_exact
+from meetupmatcher.matcher import (
+    NoSolution,
+    ProblemStatement,
+    SolutionNumbers,
+    get_strategy,
+    solve_numeric,
+)
+
+
+def _brute_force(sizes: list[int], notwo, availabilities) -> list[int]:
+    """Best objective function by trying all assignments"""
+    best = None
+    n_people = len(availabilities)
+    for perm in itertools.permutations(range(n_people)):
+        cost = [0] * (availabilities.sum(axis=1).max() + 1)
+        start = 0
+        valid = True
+        for size in sizes:
+            group = list(perm[start : start + size])
+            start += size
+            if size == 2 and notwo[group].any():
+                valid = False
+                break
+            cost[availabilities[group].all(axis=0).sum()] += 1
+        if valid and (best is None or cost < best):
+            best = cost
+    assert best is not None
+    return best
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_solve_exact_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    availabilities = rng.random((7, 6)) < 0.6
+    notwo = np.array([True, False, False, False, False, False, True])
+    sn = solve_numeric(ProblemStatement(7, notwo.sum()))
+    result, statistics = solve_exact(
+        sn, np.arange(7), notwo, availabilities, rng=rng, warm_start_steps=0
+    )
+    assert statistics.optimal
+    sizes = [i + 2 for i, n in enumerate(sn.partitions) for _ in range(n)]
+    assert result.cost.tolist() == _brute_force(sizes, notwo, availabilities)
+    np.testing.assert_array_equal(statistics.lower_bound, result.cost)
+    for group, joint in zip(result.segmentation, result.joint_availabilities):
+        np.testing.assert_array_equal(joint, availabilities[sorted(group)].all(axis=0))
+
+
+def test_solve_exact_removed():
+    availabilities = np.array([[1, 0], [1, 0], [0, 1], [0, 1], [1, 1]], dtype=bool)
+    sn = SolutionNumbers((0, 0, 1), removed=1)
+    result, statistics = solve_exact(
+        sn, np.arange(10, 15), availabilities=availabilities, warm_start_steps=0
+    )
+    assert statistics.optimal
+    np.testing.assert_array_equal(result.cost, [2, 0, 0])
+    assert len(result.removed) == 1
+
+
+def test_solve_exact_time_budget():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((40, 14)) < 0.5
+    sn = solve_numeric(ProblemStatement(40, 0))
+    result, statistics = solve_exact(
+        sn, np.arange(40), availabilities=availabilities, rng=rng, time_budget=0
+    )
+    assert not statistics.optimal
+    assert statistics.lower_bound.tolist() <= result.cost.tolist()
+    assert set.union(*result.segmentation) | result.removed == set(range(40))
+
+
+def test_solve_exact_time_budget_removed():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((41, 14)) < 0.5
+    sn = SolutionNumbers((0, 10, 2), removed=3)
+    result, statistics = solve_exact(
+        sn, np.arange(41), availabilities=availabilities, rng=rng, time_budget=0
+    )
+    assert not statistics.optimal
+    assert statistics.lower_bound[0] >= sn.removed
+    assert statistics.lower_bound.tolist() <= result.cost.tolist()
+    assert len(result.removed) == sn.removed
+
+
+def test_solve_exact_no_solution():
+    sn = SolutionNumbers((1, 0, 0))
+    with pytest.raises(NoSolution):
+        solve_exact(sn, np.arange(2), np.array([True, True]), warm_start_steps=0)
+
+
+def test_get_strategy_exact():
+    strategy = get_strategy("exact", time_budget=1)
+    assert isinstance(strategy, ExactStrategy)
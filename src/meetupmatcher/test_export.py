@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import email
+import json
+import mailbox
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from meetupmatcher.config import Config
+from meetupmatcher.data import People
+from meetupmatcher.export import (
+    MailArchive,
+    cost_records,
+    group_records,
+    statistics_summary,
+    write_records,
+)
+from meetupmatcher.matcher import PairUpResult, PairUpStatistics
+from meetupmatcher.templating import Email
+
+
+@pytest.fixture()
+def people(tmp_path) -> People:
+    path = tmp_path / "config.yaml"
+    path.write_text("availabilities:\n  columns:\n    - Lunch\n")
+    return People(
+        pd.DataFrame(
+            {
+                "name": [f"Person {i} " for i in range(5)],
+                "email": [f"p{i}@example.com" for i in range(5)],
+                "Lunch": ["Mon, Tue", "Mon", "Mon, Tue", "Tue", "Tue"],
+            }
+        ),
+        config=Config(path),
+    )
+
+
+def _result(people: People) -> PairUpResult:
+    ids = people.ids.tolist()
+    return PairUpResult(
+        [{ids[0], ids[1]}, {ids[3], ids[4]}],
+        {ids[2]},
+        cost=np.zeros(3, dtype=int),
+        joint_availabilities=np.array([[True, False], [False, True]]),
+    )
+
+
+def test_group_records(people):
+    records = list(group_records(_result(people), people))
+    assert records[0] == {
+        "email": "p0@example.com",
+        "name": "Person 0",
+        "group": 0,
+        "group_size": 2,
+        "availabilities": ["Lunch Mon"],
+    }
+    assert [r["group"] for r in records] == [0, 0, 1, 1, None]
+    assert records[-1]["email"] == "p2@example.com"
+
+
+def test_write_records_jsonl(people, tmp_path):
+    path = tmp_path / "groups.jsonl"
+    assert write_records(path, group_records(_result(people), people)) == 5
+    lines = path.read_text().splitlines()
+    assert json.loads(lines[2])["availabilities"] == ["Lunch Tue"]
+    with pytest.raises(ValueError):
+        write_records(tmp_path / "groups.csv", [])
+
+
+def test_write_records_parquet(people, tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "groups.parquet"
+    write_records(path, group_records(_result(people), people))
+    df = pd.read_parquet(path)
+    assert df["group"].tolist()[:4] == [0, 0, 1, 1]
+    assert df["group"].isna().tolist()[4]
+
+
+def test_statistics():
+    statistics = PairUpStatistics(
+        pd.DataFrame([np.array([3, 1]), np.array([2, 5])]),
+        best=np.array([2, 5]),
+        solution_pair_avs=np.array([[True, False], [True, True]]),
+    )
+    assert list(cost_records(statistics)) == [
+        {"trial": 0, "cost_0": 3, "cost_1": 1},
+        {"trial": 1, "cost_0": 2, "cost_1": 5},
+    ]
+    summary = statistics_summary(statistics)
+    assert summary["best"] == [2, 5]
+    assert summary["solution_availabilities"] == [1, 2]
+    json.dumps(summary)
+
+
+def _emails() -> list[Email]:
+    return [Email([f"p{i}@example.com"], f"Group {i}", f"Hi p{i}!") for i in range(3)]
+
+
+def test_mail_archive_mbox(tmp_path):
+    path = tmp_path / "mails.mbox"
+    path.write_text("old content")
+    with MailArchive(path, from_address="coffee@example.com") as archive:
+        assert list(archive.tee(_emails())) == _emails()
+    messages = list(mailbox.mbox(path))
+    assert [m["To"] for m in messages] == [f"p{i}@example.com" for i in range(3)]
+    assert messages[0]["From"] == "coffee@example.com"
+    assert messages[2].get_payload().strip() == "Hi p2!"
+
+
+def test_mail_archive_eml(tmp_path):
+    with MailArchive(tmp_path / "mails") as archive:
+        for mail in _emails():
+            archive.write(mail)
+    paths = sorted((tmp_path / "mails").iterdir())
+    assert [p.name for p in paths] == ["00000.eml", "00001.eml", "00002.eml"]
+    message = email.message_from_bytes(paths[1].read_bytes())
+    assert message["Subject"] == "Group 1"
+    with pytest.raises(ValueError):
+        MailArchive(tmp_path / "mails", format="maildir")
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import numpy as np
+
+from meetupmatcher.history import MatchHistory
+
+
+def test_history(tmp_path):
+    history = MatchHistory()
+    history.add_round([["a", "b", "c"], ["d", "e"]])
+    history.add_round([["a", "d"], ["b", "c", "f"]])
+    assert len(history) == 7
+    assert history.n_rounds == 2
+    path = tmp_path / "history.npz"
+    history.save(path)
+    loaded = MatchHistory.load(path)
+    assert loaded.emails == history.emails
+    np.testing.assert_array_equal(loaded.keys, history.keys)
+    met = loaded.met(["f", "a", "x", "c", "d"])
+    expected = np.full((5, 5), False)
+    for i, j in [(0, 3), (1, 3), (1, 4)]:
+        expected[i, j] = expected[j, i] = True
+    np.testing.assert_array_equal(met, expected)
+
+
+def test_history_empty():
+    assert not MatchHistory().met(["a", "b"]).any()
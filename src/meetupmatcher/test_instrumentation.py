@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import pstats
+from collections import Counter
+
+import pytest
+
+from meetupmatcher.instrumentation import Profiler, SearchCounters
+
+
+def test_search_counters():
+    a = SearchCounters(n_tries=3, n_complete=1, aborts_by_group=Counter({0: 2}))
+    a.update(
+        SearchCounters(
+            n_tries=2, n_incompatible=1, aborts_by_group=Counter({0: 1, 4: 1})
+        )
+    )
+    assert a.n_tries == 5
+    assert a.n_aborted == 4
+    data = a.to_dict()
+    assert data["aborts_by_group"] == {"0": 3, "4": 1}
+    assert data["n_incompatible"] == 1
+    assert data["n_aborted"] == 4
+
+
+def test_profiler(tmp_path):
+    path = tmp_path / "out.prof"
+    with Profiler(path) as profiler:
+        assert sorted(range(1000), key=lambda x: -x)[0] == 999
+    assert pstats.Stats(str(path)).total_calls > 0
+    top = profiler.top(5)
+    assert 0 < len(top) <= 5
+    assert {"function", "n_calls", "total_time", "cumulative_time"} == set(top[0])
+
+
+def test_unknown_profiler(tmp_path):
+    with pytest.raises(ValueError):
+        Profiler(tmp_path / "out.prof", "perf")
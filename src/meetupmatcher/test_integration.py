@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import json
+import mailbox
 import os
+import subprocess
+import sys
 from pathlib import Path
 
 import pytest
 from click.testing import CliRunner
 
+from meetupmatcher.history import MatchHistory
 from meetupmatcher.main import main
 from meetupmatcher.util.compat_resource import resources
 from meetupmatcher.util.log import logger
@@ -97,6 +102,373 @@ def test_unspecified_config():
     )
 
 
+def test_stdin():
+    tfd = test_files_dir
+    command = _build_command(Path("-"), tfd / "default.yaml")
+    result = CliRunner(mix_stderr=False).invoke(
+        main,
+        command,
+        input=(tfd / "default.csv").read_text(),
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert result.output == (tfd / "default.txt").read_text()
+
+
+def test_cached(cache_dir):
+    tfd = test_files_dir
+    for _ in range(2):
+        _test_expected_output(
+            inpt=tfd / "availabilities.csv",
+            config=tfd / "availabilities.yaml",
+            outpt=tfd / "availabilities.txt",
+        )
+    # One prepared participant table and the compiled templates
+    assert sorted(p.name == "templates" for p in cache_dir.iterdir()) == [False, True]
+
+
+def test_rematch(tmp_path):
+    tfd = test_files_dir
+    state = tmp_path / "state.json"
+    command = _build_command(
+        tfd / "default.csv", tfd / "default.yaml", ["--save-state", str(state)]
+    )
+    assert _run_command(command).exit_code == 0
+    lines = (tfd / "default.csv").read_text().splitlines()
+    # One person drops out, one joins
+    lines = [line for line in lines if "email3@" not in line]
+    lines.append('16,"name16","email16@sdf.x","",False')
+    changed = tmp_path / "changed.csv"
+    changed.write_text("\n".join(lines) + "\n")
+    command = _build_command(changed, tfd / "default.yaml", ["--rematch", str(state)])
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert 1 <= result.output.count("Subject:") <= 2
+    assert "email16@sdf.x" in result.output
+
+
+def test_journal_reuses_groups(tmp_path, monkeypatch):
+    from meetupmatcher import main as main_module
+    from meetupmatcher.mails import MailSender
+
+    delivered: list[list[str]] = []
+
+    class FlakySender(MailSender):
+        fail_after: int | None = 2
+
+        def _send(self, emails):
+            for mail in emails:
+                if len(delivered) == self.fail_after:
+                    raise ConnectionError("Server went away")
+                delivered.append(mail.to)
+                self._delivered(mail)
+
+    monkeypatch.setattr(
+        main_module,
+        "get_mail_sender",
+        lambda config, dry_run, dump_file, **kwargs: FlakySender(dry_run, **kwargs),
+    )
+    tfd = test_files_dir
+    command = [
+        str(tfd / "availabilities.csv"),
+        "--config",
+        str(tfd / "availabilities.yaml"),
+        "--seed",
+        "0",
+        "--journal",
+        str(tmp_path / "journal.sqlite"),
+    ]
+    with pytest.raises(ConnectionError):
+        _run_command(command)
+    assert len(delivered) == 2
+    FlakySender.fail_after = None
+    # Another strategy finds other groups, but the saved ones are sent
+    assert _run_command([*command, "--strategy", "annealing"]).exit_code == 0
+    recipients = [r for to in delivered for r in to]
+    assert len(recipients) == len(set(recipients)) == 10
+    assert (tmp_path / "journal.sqlite.0.groups.json").is_file()
+
+
+def test_batched():
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        additional_args=["--batch-size", "16"],
+    )
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert result.output.count("Subject:") == 3
+
+
+def test_jobs():
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv", tfd / "availabilities.yaml", ["--jobs", "2"]
+    )
+    outputs = [_run_command(command).output for _ in range(2)]
+    assert outputs[0] == outputs[1]
+    assert outputs[0].count("Subject:") == 3
+
+
+def test_refine():
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv", tfd / "availabilities.yaml", ["--refine"]
+    )
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert result.output.count("Subject:") == 3
+
+
+def test_annealing_strategy():
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--strategy", "annealing"],
+    )
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert result.output.count("Subject:") == 3
+
+
+@pytest.mark.parametrize("strategy", ["sampling", "annealing", "exact", "sharded"])
+def test_time_limit(strategy):
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--strategy", strategy, "--time-limit", "10"],
+    )
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert result.output.count("Subject:") == 3
+
+
+def test_checkpoint_resume(tmp_path):
+    tfd = test_files_dir
+    checkpoint = tmp_path / "checkpoint.json"
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--checkpoint", str(checkpoint), "--resume"],
+    )
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert checkpoint.is_file()
+    resumed = _run_command(command)
+    assert resumed.exit_code == 0
+    assert resumed.output == result.output
+
+
+def test_resume_without_checkpoint():
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv", tfd / "availabilities.yaml", ["--resume"]
+    )
+    assert _run_command(command).exit_code != 0
+
+
+def test_unknown_strategy():
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv", tfd / "availabilities.yaml", ["--strategy", "x"]
+    )
+    result = _run_command(command)
+    assert result.exit_code != 0
+
+
+@pytest.mark.parametrize(
+    "option", [["--batch-size", "4"], ["--checkpoint", "x.pkl"], ["--history", "x"]]
+)
+def test_sampling_only_options(option):
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--strategy", "annealing", *option],
+    )
+    result = _run_command(command)
+    assert result.exit_code != 0
+    assert "Only supported for the sampling strategy" in result.stderr
+
+
+def test_history(tmp_path):
+    tfd = test_files_dir
+    history = tmp_path / "history.npz"
+    MatchHistory(["email0@sdf.x", "email1@sdf.x"]).save(history)
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--history", str(history)],
+    )
+    result = _run_command(command)
+    assert result.exit_code == 0
+    assert result.output.count("Subject:") == 3
+    # Dry runs don't change the history
+    assert MatchHistory.load(history).n_rounds == 0
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--history", str(history), "--strategy", "annealing"],
+    )
+    assert _run_command(command).exit_code != 0
+
+
+def test_group_sizes(tmp_path):
+    tfd = test_files_dir
+    config = tmp_path / "config.yaml"
+    config.write_text(
+        (tfd / "availabilities.yaml").read_text()
+        + "group_sizes:\n  preferred: 5\n  max_size: 5\n"
+    )
+    result = _run_command(_build_command(tfd / "availabilities.csv", config))
+    assert result.exit_code == 0
+    assert result.output.count("Subject:") == 2
+    config.write_text("group_sizes:\n  preferred: 2\n")
+    command = _build_command(tfd / "availabilities.csv", config)
+    assert _run_command(command).exit_code != 0
+
+
+def test_search_stats(tmp_path):
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        [
+            "--search-stats",
+            str(tmp_path / "stats.json"),
+            "--profile",
+            str(tmp_path / "matching.prof"),
+        ],
+    )
+    assert _run_command(command).exit_code == 0
+    stats = json.loads((tmp_path / "stats.json").read_text())
+    assert stats["search"]["n_tries"] >= 3
+    assert stats["profile"]
+    assert (tmp_path / "matching.prof").is_file()
+
+
+def test_export(tmp_path):
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        [
+            "--export-groups",
+            str(tmp_path / "groups.jsonl"),
+            "--export-mails",
+            str(tmp_path / "mails.mbox"),
+            "--matching-stats",
+            str(tmp_path / "costs.jsonl"),
+            "--dump-mails",
+            str(tmp_path / "mails.txt"),
+        ],
+    )
+    assert _run_command(command).exit_code == 0
+    records = [
+        json.loads(line)
+        for line in (tmp_path / "groups.jsonl").read_text().splitlines()
+    ]
+    assert {r["email"] for r in records if r["group"] is not None}
+    n_dumped = (tmp_path / "mails.txt").read_text().count("\n" + "-" * 80 + "\n") + 1
+    assert len(mailbox.mbox(tmp_path / "mails.mbox")) == n_dumped
+    costs = (tmp_path / "costs.jsonl").read_text().splitlines()
+    assert json.loads(costs[0])["trial"] == 0
+
+
+def test_export_bad_format(tmp_path):
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        ["--export-groups", str(tmp_path / "groups.csv")],
+    )
+    result = _run_command(command)
+    assert result.exit_code != 0
+    assert ".jsonl or .parquet" in result.stderr
+
+
+@pytest.mark.parametrize("option", ["--export-groups", "--matching-stats"])
+def test_export_parquet_without_engine(tmp_path, monkeypatch, option):
+    import importlib.util
+
+    from meetupmatcher import cache
+
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(
+        importlib.util,
+        "find_spec",
+        lambda name, *args: (
+            None if name in ("pyarrow", "fastparquet") else find_spec(name, *args)
+        ),
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Input should not be read")
+
+    monkeypatch.setattr(cache, "load_people", fail)
+    tfd = test_files_dir
+    command = _build_command(
+        tfd / "availabilities.csv",
+        tfd / "availabilities.yaml",
+        [option, str(tmp_path / "out.parquet")],
+    )
+    result = _run_command(command)
+    assert result.exit_code != 0
+    assert "pip install pyarrow" in result.stderr
+    assert not (tmp_path / "out.parquet").exists()
+
+
+#: Slow to import and not needed to parse arguments
+HEAVY_MODULES = {"numpy", "pandas", "jinja2", "yagmail", "yaml", "dateutil"}
+
+
+def _import_times(*args: str) -> dict[str, int]:
+    """Cumulative import time (microseconds) of every module that is imported
+    by ``python -X importtime *args``
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["-c", "import meetupmatcher.main"], ["-m", "meetupmatcher.main", "--help"]],
+)
+def test_fast_start(args):
+    times = _import_times(*args)
+    heavy = {name for name in times if name.split(".")[0] in HEAVY_MODULES}
+    assert not heavy, (
+        f"Imported {sorted(heavy)}: Import them where they are needed. "
+        f"meetupmatcher.main took {times['meetupmatcher.main'] / 1e6:.2f}s"
+    )
+
+
+def test_dry_run_without_yagmail():
+    tfd = test_files_dir
+    times = _import_times(
+        "-m",
+        "meetupmatcher.main",
+        *_build_command(tfd / "availabilities.csv", tfd / "availabilities.yaml"),
+    )
+    assert "pandas" in times
+    assert "yagmail" not in times
+
+
 if __name__ == "__main__":
     os.environ["MEETUPMATCHER_TESTING"] = "True"
     # Update all test outputs
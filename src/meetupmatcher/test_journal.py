@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from meetupmatcher.journal import SendJournal, message_key
+from meetupmatcher.templating import Email
+
+
+def test_message_key():
+    mail = Email(["a@x", "b@x"], "Coffee", "Hi")
+    assert message_key(mail, "1") == message_key(
+        Email(["b@x", "a@x"], "Coffee", ""), "1"
+    )
+    assert message_key(mail, "1") != message_key(mail, "2")
+    assert message_key(mail, "1") != message_key(Email(["a@x"], "Coffee", "Hi"), "1")
+
+
+def test_send_journal(tmp_path):
+    mail = Email(["a@x", "b@x"], "Coffee", "Hi")
+    with SendJournal(tmp_path / "journal.sqlite") as journal:
+        assert not journal.is_sent(mail, "1")
+        journal.record(mail, "1")
+        journal.record(mail, "1")
+        assert journal.is_sent(mail, "1")
+        assert not journal.is_sent(mail, "2")
+    with SendJournal(tmp_path / "journal.sqlite") as journal:
+        assert journal.is_sent(mail, "1")
+        assert len(journal) == 1
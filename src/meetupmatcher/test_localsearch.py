@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import numpy as np
+
+from meetupmatcher.localsearch import refine
+from meetupmatcher.matcher import (
+    PairUpResult,
+    ProblemStatement,
+    lexicographic_greater,
+    pair_up,
+    solve_numeric,
+)
+
+
+def test_refine():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((40, 14)) < 0.7
+    notwo = rng.random(40) < 0.5
+    idx = np.arange(100, 140)
+    sn = solve_numeric(ProblemStatement(40, notwo.sum()))
+    result, _ = pair_up(sn, idx, notwo, availabilities, rng=rng, batch_size=4)
+    refined = refine(result, idx, notwo, availabilities)
+    assert not lexicographic_greater(refined.cost, result.cost)
+    assert sorted(map(len, refined.segmentation)) == sorted(
+        map(len, result.segmentation)
+    )
+    assert set.union(*refined.segmentation) | refined.removed == set(idx)
+    cost = np.zeros_like(refined.cost)
+    for group, joint in zip(refined.segmentation, refined.joint_availabilities):
+        positions = sorted(p - 100 for p in group)
+        np.testing.assert_array_equal(joint, availabilities[positions].all(axis=0))
+        if len(group) == 2:
+            assert not notwo[positions].any()
+        cost[joint.sum()] += 1
+    np.testing.assert_array_equal(cost, refined.cost)
+
+
+def test_refine_swap():
+    a, b = [True, True, False, False], [False, False, True, True]
+    availabilities = np.array([a, a, b, b, b, b, a, a])
+    result = PairUpResult(
+        [{0, 2, 3, 4}, {1, 5, 7}],
+        {6},
+        cost=np.array([3, 0, 0, 0, 0]),
+        joint_availabilities=np.full((2, 4), False),
+    )
+    refined = refine(result, np.arange(8), availabilities=availabilities)
+    assert sorted(map(sorted, refined.segmentation)) == [[0, 1, 7], [2, 3, 4, 5]]
+    assert refined.removed == {6}
+    np.testing.assert_array_equal(refined.cost, [1, 0, 2, 0, 0])
+
+
+def test_refine_move():
+    a, b = [True, False], [False, True]
+    availabilities = np.array([a, a, b, b, b, a, a])
+    result = PairUpResult(
+        [{0, 1, 2, 5}, {3, 4, 6}],
+        set(),
+        cost=np.array([2, 0, 0]),
+        joint_availabilities=np.full((2, 2), False),
+    )
+    refined = refine(result, np.arange(7), availabilities=availabilities)
+    assert sorted(map(sorted, refined.segmentation)) == [[0, 1, 5, 6], [2, 3, 4]]
+    np.testing.assert_array_equal(refined.cost, [0, 2, 0])
+
+
+def test_refine_met():
+    rng = np.random.default_rng(1)
+    availabilities = rng.random((30, 10)) < 0.7
+    met = np.zeros((30, 30), dtype=bool)
+    for _ in range(3):
+        groups = rng.permutation(30).reshape(10, 3)
+        for group in groups:
+            met[np.ix_(group, group)] = True
+    np.fill_diagonal(met, False)
+    idx = np.arange(30)
+    sn = solve_numeric(ProblemStatement(30, 0))
+    result, _ = pair_up(sn, idx, None, availabilities, rng=rng, met=met)
+    refined = refine(result, idx, availabilities=availabilities, met=met)
+    assert not lexicographic_greater(refined.cost, result.cost)
+    cost = np.zeros_like(refined.cost)
+    for group, joint in zip(refined.segmentation, refined.joint_availabilities):
+        members = sorted(group)
+        repeated = met[np.ix_(members, members)].any()
+        cost[0 if repeated else joint.sum()] += 1
+    np.testing.assert_array_equal(cost, refined.cost)
+
+
+def test_refine_swap_met():
+    a, b = [True, True, False, False], [False, False, True, True]
+    availabilities = np.array([a, a, b, b, b, b, a, a])
+    met = np.zeros((8, 8), dtype=bool)
+    met[0, 1] = met[1, 0] = True
+    result = PairUpResult(
+        [{0, 2, 3, 4}, {1, 5, 7}],
+        {6},
+        cost=np.array([3, 0, 0, 0, 0]),
+        joint_availabilities=np.full((2, 4), False),
+    )
+    refined = refine(result, np.arange(8), availabilities=availabilities, met=met)
+    assert not any({0, 1} <= group for group in refined.segmentation)
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import base64
+import email
+import smtplib
+import socket
+import socketserver
+import ssl
+import threading
+from collections import Counter
+
+import pytest
+
+from meetupmatcher.journal import SendJournal
+from meetupmatcher.mails import (
+    RetryPolicy,
+    SendError,
+    SMTPPoolSender,
+    SMTPSettings,
+    TokenBucket,
+    is_transient,
+)
+from meetupmatcher.templating import Email
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for `smtplib`"""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        server: _SMTPServer = self.server  # type: ignore[assignment]
+        with server.lock:
+            server.n_connections += 1
+        self.reply("220 localhost")
+        recipients: list[str] = []
+        n_sent = 0
+        while line := self.rfile.readline().decode().rstrip("\r\n"):
+            command = line.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN")
+            elif command == "AUTH":
+                credentials = base64.b64decode(line.split()[2]).split(b"\0")
+                server.logins.append(tuple(c.decode() for c in credentials[1:]))
+                self.reply("235 Authenticated")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip("<> ")
+                if address in server.refuse:
+                    self.reply("550 No such user")
+                elif server.defer[address] > 0:
+                    server.defer[address] -= 1
+                    self.reply("451 Try again later")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 Go ahead")
+                data = b""
+                while (chunk := self.rfile.readline()) != b".\r\n":
+                    data += chunk
+                with server.lock:
+                    server.messages.append((recipients, email.message_from_bytes(data)))
+                self.reply("250 OK")
+                n_sent += 1
+                if n_sent == server.drop_after:
+                    # Pretend that the server closed an idle connection
+                    return
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.messages: list = []
+        self.logins: list = []
+        self.n_connections = 0
+        self.refuse: set[str] = set()
+        #: Number of times to reject these recipients temporarily
+        self.defer: Counter = Counter()
+        self.drop_after: int | None = None
+
+
+@pytest.fixture()
+def smtp_server():
+    server = _SMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _settings(server: _SMTPServer, connections: int) -> SMTPSettings:
+    return SMTPSettings(
+        host="127.0.0.1",
+        port=server.server_address[1],
+        username="coffee@example.com",
+        password="secret",
+        security="none",
+        connections=connections,
+        rate=1000,
+    )
+
+
+def _sender(server: _SMTPServer, connections: int = 1, **kwargs) -> SMTPPoolSender:
+    return SMTPPoolSender(
+        _settings(server, connections=connections),
+        dry_run=False,
+        retry=RetryPolicy(base_delay=0),
+        **kwargs,
+    )
+
+
+def _emails(n: int) -> list[Email]:
+    return [Email([f"p{i}@example.com"], f"Group {i}", f"Hi p{i}!") for i in range(n)]
+
+
+def test_token_bucket():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(2.0, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+    assert waits == [0.5, 0.5]
+    now[0] += 10
+    bucket.acquire()
+    assert len(waits) == 2
+
+
+def test_settings_from_config():
+    config = {"host": "smtp.example.com", "username": "a@example.com", "port": 25}
+    settings = SMTPSettings.from_config(
+        config, {"MEETUPMATCHER_SMTP_PASSWORD": "pw", "MEETUPMATCHER_SMTP_PORT": "465"}
+    )
+    assert settings == SMTPSettings(
+        "smtp.example.com", 465, username="a@example.com", password="pw"
+    )
+    assert settings.from_address == "a@example.com"
+    assert SMTPSettings.from_config(None, {}) is None
+    with pytest.raises(ValueError):
+        SMTPSettings(host="x", security="tls")
+
+
+def test_smtp_pool_sender(smtp_server):
+    _sender(smtp_server, 3).send(_emails(10))
+    assert sorted(r[0] for r, _ in smtp_server.messages) == sorted(
+        f"p{i}@example.com" for i in range(10)
+    )
+    _, message = smtp_server.messages[0]
+    assert message["From"] == "coffee@example.com"
+    assert message.get_payload().startswith("Hi p")
+    # Connections are only opened when a worker gets an email
+    assert 1 <= smtp_server.n_connections <= 3
+    assert (
+        smtp_server.logins
+        == [("coffee@example.com", "secret")] * smtp_server.n_connections
+    )
+
+
+def test_smtp_pool_sender_reconnect(smtp_server):
+    smtp_server.drop_after = 2
+    _sender(smtp_server).send(_emails(5))
+    assert len(smtp_server.messages) == 5
+    assert smtp_server.n_connections == 3
+
+
+def test_smtp_pool_sender_failure(smtp_server):
+    smtp_server.refuse = {"p1@example.com"}
+    sender = _sender(smtp_server, 2)
+    with pytest.raises(SendError) as e:
+        sender.send(_emails(4))
+    assert [mail.to for mail, _ in e.value.failed] == [["p1@example.com"]]
+    assert len(smtp_server.messages) == 3
+
+
+def test_smtp_pool_sender_streaming(smtp_server):
+    ahead = []
+
+    def emails():
+        for i, mail in enumerate(_emails(20)):
+            # Number of emails that were produced but not sent yet
+            ahead.append(i - len(smtp_server.messages))
+            yield mail
+
+    _sender(smtp_server, 2).send(emails())
+    assert len(smtp_server.messages) == 20
+    # At most two emails per connection wait in the queue, one is being sent
+    assert max(ahead) <= 3 * 2
+
+
+def test_smtp_pool_sender_producer_fails(smtp_server):
+    def emails():
+        yield from _emails(3)
+        raise RuntimeError("Template error")
+
+    with pytest.raises(RuntimeError, match="Template error"):
+        _sender(smtp_server).send(emails())
+    assert len(smtp_server.messages) == 3
+
+
+def test_send_dry_run(tmp_path, capsys):
+    mails = _emails(3)
+    expected = ("\n" + "-" * 80 + "\n").join(mail.to_str() for mail in mails)
+    dump_file = tmp_path / "mails.txt"
+    SMTPPoolSender(SMTPSettings("localhost"), dump_file=dump_file).send(iter(mails))
+    assert dump_file.read_text() == expected
+    SMTPPoolSender(SMTPSettings("localhost")).send(iter(mails))
+    assert capsys.readouterr().out == expected + "\n"
+
+
+def test_retry_policy():
+    waits = []
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise smtplib.SMTPServerDisconnected()
+        return "sent"
+
+    policy = RetryPolicy(attempts=3, base_delay=1.0)
+    assert policy.call(flaky, sleep=waits.append) == "sent"
+    assert waits == [1.0, 2.0]
+    calls.clear()
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        RetryPolicy(attempts=2).call(flaky, sleep=waits.append)
+
+
+def test_is_transient():
+    assert is_transient(smtplib.SMTPDataError(451, "later"))
+    assert not is_transient(smtplib.SMTPAuthenticationError(535, "wrong"))
+    assert is_transient(ConnectionResetError())
+    assert is_transient(socket.timeout())
+    assert is_transient(socket.gaierror())
+    assert is_transient(smtplib.SMTPServerDisconnected())
+    assert not is_transient(smtplib.SMTPNotSupportedError())
+    assert not is_transient(ssl.SSLCertVerificationError())
+    assert not is_transient(PermissionError())
+    assert not is_transient(smtplib.SMTPRecipientsRefused({"a@x": (550, b"no")}))
+
+
+def test_smtp_pool_sender_retry(smtp_server):
+    smtp_server.defer["p2@example.com"] = 2
+    _sender(smtp_server).send(_emails(4))
+    assert len(smtp_server.messages) == 4
+
+
+def test_smtp_pool_sender_journal(smtp_server, tmp_path):
+    smtp_server.refuse = {"p1@example.com"}
+    with SendJournal(tmp_path / "journal.sqlite") as journal:
+        with pytest.raises(SendError):
+            _sender(smtp_server, journal=journal, round_id="1").send(_emails(4))
+        assert len(journal) == 3
+        smtp_server.refuse = set()
+        _sender(smtp_server, journal=journal, round_id="1").send(_emails(4))
+        assert len(journal) == 4
+    assert [r for r, _ in smtp_server.messages].count(["p1@example.com"]) == 1
+    assert len(smtp_server.messages) == 4
@@ -4,10 +4,18 @@ import numpy as np
 import pytest
 from pytest import raises
 
+from meetupmatcher.bitset import PackedAvailabilities
 from meetupmatcher.matcher import (
+    ENGINES,
+    CostEncoder,
+    GroupSizePreferences,
     NoSolution,
     ProblemStatement,
+    SamplingWeights,
     SolutionNumbers,
+    _draw_rows,
+    iter_pair_up,
+    lexicographic_greater,
     pair_up,
     solve_numeric,
 )
@@ -46,6 +54,37 @@ def test_not_solvable():
             solve_numeric(ProblemStatement(*case))
 
 
+@pytest.mark.parametrize("n", [3000, 100_000])
+def test_solve_numeric_large(n):
+    sn = solve_numeric(ProblemStatement(n, n // 3))
+    assert sn.n_people == n
+    assert sn.removed == 0
+    assert sn.partitions[0] + sn.partitions[2] <= 2
+
+
+@pytest.mark.parametrize(
+    ("ps", "preferences", "partitions", "removed"),
+    [
+        ((5, 0), GroupSizePreferences(max_size=5), (0, 0, 0, 1), 0),
+        ((11, 0), GroupSizePreferences(max_larger_groups=0), (1, 3, 0), 0),
+        ((11, 11), GroupSizePreferences(max_larger_groups=0), (0, 3, 0), 2),
+        ((14, 0), GroupSizePreferences(preferred=4), (0, 2, 2), 0),
+        ((7, 0), GroupSizePreferences(min_size=3), (0, 1, 1), 0),
+    ],
+)
+def test_solve_numeric_preferences(ps, preferences, partitions, removed):
+    sn = solve_numeric(ProblemStatement(*ps), preferences)
+    assert sn == SolutionNumbers(partitions, removed=removed)
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"preferred": 2}, {"min_size": 4}, {"max_size": 2}, {"min_size": 1}]
+)
+def test_invalid_preferences(kwargs):
+    with raises(ValueError):
+        GroupSizePreferences(**kwargs)
+
+
 def test_pair_up():
     r, _ = pair_up(
         SolutionNumbers(partitions=(1, 1, 0), removed=0),
@@ -65,3 +104,261 @@ def test_pair_up_no_solution():
             availabilities=np.full((5, 1), False),
             rng=np.random.RandomState(0),
         )
+
+
+def test_pair_up_engines_identical():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((30, 14)) < 0.8
+    notwo = rng.random(30) < 0.3
+    sn = solve_numeric(ProblemStatement(30, notwo.sum()))
+    results = [
+        pair_up(
+            sn,
+            np.arange(30),
+            notwo,
+            availabilities,
+            rng=np.random.default_rng(1),
+            engine=engine,
+        )[0]
+        for engine in ENGINES
+    ]
+    assert results[0].segmentation == results[1].segmentation
+    np.testing.assert_array_equal(results[0].cost, results[1].cost)
+    np.testing.assert_array_equal(
+        results[0].joint_availabilities, results[1].joint_availabilities
+    )
+
+
+def test_pair_up_unknown_engine():
+    with pytest.raises(ValueError):
+        pair_up(SolutionNumbers((0, 1, 0)), np.arange(3), engine="abacus")
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 64])
+def test_pair_up_batched(batch_size: int):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((31, 14)) < 0.8
+    notwo = rng.random(31) < 0.3
+    sn = solve_numeric(ProblemStatement(31, notwo.sum()))
+    r, stats = pair_up(
+        sn,
+        np.arange(31),
+        notwo,
+        availabilities,
+        rng=np.random.default_rng(1),
+        batch_size=batch_size,
+    )
+    assert set.union(*r.segmentation) | r.removed == set(range(31))
+    assert sorted(len(g) for g in r.segmentation) == [3] * 9 + [4]
+    cost = np.zeros_like(r.cost)
+    for group, joint in zip(r.segmentation, r.joint_availabilities):
+        np.testing.assert_array_equal(joint, availabilities[sorted(group)].all(axis=0))
+        cost[joint.sum()] += 1
+    np.testing.assert_array_equal(cost, r.cost)
+    np.testing.assert_array_equal(stats.best, r.cost)
+
+
+@pytest.mark.parametrize("options", [{}, {"batch_size": 8}, {"workers": 2}])
+def test_pair_up_default_notwo(options):
+    availabilities = np.random.default_rng(0).random((10, 6)) < 0.8
+    r, _ = pair_up(
+        SolutionNumbers((2, 2, 0)),
+        np.arange(10),
+        None,
+        availabilities,
+        rng=np.random.default_rng(1),
+        max_tries=20,
+        **options,
+    )
+    assert sorted(len(g) for g in r.segmentation) == [2, 2, 3, 3]
+    assert set.union(*r.segmentation) == set(range(10))
+
+
+def test_pair_up_keeps_packed():
+    packed = PackedAvailabilities.from_bool(
+        np.random.default_rng(0).random((10, 6)) < 0.8
+    )
+    pair_up(
+        SolutionNumbers((2, 2, 0)),
+        np.arange(10),
+        None,
+        packed,
+        rng=np.random.default_rng(1),
+        max_tries=5,
+    )
+    assert packed.pairs is None
+
+
+def test_draw_rows():
+    weights = np.array([[0.0, 1.0, 0.0, 3.0], [0.0, 0.0, 0.0, 0.0], [1.0, 0, 0, 0]])
+    chosen, empty = _draw_rows(weights, np.array([0.3, 0.5, 0.999]))
+    np.testing.assert_array_equal(empty, [False, True, False])
+    assert chosen[0] == 3
+    assert chosen[2] == 0
+
+
+def test_pair_up_parallel_deterministic():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((20, 14)) < 0.8
+    sn = solve_numeric(ProblemStatement(20, 0))
+    results = [
+        pair_up(
+            sn,
+            np.arange(20),
+            availabilities=availabilities,
+            rng=np.random.default_rng(1),
+            workers=2,
+        )[0]
+        for _ in range(2)
+    ]
+    assert results[0].segmentation == results[1].segmentation
+    np.testing.assert_array_equal(results[0].cost, results[1].cost)
+    assert set.union(*results[0].segmentation) == set(range(20))
+
+
+def test_cost_encoder():
+    rng = np.random.default_rng(0)
+    encoder = CostEncoder(6, n_people=10)
+    costs = rng.integers(0, 11, size=(200, 6))
+    costs[:, :3] = rng.integers(0, 2, size=(200, 3))
+    keys = [encoder.encode(cost) for cost in costs]
+    for a, key_a in zip(costs[:40], keys):
+        np.testing.assert_array_equal(encoder.decode(key_a), a)
+        for b, key_b in zip(costs, keys):
+            assert (key_a > key_b) == lexicographic_greater(a, b)
+    cost = np.array([1, 0, 2, 0, 0, 3])
+    key = encoder.encode(cost) + encoder.units[3]
+    np.testing.assert_array_equal(encoder.decode(key), [1, 0, 2, 1, 0, 3])
+
+
+@pytest.mark.parametrize("batch_size", [None, 8])
+def test_iter_pair_up(monkeypatch, batch_size):
+    monkeypatch.delenv("MEETUPMATCHER_TESTING", raising=False)
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((20, 14)) < 0.6
+    sn = solve_numeric(ProblemStatement(20, 0))
+    kwargs = dict(availabilities=availabilities, max_tries=200, batch_size=batch_size)
+    costs: list[np.ndarray] = []
+    solutions = list(
+        iter_pair_up(
+            sn, np.arange(20), rng=np.random.default_rng(1), costs=costs, **kwargs
+        )
+    )
+    assert len(solutions) > 1
+    for previous, solution in zip(solutions, solutions[1:]):
+        assert lexicographic_greater(previous.cost, solution.cost)
+    found = []
+    best, statistics = pair_up(
+        sn,
+        np.arange(20),
+        rng=np.random.default_rng(1),
+        callback=found.append,
+        **kwargs,
+    )
+    assert [s.segmentation for s in found] == [s.segmentation for s in solutions]
+    assert best.segmentation == solutions[-1].segmentation
+    assert len(statistics.df) == len(costs)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pair_up_time_budget(workers):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((20, 14)) < 0.8
+    sn = solve_numeric(ProblemStatement(20, 0))
+    with raises(NoSolution):
+        pair_up(
+            sn,
+            np.arange(20),
+            availabilities=availabilities,
+            time_budget=0,
+            workers=workers,
+        )
+    result, _ = pair_up(
+        sn,
+        np.arange(20),
+        availabilities=availabilities,
+        time_budget=60,
+        workers=workers,
+    )
+    assert set.union(*result.segmentation) == set(range(20))
+
+
+@pytest.mark.parametrize(
+    "options", [{"engine": "array"}, {"engine": "bitset"}, {"batch_size": 8}]
+)
+def test_pair_up_avoids_repeats(options):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((24, 10)) < 0.8
+    # Everyone met their neighbors before
+    met = np.full((24, 24), False)
+    for i in range(24):
+        met[i, (i + 1) % 24] = met[(i + 1) % 24, i] = True
+    sn = solve_numeric(ProblemStatement(24, 0))
+    r, _ = pair_up(
+        sn,
+        np.arange(24),
+        availabilities=availabilities,
+        rng=np.random.default_rng(1),
+        weights=SamplingWeights(repeat_weight=0.0),
+        met=met,
+        **options,
+    )
+    for group in r.segmentation:
+        assert not met[np.ix_(sorted(group), sorted(group))].any()
+
+
+def test_pair_up_repeats_cost():
+    # Everyone met before, so every group counts as a group without joint
+    # availabilities
+    r, _ = pair_up(
+        SolutionNumbers((0, 2, 0)),
+        np.arange(6),
+        availabilities=np.full((6, 3), True),
+        rng=np.random.default_rng(0),
+        weights=SamplingWeights(repeat_weight=1.0),
+        met=~np.eye(6, dtype=bool),
+    )
+    np.testing.assert_array_equal(r.cost, [2, 0, 0, 0])
+    np.testing.assert_array_equal(r.joint_availabilities, np.full((2, 3), True))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_pair_up_joint_availabilities(engine):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((20, 8)) < 0.8
+    idx = np.arange(100, 120)
+    r, _ = pair_up(
+        solve_numeric(ProblemStatement(20, 0)),
+        idx,
+        availabilities=availabilities,
+        rng=np.random.default_rng(1),
+        engine=engine,
+    )
+    for group, joint in zip(r.segmentation, r.joint_availabilities):
+        positions = sorted(p - 100 for p in group)
+        np.testing.assert_array_equal(joint, availabilities[positions].all(axis=0))
+
+
+@pytest.mark.parametrize("options", [{}, {"batch_size": 8}, {"workers": 2}])
+def test_pair_up_counters(options):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((30, 10)) < 0.7
+    sn = solve_numeric(ProblemStatement(30, 0))
+    _, stats = pair_up(
+        sn,
+        np.arange(30),
+        availabilities=availabilities,
+        rng=np.random.default_rng(1),
+        **options,
+    )
+    counters = stats.counters
+    assert counters.n_complete == len(stats.df)
+    assert counters.n_improvements >= 1
+    assert counters.n_tries >= counters.n_complete + counters.n_incompatible
+    assert all(0 <= i < sum(sn.partitions) for i in counters.aborts_by_group)
+    assert counters.time_sampling > 0
+    if not options:
+        assert counters.n_tries == (
+            counters.n_complete + counters.n_incompatible + counters.n_aborted
+        )
+    assert stats.to_dict()["search"]["n_tries"] == counters.n_tries
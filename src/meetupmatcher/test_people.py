@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from meetupmatcher.config import Config
+from meetupmatcher.data import People, read_signups
+
+
+@pytest.fixture()
+def config(tmp_path) -> Config:
+    path = tmp_path / "config.yaml"
+    path.write_text("availabilities:\n  columns:\n    - Lunch\n    - Evening\n")
+    return Config(path)
+
+
+def test_availabilities(config):
+    df = pd.DataFrame(
+        {
+            "email": ["a@x", "b@x", "c@x"],
+            "Lunch": ["Tuesday, Mon", "Tue,Mon ,", None],
+            "Evening": ["", "Fri", "Fri, Tue"],
+        }
+    )
+    people = People(df, config=config)
+    assert people._availability_product_cols == [
+        "Lunch Mon",
+        "Lunch Tue",
+        "Lunch Tuesday",
+        "Evening Fri",
+        "Evening Tue",
+    ]
+    np.testing.assert_array_equal(
+        people.availabilities,
+        [
+            [True, False, True, False, False],
+            [True, True, False, True, False],
+            [False, False, False, True, True],
+        ],
+    )
+    assert not set(people._availability_product_cols) & set(people.df.columns)
+
+
+def test_availabilities_empty(config):
+    df = pd.DataFrame({"email": ["a@x", "b@x"], "Lunch": ["", None], "Evening": ""})
+    with pytest.raises(ValueError):
+        People(df, config=config)
+
+
+def test_no_availabilities(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("")
+    people = People(pd.DataFrame({"email": ["a@x", "b@x"]}), config=Config(path))
+    assert people.availabilities is None
+    assert people._availability_product_cols == []
+
+
+def test_participant_store(config):
+    df = pd.DataFrame(
+        {
+            "email": ["a@x", "b@x", "c@x"],
+            "name": ["Ann", None, "Ann"],
+            "Lunch": ["Mon", "Tue", "Mon, Tue"],
+            "Evening": ["Fri", "", "Fri"],
+            "notwo": [True, False, False],
+            "age": [30, 40, 50],
+        },
+        index=pd.Index([7, 3, 5], name="row"),
+    )
+    people = People(df, config=config)
+    store = people.store
+    assert len(store) == 3
+    np.testing.assert_array_equal(store.ids, [7, 3, 5])
+    np.testing.assert_array_equal(store.positions([5, 7]), [2, 0])
+    # Interned: repeated values share a code
+    assert store._columns["name"][0] == store._columns["name"][2]
+    names = store.column("name")
+    assert names[0] == names[2] == "Ann"
+    assert pd.isna(names[1])
+    np.testing.assert_array_equal(store.column("age", np.array([1])), [40])
+    assert store.timeslots == people._availability_product_cols
+    np.testing.assert_array_equal(store.packed.to_bool(), people.availabilities)
+    pd.testing.assert_frame_equal(people.df, df)
+    # Built only once
+    assert people.df is people.df
+    pd.testing.assert_frame_equal(store.frame(np.array([2, 0])), df.loc[[5, 7]])
+
+
+def test_read_signups(config, tmp_path):
+    path = tmp_path / "signups.csv.gz"
+    pd.DataFrame(
+        {
+            "email": [f"{i}@x" for i in range(5)],
+            "Lunch": "Mon",
+            "Evening": ["Fri", None, "Tue", "Fri", ""],
+            "notwo": [True, False, None, False, True],
+            "Comments": "unused",
+        }
+    ).to_csv(path, index=False)
+    df = read_signups(path, config, chunk_size=2)
+    assert list(df.index) == list(range(5))
+    assert "Comments" not in df.columns
+    assert df.notwo.fillna(False).tolist() == [True, False, False, False, True]
+    people = People(df, config=config)
+    assert people.availabilities.shape == (5, 3)
+
+
+def test_read_signups_duplicate_email(config, tmp_path):
+    path = tmp_path / "signups.csv"
+    path.write_text("email,Lunch,Evening\na@x,Mon,\nb@x,Mon,\nc@x,,\na@x,,Fri\n")
+    with pytest.raises(ValueError, match="row 3"):
+        read_signups(path, config, chunk_size=2)
+
+
+def test_read_signups_missing_availability_column(config, tmp_path):
+    path = tmp_path / "signups.csv"
+    path.write_text("email,Lunch\na@x,Mon\n")
+    with pytest.raises(ValueError, match="Evening"):
+        read_signups(path, config)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from meetupmatcher.bitset import PackedAvailabilities
+from meetupmatcher.matcher import (
+    IncompatibleAvailabilities,
+    ProblemStatement,
+    _pair_up_batch,
+    sample_packed,
+    solve_numeric,
+)
+from meetupmatcher.precompute import PairIndex
+
+
+@pytest.mark.parametrize("n_timeslots", [3, 16, 17, 64, 70])
+def test_pair_index(n_timeslots):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((30, n_timeslots)) < 0.2
+    pairs = PairIndex.from_bool(availabilities)
+    expected = availabilities.astype(int) @ availabilities.T.astype(int)
+    np.testing.assert_array_equal(pairs.counts, expected)
+    for person in range(30):
+        candidates = pairs.candidates(person)
+        assert sorted(candidates) == pairs.compatible(person).tolist()
+        assert person not in candidates
+        assert (expected[person, candidates] > 0).all()
+        assert (np.diff(expected[person, candidates]) <= 0).all()
+
+
+def test_sample_packed_with_pair_index():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((50, 10)) < 0.5
+    packed = PackedAvailabilities.from_bool(availabilities)
+    mask = rng.random(50) < 0.8
+    results = []
+    for pairs in [None, PairIndex.from_packed(packed)]:
+        packed.pairs = pairs
+        sample_rng = np.random.default_rng(1)
+        results.append(
+            [sample_packed(mask, n, packed, rng=sample_rng) for n in [2, 3, 4, 4, 3, 2]]
+        )
+    for (group, joint), (group_ref, joint_ref) in zip(*results):
+        np.testing.assert_array_equal(group, group_ref)
+        assert joint == joint_ref
+
+
+def test_sample_packed_incompatible():
+    availabilities = np.array([[1, 0, 0], [0, 1, 1], [0, 1, 1]], dtype=bool)
+    packed = PackedAvailabilities.from_bool(availabilities)
+    packed.pairs = PairIndex.from_packed(packed)
+    with pytest.raises(IncompatibleAvailabilities):
+        sample_packed(np.array([True, True, True]), 2, packed)
+
+
+def test_pair_up_batch_with_pair_index():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((31, 8)) < 0.7
+    notwo = rng.random(31) < 0.3
+    sn = solve_numeric(ProblemStatement(31, notwo.sum()))
+    best_cost = np.zeros(9, dtype=int)
+    best_cost[0] = 31
+    packed = PackedAvailabilities.from_bool(availabilities)
+    costs = []
+    for pairs in [None, PairIndex.from_packed(packed)]:
+        packed.pairs = pairs
+        results, failed = _pair_up_batch(
+            sn,
+            np.arange(31),
+            notwo,
+            best_cost,
+            packed,
+            rng=np.random.default_rng(1),
+            batch_size=16,
+        )
+        costs.append([None if r is None else r.cost.tolist() for r in results])
+        costs.append(failed.tolist())
+    assert costs[0] == costs[2]
+    assert costs[1] == costs[3]
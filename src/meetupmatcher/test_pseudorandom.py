@@ -2,7 +2,14 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from meetupmatcher.pseudorandom import get_seed_from_option, get_weeks_since_epoch
+import numpy as np
+
+from meetupmatcher.pseudorandom import (
+    get_rng_from_seed,
+    get_seed_from_option,
+    get_weeks_since_epoch,
+    spawn_rngs,
+)
 
 
 def test_get_weeks_since_epoch():
@@ -24,3 +31,11 @@ def test_get_seed_from_explicit():
 
 def test_get_seed_from_nothing():
     assert get_seed_from_option("week") >= 2745
+
+
+def test_spawn_rngs():
+    a = [rng.random() for rng in spawn_rngs(get_rng_from_seed(3), 3)]
+    b = [rng.random() for rng in spawn_rngs(get_rng_from_seed(3), 3)]
+    assert a == b
+    assert len(set(a)) == 3
+    assert len(spawn_rngs(np.random.RandomState(0), 2)) == 2
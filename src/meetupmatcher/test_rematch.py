@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from meetupmatcher.config import Config
+from meetupmatcher.data import People
+from meetupmatcher.matcher import GroupSizePreferences, get_strategy
+from meetupmatcher.rematch import MatchState, compare, load_state, rematch, save_state
+
+
+@pytest.fixture()
+def config(tmp_path) -> Config:
+    path = tmp_path / "config.yaml"
+    path.write_text("availabilities:\n  columns:\n    - Lunch\n")
+    return Config(path)
+
+
+def _people(emails: list[str], config: Config) -> People:
+    days = ["Mon", "Tue", "Wed"]
+    return People(
+        pd.DataFrame(
+            {
+                "email": emails,
+                "Lunch": [days[int(e[1:]) % 3] for e in emails],
+                "notwo": [e == "p5" for e in emails],
+            }
+        ),
+        config=config,
+    )
+
+
+def _emails(result, people) -> set[frozenset[str]]:
+    return set(
+        frozenset(people.store.column("email", people.store.positions(g)))
+        for g in result.segmentation
+    )
+
+
+def test_state_roundtrip(tmp_path):
+    state = MatchState([["a@x", "b@x"], ["c@x", "d@x", "e@x"]], removed=["f@x"])
+    save_state(tmp_path / "state.json", state)
+    assert load_state(tmp_path / "state.json") == state
+
+
+def test_rematch(config):
+    strategy = get_strategy("annealing")
+    previous = MatchState(
+        [["p0", "p3", "p6"], ["p1", "p4"], ["p2", "p5", "p8"], ["p9", "p12", "p15"]]
+    )
+    # p8 drops out, its group falls apart because p5 vetoes groups of two.
+    # p9 drops out, but the group can stay as it is. p10 and p11 join.
+    emails = ["p0", "p1", "p2", "p3", "p4", "p5", "p6", "p10", "p11", "p12", "p15"]
+    people = _people(emails, config)
+    update = rematch(previous, people, strategy, rng=np.random.default_rng(0))
+    groups = _emails(update.result, people)
+    assert frozenset({"p0", "p3", "p6"}) in groups
+    assert frozenset({"p1", "p4"}) in groups
+    assert frozenset({"p12", "p15"}) in groups
+    assert set().union(*groups) | set(
+        people.store.column("email", people.store.positions(update.result.removed))
+    ) == set(emails)
+    notified = _emails(update.notifications(), people)
+    assert frozenset({"p12", "p15"}) in notified
+    assert frozenset({"p0", "p3", "p6"}) not in notified
+    assert frozenset({"p1", "p4"}) not in notified
+    assert len(update.changed) == len(notified)
+    again = compare(previous, update.result, people)
+    assert again.changed == update.changed
+    assert again.newly_removed == update.newly_removed
+
+
+def test_rematch_single_newcomer(config):
+    strategy = get_strategy("annealing")
+    previous = MatchState([["p0", "p3"], ["p1", "p4", "p7"]])
+    people = _people(["p0", "p1", "p3", "p4", "p6", "p7"], config)
+    update = rematch(previous, people, strategy, rng=np.random.default_rng(0))
+    groups = _emails(update.result, people)
+    # p6 has lunch on Monday, like p0 and p3
+    assert groups == {frozenset({"p0", "p3", "p6"}), frozenset({"p1", "p4", "p7"})}
+    assert _emails(update.notifications(), people) == {frozenset({"p0", "p3", "p6"})}
+    assert update.result.cost.tolist() == [0, 2]
+
+
+def test_rematch_leftover_to_new_group(config):
+    strategy = get_strategy("annealing")
+    previous = MatchState([["p0", "p3", "p6"]])
+    # The four newcomers form a group of three, one is left over. Everyone has
+    # lunch on Monday, so the leftover could join either group.
+    people = _people(["p0", "p3", "p6", "p9", "p12", "p15", "p18"], config)
+    update = rematch(
+        previous,
+        people,
+        strategy,
+        rng=np.random.default_rng(0),
+        preferences=GroupSizePreferences(min_size=3, max_larger_groups=0),
+    )
+    groups = _emails(update.result, people)
+    assert groups == {
+        frozenset({"p0", "p3", "p6"}),
+        frozenset({"p9", "p12", "p15", "p18"}),
+    }
+    assert _emails(update.notifications(), people) == {
+        frozenset({"p9", "p12", "p15", "p18"})
+    }
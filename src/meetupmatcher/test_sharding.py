@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from meetupmatcher.matcher import ProblemStatement, get_strategy, solve_numeric
+from meetupmatcher.sharding import balanced_shards, pair_up_sharded
+
+
+def test_balanced_shards():
+    rng = np.random.default_rng(0)
+    # Two groups of people with disjoint availabilities
+    availabilities = np.zeros((40, 8), dtype=bool)
+    availabilities[:20, :4] = rng.random((20, 4)) < 0.7
+    availabilities[20:, 4:] = rng.random((20, 4)) < 0.7
+    order = rng.permutation(40)
+    shards = balanced_shards(availabilities[order], 2, rng=rng)
+    assert sorted(map(len, shards)) == [20, 20]
+    assert sorted(np.concatenate(shards)) == list(range(40))
+    for shard in shards:
+        assert len(set(order[shard] < 20)) == 1
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pair_up_sharded(workers):
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((61, 10)) < 0.6
+    notwo = rng.random(61) < 0.3
+    idx = np.arange(100, 161)
+    sn = solve_numeric(ProblemStatement(61, notwo.sum()))
+    r, stats = pair_up_sharded(
+        sn,
+        idx,
+        notwo,
+        availabilities,
+        rng=np.random.default_rng(1),
+        shard_size=20,
+        workers=workers,
+    )
+    assert set.union(*r.segmentation) | r.removed == set(idx)
+    cost = np.zeros_like(r.cost)
+    cost[0] += r.n_removed
+    for group, joint in zip(r.segmentation, r.joint_availabilities):
+        positions = sorted(p - 100 for p in group)
+        assert 2 <= len(group) <= 4
+        assert len(group) > 2 or not notwo[positions].any()
+        np.testing.assert_array_equal(joint, availabilities[positions].all(axis=0))
+        cost[joint.sum()] += 1
+    np.testing.assert_array_equal(cost, r.cost)
+    np.testing.assert_array_equal(stats.best, r.cost)
+    serial, _ = pair_up_sharded(
+        sn, idx, notwo, availabilities, rng=np.random.default_rng(1), shard_size=20
+    )
+    assert serial.segmentation == r.segmentation
+
+
+def test_get_strategy():
+    rng = np.random.default_rng(0)
+    availabilities = rng.random((12, 5)) < 0.7
+    strategy = get_strategy("sharded", shard_size=100, strategy="annealing")
+    sn = solve_numeric(ProblemStatement(12, 0))
+    r, _ = strategy.run(sn, np.arange(12), availabilities=availabilities, rng=rng)
+    assert set.union(*r.segmentation) | r.removed == set(range(12))
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from meetupmatcher.config import Config
+from meetupmatcher.data import People
+from meetupmatcher.matcher import PairUpResult
+from meetupmatcher.templating import RENDER_BATCH_SIZE, EmailGenerator
+
+
+def _people(tmp_path, n: int) -> People:
+    path = tmp_path / "config.yaml"
+    path.write_text("availabilities:\n  columns:\n    - Lunch\n")
+    return People(
+        pd.DataFrame(
+            {
+                "name": [f"Person {i}" for i in range(n)],
+                "email": [f"p{i}@example.com" for i in range(n)],
+                "slack": ["" if i % 2 else f"@p{i}" for i in range(n)],
+                "message": ["Hi!" if i % 5 == 0 else "" for i in range(n)],
+                "Lunch": ["Mon, Tue"] * n,
+            }
+        ),
+        config=Config(path),
+    )
+
+
+@pytest.fixture()
+def people(tmp_path) -> People:
+    return _people(tmp_path, 3 * RENDER_BATCH_SIZE)
+
+
+def _result(people: People) -> PairUpResult:
+    ids = people.ids.tolist()
+    groups = [set(ids[i : i + 3]) for i in range(0, len(ids) - 1, 3)]
+    return PairUpResult(
+        groups,
+        {ids[-1]},
+        cost=np.zeros(3, dtype=int),
+        joint_availabilities=np.full((len(groups), 2), True),
+    )
+
+
+def test_generate_emails(people, tmp_path):
+    result = _result(people)
+    generator = EmailGenerator(bytecode_cache=tmp_path / "bytecode")
+    emails = list(generator.generate_emails(people, result))
+    assert len(emails) == len(result.segmentation) + 1
+    assert emails[0].to == [people.store.column("email")[-1]]
+    assert emails[1].to == ["p0@example.com", "p1@example.com", "p2@example.com"]
+    assert emails[1].content.startswith("Dear Person 0, Person 1, Person 2,")
+    assert "* Person 0 (email: p0@example.com, slack: @p0)" in emails[1].content
+    assert "Message added by Person 0: Hi!" in emails[1].content
+    assert "* Lunch Mon\n* Lunch Tue" in emails[1].content
+    assert any((tmp_path / "bytecode").iterdir())
+    for executor in ["thread", "process"]:
+        assert (
+            list(
+                generator.generate_emails(people, result, workers=2, executor=executor)
+            )
+            == emails
+        )
+
+
+def test_generate_emails_streams(tmp_path):
+    people = _people(tmp_path, 30 * RENDER_BATCH_SIZE)
+    result = _result(people)
+    generator = EmailGenerator()
+    n_rendered = 0
+    render = generator._render
+
+    def counting_render(job):
+        nonlocal n_rendered
+        n_rendered += 1
+        return render(job)
+
+    generator._render = counting_render  # type: ignore[method-assign]
+    emails = generator.generate_emails(people, result, workers=2, executor="thread")
+    next(emails)
+    assert n_rendered <= 2 * 2 * RENDER_BATCH_SIZE
+    assert len(list(emails)) == len(result.segmentation)
+    assert n_rendered == len(result.segmentation) + 1
+
+
+def test_dataframe_style_template(people, tmp_path):
+    (tmp_path / "removed.txt.jinja").write_text("Sorry, {{ name }}")
+    (tmp_path / "matched.txt.jinja").write_text(
+        "{% for _, p in people.iterrows() %}{{ p['name'] }};{{ p.email }} {% endfor %}"
+    )
+    result = _result(people)
+    emails = list(EmailGenerator(tmp_path).generate_emails(people, result))
+    assert emails[1].content == (
+        "Person 0;p0@example.com Person 1;p1@example.com Person 2;p2@example.com "
+    )